@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+try:
+    import argparse
+    from glob import glob, has_magic
+    import logging
+    from logging import StreamHandler
+    import os
+    import sys
+    from timeit import default_timer as timer
+
+    from deployment.batch import Batch
+    from deployment.exceptions import MessageException
+    from deployment.loader import add_arguments, load_config, unlock_password
+    from deployment.logs import TargetFormatter, close_file_log
+
+    if __name__ == '__main__':
+        logger = logging.getLogger()
+        logger.setLevel(logging.DEBUG)
+
+        formatter = TargetFormatter("%(asctime)s - %(levelname)s - %(message)s")
+
+        console = StreamHandler()
+        console.setLevel(logging.DEBUG)
+        console.setFormatter(formatter)
+        logger.addHandler(console)
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("configs", nargs="+", help="configuration paths or globs (e.g. 'sites/*/.ftp-*.json')")
+        parser.add_argument("-j", "--jobs", help="projects deployed at once", default=4, type=int)
+        add_arguments(parser)
+        args = parser.parse_args()
+
+        batch = None
+        try:
+            paths = []
+            for pattern in args.configs:
+                matches = sorted(glob(pattern, recursive=True)) if has_magic(pattern) else [pattern]
+                if len(matches) == 0:
+                    logging.warning("No configuration matches %s" % pattern)
+                for path in matches:
+                    if path not in paths:
+                        paths.append(path)
+
+            if len(paths) == 0:
+                raise MessageException("No configuration to deploy")
+
+            start_time = timer()
+
+            # passwords are asked one after another before any project starts
+            batch = Batch(args.jobs, args.connections, args.bandwidth)
+            for path in paths:
+                config = None
+                try:
+                    logging.info("Using configuration %s" % path)
+                    config = load_config(path, args, formatter)
+                    unlock_password(config, args)
+                    batch.add(path, config)
+                except MessageException as e:
+                    logging.error("Project %s skipped, reason: %s" % (path, str(e)))
+                    batch.add(path, error=str(e))
+                    if config is not None:
+                        close_file_log(config)
+
+            if not batch.run(args.skip, args.purge_partial, args.purge_only, args.purge_skip, args.force,
+                             args.dry_run):
+                raise MessageException("%s of %s projects failed" % (batch.failures(), len(paths)))
+
+            elapsed = round((timer() - start_time) * 1000) / 1000
+            logging.info("Elapsed %s seconds" % elapsed)
+
+            sys.exit(0)
+
+        except MessageException as e:
+            logging.error(str(e))
+            sys.exit(1)
+        except SystemExit as e:
+            if e.code != 0:
+                logging.critical("Terminated with code %s" % e.code)
+        except KeyboardInterrupt:
+            for project in batch.projects if batch is not None else []:
+                deployment = project["deployment"]
+                if deployment is not None and os.path.exists(deployment.index.file_path):
+                    deployment.index.close()
+                    os.remove(deployment.index.file_path)
+            logging.critical("Terminated by user")
+            sys.exit(1)
+        except:
+            logging.exception(sys.exc_info()[0])
+            sys.exit(1)
+
+except (KeyboardInterrupt, SystemExit):
+    exit(1)
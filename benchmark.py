@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+from getpass import getpass
+import logging
+from logging import StreamHandler
+import os
+from queue import Queue
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+from threading import Thread
+import time
+from timeit import default_timer as timer
+
+from deployment import encryption
+from deployment.config import Config
+from deployment.deployment import Deployment
+from deployment.exceptions import MessageException
+from deployment.ftp import Ftp
+from deployment.removal import RemovalPlan
+from deployment.statistics import format_size
+from deployment.worker import Worker
+
+REMOTE_NAME = "/.ftp-deploy-benchmark"
+
+
+def legacy_upload(ftp, local, remote, callback):
+    ftp.connect()
+    with open(local, "rb") as file:
+        ftp.ftp.storbinary("STOR " + remote, file, 8192, lambda block: callback(len(block)))
+
+
+def optimized_upload(ftp, local, remote, callback):
+    ftp.upload_file(local, remote, callback, False)
+
+
+def run(config, local, size, count, mode, secure):
+    config = copy.copy(config)
+    config.secure = secure
+    upload = legacy_upload if mode == "legacy" else optimized_upload
+    remote = config.remote + REMOTE_NAME
+
+    progress = {"calls": 0}
+
+    def callback(length):
+        progress["calls"] += 1
+
+    ftp = Ftp(config)
+    try:
+        ftp.connect()
+        start = timer()
+        for number in range(count):
+            upload(ftp, local, remote, callback)
+        elapsed = timer() - start
+        ftp.delete_file(remote)
+    finally:
+        ftp.close()
+
+    throughput = (size * count) / elapsed
+    logging.info("%-9s %-5s %8.3f s %12s/s %8s progress calls" % (
+        mode, "tls" if secure else "plain", elapsed, format_size(throughput), progress["calls"]
+    ))
+
+
+class LatencyProxy(socketserver.ThreadingTCPServer):
+    # delays control connection in both directions, data connections go directly to server
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, target, latency):
+        self.target = target
+        self.latency = latency
+        super(LatencyProxy, self).__init__(("127.0.0.1", 0), LatencyProxyHandler)
+
+
+class LatencyProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        upstream = socket.create_connection(self.server.target)
+        thread = Thread(target=self.pump, args=(upstream, self.request), daemon=True)
+        thread.start()
+        self.pump(self.request, upstream)
+        thread.join()
+
+    def pump(self, source, destination):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.server.latency / 2)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for connection in (source, destination):
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def run_engine(config, directory, paths, directories, engine):
+    config = copy.copy(config)
+    config.engine = engine
+    config.local = directory
+    config.remote = config.remote + REMOTE_NAME + "-" + engine
+    config.staged = False
+    config.adaptive = False
+
+    # removal goes like in deploy, files first and then directories, so both engines remove the same objects
+    contents = dict((path, None if path in directories else "") for path in paths)
+    passes = [(Worker.MODE_UPLOAD, paths)]
+    for directory_level, level in RemovalPlan(paths, contents).levels():
+        passes.append((Worker.MODE_REMOVE_DIRECTORY if directory_level else Worker.MODE_REMOVE, level))
+
+    deployment = Deployment(config)
+    try:
+        timings = [0, 0]
+        for mode, ordered in passes:
+            item_queue = Queue()
+            for path in ordered:
+                item_queue.put(path)
+
+            deployment.counter.reset()
+            deployment.counter.total = item_queue.qsize()
+
+            start = timer()
+            deployment.process_queue(item_queue, mode)
+            timings[0 if mode == Worker.MODE_UPLOAD else 1] += timer() - start
+    finally:
+        deployment.index.remove()
+        deployment.close()
+
+    return timings, deployment.failed.qsize()
+
+
+def benchmark_engines(config, engines, files, latency):
+    proxy = None
+    if latency > 0:
+        proxy = LatencyProxy((config.host, config.port), latency / 1000.0)
+        Thread(target=proxy.serve_forever, daemon=True).start()
+        config = copy.copy(config)
+        config.host, config.port = proxy.server_address
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        directories = set()
+        for number in range(files):
+            if number % 100 == 0:
+                parent = "/%s" % (number // 100)
+                os.mkdir(directory + parent)
+                paths.append(parent)
+                directories.add(parent)
+
+            path = "%s/%s.txt" % (parent, number)
+            with open(directory + path, "wb") as file:
+                file.write(os.urandom(1024))
+            paths.append(path)
+
+        logging.info("Uploading and removing %s files with %s connections and %s ms latency" % (
+            files, config.threads, latency
+        ))
+        logger = logging.getLogger()
+        level = logger.level
+        for engine in engines:
+            logger.setLevel(logging.WARNING)
+            try:
+                timings, failed = run_engine(config, directory, paths, directories, engine)
+            finally:
+                logger.setLevel(level)
+
+            logging.info("%-8s upload %8.3f s (%6.1f objects/s), remove %8.3f s (%6.1f objects/s), %s failed" % (
+                engine, timings[0], len(paths) / timings[0], timings[1], len(paths) / timings[1], failed
+            ))
+    finally:
+        shutil.rmtree(directory)
+        if proxy:
+            proxy.shutdown()
+
+
+if __name__ == "__main__":
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    console = StreamHandler()
+    console.setLevel(logging.INFO)
+    console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(console)
+
+    try:
+        parser = argparse.ArgumentParser()
+        parser.add_argument("name", help="configuration path or alias, should point to local FTP server")
+        parser.add_argument("--size", help="test file size in MiB", type=int, default=256)
+        parser.add_argument("--count", help="how many times to upload test file", type=int, default=3)
+        parser.add_argument("--modes", help="comma separated transfer modes (legacy, optimized)",
+                            default="legacy,optimized")
+        parser.add_argument("--protocols", help="comma separated protocols (plain, tls)", default="plain,tls")
+        parser.add_argument("--engines", help="compare comma separated engines (threads, asyncio) instead of "
+                                              "transfer modes", default=None)
+        parser.add_argument("--files", help="file count for engine comparison", type=int, default=1000)
+        parser.add_argument("--latency", help="latency in ms injected into control connection for engine comparison",
+                            type=int, default=50)
+        parser.add_argument("-t", "--threads", help="override config threads", default=None, type=int)
+        args = parser.parse_args()
+
+        fileName = args.name
+        if not os.path.isfile(fileName):
+            fileName = ".ftp-%s.json" % fileName
+
+        if not os.path.isfile(fileName):
+            raise MessageException("Configuration file %s doesn't exist" % fileName)
+
+        config = Config()
+        config.parse(fileName)
+
+        if config.password_encrypted:
+            encryption.decrypt_config_password(config)
+        elif config.password is None:
+            config.password = getpass("Password: ")
+
+        if args.threads is not None:
+            config.threads = args.threads
+
+        if args.engines:
+            benchmark_engines(config, args.engines.split(","), args.files, args.latency)
+            exit(0)
+
+        size = args.size * 1024 * 1024
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            local = file.name
+            block = os.urandom(1024 * 1024)
+            for number in range(args.size):
+                file.write(block)
+
+        try:
+            logging.info("Uploading %s %s times to %s%s" % (format_size(size), args.count, config.host, REMOTE_NAME))
+            for protocol in args.protocols.split(","):
+                for mode in args.modes.split(","):
+                    run(config, local, size, args.count, mode, protocol == "tls")
+        finally:
+            os.remove(local)
+
+        exit(0)
+
+    except MessageException as e:
+        logging.error(str(e))
+        exit(1)
+    except SystemExit as e:
+        if e.code != 0:
+            logging.critical("Terminated with code %s" % e.code)
+            exit(e.code)
+    except KeyboardInterrupt:
+        logging.critical("Terminated by user")
+        exit(1)
+    except:
+        logging.exception(sys.exc_info()[0])
+        exit(1)
@@ -0,0 +1,474 @@
+import asyncio
+import ftplib
+import logging
+import os
+import queue
+import socket
+import ssl
+from threading import Thread
+
+from deployment.config import ConfigException
+from deployment.exceptions import MessageException
+from deployment.ftp import Ftp, InvalidStateException
+from deployment.logs import current_target
+from deployment.retry import RetryPolicy
+
+
+class SessionContext(ssl.SSLContext):
+    # asyncio doesn't allow to pass TLS session, context injects session of control connection into data connections
+    session = None
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None:
+            session = self.session
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+class AsyncFtp:
+    reader = None
+    writer = None
+    context = None
+
+    def __init__(self, config):
+        self.config = config
+        self.address = None
+        if self.config.bind:
+            self.address = Ftp(self.config).translate_interface_to_address(self.config.bind)
+
+    async def connect(self):
+        if self.writer:
+            return
+
+        if not self.config.host:
+            raise ConfigException("host is missing")
+
+        self.reader, self.writer = await self.open(self.config.host, self.config.port)
+        await self.response()
+
+        if self.config.nodelay:
+            self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self.config.secure:
+            if not hasattr(self.writer, "start_tls"):
+                raise MessageException("asyncio engine with TLS requires Python 3.11 or newer")
+
+            self.context = SessionContext(ssl.PROTOCOL_TLS_CLIENT)
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+
+            await self.command("AUTH TLS")
+            await self.start_tls(self.writer)
+
+        await self.command("USER " + self.config.user)
+        await self.command("PASS " + self.config.password)
+
+        if self.config.secure:
+            await self.command("PBSZ 0")
+            await self.command("PROT P")
+
+        await self.command("TYPE I")
+
+    async def open(self, host, port):
+        parameters = {}
+        if self.address:
+            parameters["local_addr"] = (self.address, 0)
+        return await asyncio.wait_for(asyncio.open_connection(host, port, **parameters), self.config.timeout)
+
+    async def start_tls(self, writer):
+        await asyncio.wait_for(writer.start_tls(self.context, server_hostname=self.config.host), self.config.timeout)
+
+    async def response(self):
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.config.timeout)
+            if not line:
+                raise EOFError
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            lines.append(line)
+            if len(lines[0]) > 3 and lines[0][3] == "-":
+                if line[:3] == lines[0][:3] and line[3:4] == " ":
+                    break
+            else:
+                break
+
+        response = "\n".join(lines)
+        code = response[:1]
+        if code in ("1", "2", "3"):
+            return response
+        if code == "4":
+            raise ftplib.error_temp(response)
+        if code == "5":
+            raise ftplib.error_perm(response)
+        raise ftplib.error_proto(response)
+
+    async def command(self, line):
+        self.writer.write((line + "\r\n").encode("utf-8"))
+        await self.writer.drain()
+        return await self.response()
+
+    async def passive(self):
+        if self.writer.get_extra_info("socket").family == socket.AF_INET:
+            host, port = ftplib.parse227(await self.command("PASV"))
+        else:
+            peer = self.writer.get_extra_info("peername")
+            host, port = ftplib.parse229(await self.command("EPSV"), peer)
+
+        if self.config.passive_workaround:
+            host = self.config.host
+
+        return host, port
+
+    async def upload_file(self, local, remote, ensure_directory=True):
+        await self.connect()
+
+        try:
+            await self.store("STOR " + remote, local)
+        except ftplib.all_errors as e:
+            message = str(e).lower()
+            if ensure_directory:
+                for error in Ftp.error_file_failed_no_directory:
+                    if error in message:
+                        await self.ensure_directory_exists(os.path.dirname(remote))
+                        await self.upload_file(local, remote, False)
+                        return
+            raise e
+
+    async def store(self, command, local):
+        host, port = await self.passive()
+        reader, writer = await self.open(host, port)
+        try:
+            response = await self.command(command)
+            if not response.startswith("1"):
+                raise ftplib.error_reply(response)
+
+            if self.config.secure:
+                if self.context.session is None:
+                    self.context.session = self.writer.get_extra_info("ssl_object").session
+                await self.start_tls(writer)
+
+            # disk is read in executor, slow disk would otherwise stall transfers of all connections
+            loop = asyncio.get_running_loop()
+            file = await loop.run_in_executor(None, open, local, "rb")
+            try:
+                while True:
+                    data = await loop.run_in_executor(None, file.read, self.config.buffer_size)
+                    if not data:
+                        break
+                    writer.write(data)
+                    await writer.drain()
+            finally:
+                file.close()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ssl.SSLError, OSError):
+                pass
+
+        return await self.response()
+
+    async def create_directory(self, directory):
+        await self.connect()
+
+        try:
+            await self.command("MKD " + directory)
+        except ftplib.error_perm as e:
+            if str(e).startswith("550"):
+                return  # already exists - ignore
+            raise e
+
+    async def ensure_directory_exists(self, path):
+        previous = []
+        for directory in path.split("/"):
+            if directory == "":
+                continue
+
+            previous.append(directory)
+            await self.create_directory("/".join(previous))
+
+    async def replace(self, current, new):
+        await self.connect()
+
+        try:
+            await self.rename(current, new)
+        except ftplib.error_perm:
+            await self.ensure_directory_exists(os.path.dirname(new))
+            try:
+                await self.command("DELE " + new)
+            except ftplib.error_perm:
+                pass
+            await self.rename(current, new)
+
+    async def rename(self, current, new):
+        response = await self.command("RNFR " + current)
+        if not response.startswith("3"):
+            raise ftplib.error_reply(response)
+        await self.command("RNTO " + new)
+
+    async def copy_file(self, source, target, ensure_directory=True):
+        await self.connect()
+
+        response = await self.command("SITE CPFR " + source)
+        if not response.startswith("3"):
+            raise ftplib.error_reply(response)
+
+        try:
+            await self.command("SITE CPTO " + target)
+        except ftplib.error_perm as e:
+            if not ensure_directory:
+                raise e
+            await self.ensure_directory_exists(os.path.dirname(target))
+            await self.copy_file(source, target, False)
+
+    async def delete(self, target, directory=False):
+        await self.connect()
+
+        if ".." in target:
+            raise InvalidStateException("dot directory detected")
+
+        try:
+            await self.command(("RMD " if directory else "DELE ") + target)
+        except ftplib.error_perm as e:
+            if str(e).startswith("550") and "not empty" not in str(e).lower():
+                return  # already removed
+            raise e
+
+    async def close(self):
+        if self.writer:
+            writer = self.writer
+            self.reader = None
+            self.writer = None
+            self.context = None
+            try:
+                writer.write(b"QUIT\r\n")
+                writer.close()
+                await asyncio.wait_for(writer.wait_closed(), 1)
+            except (asyncio.TimeoutError, ssl.SSLError, OSError):
+                pass
+
+
+class AsyncEngine:
+    MODE_UPLOAD = "upload"
+    MODE_REMOVE = "remove"
+    MODE_REMOVE_DIRECTORY = "remove directory"
+    MODE_COMMIT = "commit"
+    MODE_MOVE = "move"
+    MODE_COPY = "copy"
+
+    def __init__(self, config, counter, index, failed, mapping, statistics=None, staging=None, moves=None,
+                 copies=None):
+        self.config = config
+        self.counter = counter
+        self.index = index
+        self.failed = failed
+        self.mapping = mapping
+        self.statistics = statistics
+        self.staging = staging
+        self.moves = moves if moves is not None else {}
+        self.copies = copies if copies is not None else {}
+        self.loop = None
+
+    def process_queue(self, item_queue, mode):
+        items = []
+        while True:
+            try:
+                items.append(item_queue.get_nowait())
+                item_queue.task_done()
+            except queue.Empty:
+                break
+
+        if self.loop:
+            self.loop.run(self.execute(items, mode))
+        else:
+            asyncio.run(self.execute(items, mode))
+
+    async def execute(self, items, mode):
+        current_target.set(self.config.target)
+        pending = asyncio.Queue()
+        for path in items:
+            pending.put_nowait((path, 0))
+
+        connections = min(self.config.threads, max(1, len(items)))
+        logging.info("Using asyncio engine with %s connections" % connections)
+        workers = [asyncio.ensure_future(self.worker(pending, mode)) for number in range(connections)]
+
+        # queue is empty also while failed item waits to be retried, workers end once every item is done
+        done = asyncio.ensure_future(pending.join())
+        await asyncio.wait(workers + [done], return_when=asyncio.FIRST_COMPLETED)
+        for number in range(connections):
+            pending.put_nowait(None)
+        await asyncio.gather(*workers)
+        done.cancel()
+
+    async def worker(self, pending, mode):
+        # each connection reports outcomes with generation of circuit breaker it was let through in
+        retry_policy = RetryPolicy(self.config)
+        ftp = AsyncFtp(self.config)
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+
+                path, retry = item
+                while not retry_policy.allowed():
+                    await asyncio.sleep(0.1)
+
+                try:
+                    await self.process(ftp, path, retry, mode)
+                    retry_policy.success()
+                except ftplib.all_errors + (asyncio.TimeoutError,) as e:
+                    message = str(e) or type(e).__name__
+                    retry_policy.failure(e)
+                    await ftp.close()
+
+                    if retry_policy.retryable(e, retry):
+                        logging.warning("Upload of " + path + " failed, will retry later, reason: " + message)
+                        await asyncio.sleep(retry_policy.delay(e, retry))
+                        pending.put_nowait((path, retry + 1))
+                    else:
+                        logging.error("Upload of " + path + " failed (" + retry_policy.classify(e) +
+                                      " error), reason: " + message)
+                        self.failed.put(mode + " " + path + " (" + message + ")")
+                finally:
+                    pending.task_done()
+        finally:
+            await ftp.close()
+
+    async def process(self, ftp, path, retry, mode):
+        if retry > 0:
+            counter = str(retry) + " of " + str(self.config.retry_count)
+            prefix = {
+                "upload": "Retrying to upload", "remove": "Retrying to remove",
+                "remove directory": "Retrying to remove", "commit": "Retrying to commit", "move": "Retrying to move",
+                "copy": "Retrying to copy",
+            }
+            logging.info(prefix[mode] + " (" + counter + ") " + path)
+        else:
+            prefix = {
+                "upload": "Uploading", "remove": "Removing", "remove directory": "Removing",
+                "commit": "Committing", "move": "Moving", "copy": "Copying",
+            }
+            logging.info(prefix[mode] + " (" + self.counter.counter() + ") " + path)
+
+        if mode == self.MODE_UPLOAD:
+            local = self.local_path(path)
+            remote = self.config.remote + path
+
+            if os.path.isdir(local):
+                await ftp.create_directory(remote)
+            elif os.path.isfile(local):
+                size = os.path.getsize(local)
+                if self.staging:
+                    await ftp.upload_file(local, self.staging.staged_path(path))
+                    self.staging.add(path)
+                    self.record_transfer(size)
+                    return
+
+                await ftp.upload_file(local, remote)
+                self.record_transfer(size)
+            else:
+                raise Exception(local + " doesn't exist!")
+
+            await self.write_index(path)
+
+        elif mode in (self.MODE_REMOVE, self.MODE_REMOVE_DIRECTORY):
+            await ftp.delete(self.config.remote + path, mode == self.MODE_REMOVE_DIRECTORY)
+            if self.statistics:
+                self.statistics.add("removal_requests")
+                self.statistics.add("removed_objects")
+
+        elif mode == self.MODE_COMMIT:
+            if path in self.moves:
+                await self.move(ftp, path)
+            else:
+                await ftp.replace(self.staging.staged_path(path), self.config.remote + path)
+            await self.write_index(path)
+
+        elif mode == self.MODE_MOVE:
+            await self.move(ftp, path)
+            await self.write_index(path)
+
+        elif mode == self.MODE_COPY:
+            await self.copy(ftp, path)
+
+    async def move(self, ftp, path):
+        local = self.local_path(path)
+        remote = self.config.remote + path
+        try:
+            await ftp.replace(self.config.remote + self.moves[path], remote)
+        except ftplib.error_perm as e:
+            logging.warning("Moving " + self.moves[path] + " failed, uploading " + path + " instead, reason: " + str(e))
+            await ftp.upload_file(local, remote)
+            self.record_transfer(os.path.getsize(local))
+            return
+
+        if self.statistics:
+            self.statistics.add("moved_files")
+            self.statistics.add("moved_bytes", os.path.getsize(local))
+
+    async def copy(self, ftp, path):
+        local = self.local_path(path)
+        source = self.copies[path]
+        if self.staging:
+            target = self.staging.staged_path(path)
+        else:
+            target = self.config.remote + path
+
+        try:
+            if self.index.is_written(source):
+                await ftp.copy_file(self.config.remote + source, target)
+            elif self.staging:
+                await ftp.copy_file(self.staging.staged_path(source), target)
+            else:
+                raise ftplib.error_perm("550 Source " + source + " wasn't uploaded")
+        except ftplib.error_perm as e:
+            logging.warning("Copying " + source + " failed, uploading " + path + " instead, reason: " + str(e))
+            await ftp.upload_file(local, target)
+            self.record_transfer(os.path.getsize(local))
+        else:
+            if self.statistics:
+                self.statistics.add("copied_files")
+                self.statistics.add("copied_bytes", os.path.getsize(local))
+
+        if self.staging:
+            self.staging.add(path)
+        else:
+            await self.write_index(path)
+
+    async def write_index(self, path):
+        # index is file on disk, writing it mustn't block event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.index.write, path)
+
+    def record_transfer(self, size):
+        if self.statistics:
+            self.statistics.add("content_bytes", size)
+            self.statistics.add("wire_bytes", size)
+
+    def local_path(self, path):
+        local = self.apply_mapping(path)
+        if local == path:
+            local = self.config.local + local
+        return local
+
+    def apply_mapping(self, path):
+        for remote, local in self.mapping.items():
+            if path.startswith(remote):
+                return path.replace(remote, local)
+        return path
+
+
+class SharedLoop:
+    def __init__(self):
+        # several targets are driven by single event loop, their threads only wait for results
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
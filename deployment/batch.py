@@ -0,0 +1,145 @@
+import logging
+import os
+from queue import Queue, Empty
+import sys
+from threading import Thread, current_thread
+from timeit import default_timer as timer
+
+from deployment.deployment import Deployment
+from deployment.exceptions import MessageException
+from deployment.fanout import share_connections
+from deployment.logs import bind_file_log, close_file_log, thread_name
+from deployment.pool import close_parked
+from deployment.scanner import ScannerPool
+from deployment.throttle import Throttle
+
+
+class Batch:
+    def __init__(self, jobs, connections=None, bandwidth=None):
+        # independent projects deployed in one process, several at once, they share scanning processes,
+        # idle connections to the same server and bandwidth, failure of one project doesn't stop the others
+        self.jobs = max(1, jobs)
+        self.connections = connections
+        self.throttle = Throttle(bandwidth * 1024 * 1024) if bandwidth else None
+        self.projects = []
+
+    def add(self, path, config=None, error=None):
+        # connection budget is split evenly between projects running at once
+        if config is not None and self.connections is not None:
+            share_connections([config], max(1, self.connections // self.jobs))
+        if config is not None:
+            bind_file_log(config, path)
+
+        self.projects.append({
+            "path": path,
+            "config": config,
+            "deployment": None,
+            "error": error,
+            "elapsed": 0,
+        })
+
+    def run(self, skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force,
+            dry_run):
+        start = timer()
+        pending = Queue()
+        for project in self.projects:
+            if project["error"] is None:
+                pending.put(project)
+
+        logging.info("Deploying %s projects, %s at once" % (pending.qsize(), self.jobs))
+
+        scanner_pool = ScannerPool()
+        try:
+            threads = []
+            for number in range(min(self.jobs, pending.qsize())):
+                thread = Thread(target=self.work, args=(pending, scanner_pool, (
+                    skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force
+                ), dry_run), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            for thread in threads:
+                thread.join()
+        finally:
+            scanner_pool.close()
+            close_parked()
+
+        return self.summarize(timer() - start)
+
+    def work(self, pending, scanner_pool, options, dry_run):
+        while True:
+            try:
+                project = pending.get_nowait()
+            except Empty:
+                return
+            self.deploy(project, scanner_pool, options, dry_run)
+
+    def deploy(self, project, scanner_pool, options, dry_run):
+        config = project["config"]
+        start = timer()
+        deployment = None
+        # thread takes projects one after another, it's named after the current one
+        thread = current_thread()
+        name = thread.name
+        thread.name = thread_name(config, "deploy")
+        try:
+            logging.info("Deploying %s" % project["path"])
+            # projects deployed from the same local root keep their own local copy of index like targets
+            shared_local = len([other for other in self.projects if other["config"] is not None and
+                                other["config"].local == config.local]) > 1
+            deployment = Deployment(config, config.name if shared_local else None)
+            deployment.dry_run = dry_run
+            deployment.shared_connections = True
+            deployment.scanner_pool = scanner_pool
+            deployment.directory = os.path.dirname(os.path.realpath(config.file_path))
+            deployment.throttle = self.throttle
+            project["deployment"] = deployment
+
+            deployment.synchronize(*options)
+        except MessageException as e:
+            project["error"] = str(e)
+            logging.error("Project %s failed, reason: %s" % (project["path"], str(e)))
+        except SystemExit as e:
+            project["error"] = "terminated with code %s" % e.code
+            logging.error("Project %s terminated with code %s" % (project["path"], e.code))
+        except:
+            project["error"] = str(sys.exc_info()[1]) or sys.exc_info()[0].__name__
+            logging.exception("Project %s failed" % project["path"])
+        finally:
+            # idle connections are left to next project deployed to the same server
+            if deployment is not None:
+                deployment.close()
+            project["elapsed"] = timer() - start
+            logging.info("Finished %s in %.3f seconds" % (project["path"], project["elapsed"]))
+            close_file_log(config)
+            thread.name = name
+
+    def failures(self):
+        return len([project for project in self.projects if project["error"] is not None])
+
+    def summarize(self, elapsed):
+        # reports are printed one after another so lines of different projects aren't mixed
+        for project in self.projects:
+            path = project["path"]
+            deployment = project["deployment"]
+
+            failed = 0
+            if deployment is not None:
+                logging.info("Project %s:" % path)
+                deployment.report()
+                failed = deployment.report_failed()
+
+            if project["error"] is not None:
+                logging.error("Project %s failed after %.3f seconds, reason: %s" % (
+                    path, project["elapsed"], project["error"]
+                ))
+            else:
+                logging.info("Project %s done in %.3f seconds, %s changed, %s removed, %s failed" % (
+                    path, project["elapsed"], deployment.changes["upload"], deployment.changes["remove"], failed
+                ))
+
+        logging.info("Deployed %s of %s projects in %.3f seconds" % (
+            len(self.projects) - self.failures(), len(self.projects), elapsed
+        ))
+
+        return self.failures() == 0
@@ -0,0 +1,173 @@
+import ftplib
+import logging
+import os
+from queue import Empty
+from queue import Queue
+import sys
+from threading import Lock, Thread
+
+from deployment.logs import thread_name
+from deployment.retry import RetryPolicy
+from deployment.transport import create_transport
+from deployment.worker import WorkersState
+
+
+class Bootstrap:
+    TRUST_HASH = "hash"
+    TRUST_MTIME = "mtime"
+    TRUST_SIZE = "size"
+
+    def __init__(self, config, mapping, pool=None):
+        self.config = config
+        self.mapping = mapping
+        self.pool = pool
+        self.shared_state = WorkersState()
+        self.queue = Queue()
+        self.lock = Lock()
+        self.contents = {}
+        self.workers = []
+
+    def build(self, objects):
+        # only directories existing locally are walked, remote-only trees (uploads, caches, staging) are skipped
+        # and index contains only objects which exist on both sides so nothing is removed because of it
+        self.queue.put("")
+
+        self.workers = []
+        for number in range(self.config.threads):
+            worker = Worker(self, objects)
+            worker.start()
+            self.workers.append(worker)
+
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self.shared_state.running:
+                try:
+                    self.queue.all_tasks_done.wait(0.1)
+                except TimeoutError:
+                    pass
+
+        if self.queue.unfinished_tasks:
+            logging.error("Worker queue failed to process")
+
+        self.shared_state.stop()
+        for worker in self.workers:
+            worker.join()
+
+        files = len([path for path in objects if objects[path] is not None])
+        found = len([path for path in self.contents if self.contents[path] is not None])
+        hashed = sum(worker.hashed for worker in self.workers)
+        logging.info("Found %s of %s files already on server (%s compared by checksum)" % (found, files, hashed))
+
+        return self.contents
+
+    def add(self, path, checksum):
+        with self.lock:
+            self.contents[path] = checksum
+
+    def local_path(self, path):
+        for remote, local in self.mapping.items():
+            if path.startswith(remote):
+                return path.replace(remote, local)
+        return self.config.local + path
+
+
+class Worker(Thread):
+    running = True
+    hashed = 0
+
+    def __init__(self, bootstrap, objects):
+        super(Worker, self).__init__(name=thread_name(bootstrap.config, "bootstrap"), daemon=True)
+        self.bootstrap = bootstrap
+        self.objects = objects
+        self.config = bootstrap.config
+        self.queue = bootstrap.queue
+        self.shared_state = bootstrap.shared_state
+        self.pool = bootstrap.pool
+        self.ftp = self.pool.acquire() if self.pool else create_transport(self.config)
+        self.retry_policy = RetryPolicy(self.config)
+
+    def run(self):
+        try:
+            while self.shared_state.running:
+                try:
+                    directory = self.queue.get(timeout=0.1)
+                except Empty:
+                    continue
+
+                retry = 0
+                while True:
+                    self.retry_policy.wait_allowed()
+                    try:
+                        self.process(directory)
+                        self.retry_policy.success()
+                        break
+                    except ftplib.all_errors as e:
+                        self.ftp.close()
+                        self.retry_policy.failure(e)
+                        if not self.retry_policy.retryable(e, retry):
+                            # objects in this directory are uploaded as usual
+                            logging.warning("Listing of " + (directory or "/") + " failed, reason: " + str(e))
+                            break
+                        self.retry_policy.wait(e, retry)
+                        retry += 1
+
+                self.queue.task_done()
+
+        except (KeyboardInterrupt, SystemExit):
+            self.shared_state.stop()
+            self.ftp.close()
+            raise
+        except:
+            self.shared_state.stop()
+            self.ftp.close()
+            logging.exception(sys.exc_info()[0])
+        finally:
+            if self.pool:
+                self.pool.release(self.ftp)
+            else:
+                self.ftp.close()
+            self.running = False
+
+    def process(self, directory):
+        logging.info("Listing " + (directory or "/"))
+
+        candidates = []
+        for name, type, size, modified in self.ftp.list_directory_details(self.config.remote + directory):
+            path = directory + "/" + name
+            if path not in self.objects:
+                continue
+
+            if type == "dir" and self.objects[path] is None:
+                self.bootstrap.add(path, None)
+                self.queue.put(path)
+            elif type == "file" and self.objects[path] is not None:
+                if size is not None and size == os.path.getsize(self.bootstrap.local_path(path)):
+                    candidates.append((path, modified))
+
+        method = self.ftp.verification_method()
+        if method in ("SIZE", "MLST"):
+            for path, modified in candidates:
+                if self.trusted(path, modified):
+                    self.bootstrap.add(path, self.objects[path])
+            return
+
+        size = self.config.pipelining_batch
+        for offset in range(0, len(candidates), size):
+            batch = candidates[offset:offset + size]
+            files = []
+            for path, modified in batch:
+                files.append((self.config.remote + path, self.bootstrap.local_path(path), self.objects[path]))
+
+            results = self.ftp.verify_files(files)
+            for (path, modified), mismatch in zip(batch, results):
+                self.hashed += 1
+                if mismatch is None:
+                    self.bootstrap.add(path, self.objects[path])
+
+    def trusted(self, path, modified):
+        # without checksum file with the same size is trusted only when policy allows it
+        trust = self.config.bootstrap_trust
+        if trust == Bootstrap.TRUST_SIZE:
+            return True
+        if trust == Bootstrap.TRUST_MTIME:
+            return modified is not None and modified >= os.path.getmtime(self.bootstrap.local_path(path))
+        return False
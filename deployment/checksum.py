@@ -7,3 +7,11 @@ def sha256_checksum(file, block_size=10485760):
         for block in iter(lambda: file.read(block_size), b''):
             hash.update(block)
     return hash.hexdigest()
+
+
+def md5_checksum(file, block_size=10485760):
+    hash = hashlib.md5()
+    with open(file, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            hash.update(block)
+    return hash.hexdigest()
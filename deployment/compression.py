@@ -0,0 +1,38 @@
+import os
+import zlib
+
+COMPRESSIBLE = {
+    "php", "phtml", "inc", "latte", "neon", "twig", "tpl", "html", "htm", "xml", "svg", "css", "scss", "less", "js",
+    "mjs", "ts", "map", "json", "yaml", "yml", "ini", "txt", "md", "csv", "sql", "po", "pot", "lock", "ttf", "otf",
+    "eot",
+}
+
+# dotfiles have no extension for splitext, they are matched by name
+COMPRESSIBLE_NAMES = {".htaccess", ".htpasswd", ".user.ini", ".env"}
+
+INCOMPRESSIBLE = {
+    "jpg", "jpeg", "png", "gif", "webp", "avif", "ico", "woff", "woff2", "zip", "gz", "tgz", "bz2", "xz", "7z", "rar",
+    "br", "zst", "mp3", "mp4", "m4a", "ogg", "webm", "avi", "mov", "pdf", "docx", "xlsx", "pptx", "jar", "phar",
+}
+
+SAMPLE_SIZE = 65536
+MINIMAL_SIZE = 512
+MAXIMAL_RATIO = 0.9
+
+
+def is_compressible(path):
+    if os.path.getsize(path) < MINIMAL_SIZE:
+        return False  # not worth it, deflate overhead would make it bigger
+
+    name = os.path.basename(path).lower()
+    extension = os.path.splitext(name)[1][1:]
+    if name in COMPRESSIBLE_NAMES or extension in COMPRESSIBLE:
+        return True
+    if extension in INCOMPRESSIBLE:
+        return False
+
+    # unknown type - compress sample to see if it's worth it
+    with open(path, "rb") as file:
+        sample = file.read(SAMPLE_SIZE)
+
+    return len(zlib.compress(sample, 1)) / len(sample) < MAXIMAL_RATIO
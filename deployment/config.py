@@ -13,6 +13,9 @@ class Config:
     original_data = None
     name = None
     threads = 2
+    protocol = "ftp"
+    adaptive = False
+    adaptive_floor = 2
     local = None
     secure = False
     implicit = False
@@ -27,19 +30,46 @@ class Config:
     password_salt = None
     remote = None
     bind = None
+    buffer_size = 1048576  # 1 MiB
+    send_buffer = None
+    nodelay = True
+    compression = False
+    pipelining = False
+    pipelining_batch = 50
+    server_copy = True
+    server_delete = True
+    sftp_channels = 10
+    sftp_accept_new_host = False
     retry_count = 10
+    retry_delay = 0.5
+    retry_delay_max = 30
+    circuit_breaker_threshold = 5
+    circuit_breaker_pause = 10
     timeout = 10
     ignore = []
     purge = []
     purge_partial = {}
     purge_threads = None
+    purge_mode = "foreground"
+    purge_lock_timeout = 3600
     file_log = False
+    target = None  # name of target deployed together with others
     block_size = 1048576  # 1 MiB
+    resume_threshold = 10485760  # 10 MiB
+    segments = 1
+    segment_threshold = 104857600  # 100 MiB
     composer = None
     password_encryption = False
     shared_passphrase_verify_file = None
     run_before = []
     run_after = []
+    engine = "threads"
+    concurrent_remove = False
+    staged = False
+    staging_directory = None
+    verify = False
+    bootstrap = False
+    bootstrap_trust = "mtime"
 
     def __init__(self):
         pass
@@ -66,11 +96,24 @@ class Config:
         if self.is_defined("connection", data):
             inner = data["connection"]
 
+            if "protocol" in inner:
+                self.protocol = inner["protocol"]
+                if self.protocol not in ["ftp", "sftp", "file"]:
+                    raise ConfigException("connection.protocol needs to be ftp, sftp or file")
+
             if "threads" in inner:
                 self.threads = int(inner["threads"])
                 if self.threads < 1:
                     self.threads = 1
 
+            if "adaptive" in inner:
+                self.adaptive = inner["adaptive"]
+
+            if "adaptive_floor" in inner:
+                self.adaptive_floor = int(inner["adaptive_floor"])
+                if self.adaptive_floor < 1:
+                    self.adaptive_floor = 1
+
             if "secure" in inner:
                 self.secure = inner["secure"]
 
@@ -86,16 +129,18 @@ class Config:
             if "connection_limit_wait" in inner:
                 self.connection_limit_wait = int(inner["connection_limit_wait"])
 
-            if self.is_defined("host", inner, "connection.host"):
+            if self.is_defined("host", inner, "connection.host", self.protocol == "file"):
                 self.host = inner["host"]
 
             if "port" in inner:
                 self.port = inner["port"]
+            elif self.protocol == "sftp":
+                self.port = 22
 
-            if self.is_defined("user", inner, "connection.user"):
+            if self.is_defined("user", inner, "connection.user", self.protocol == "file"):
                 self.user = inner["user"]
 
-            if self.is_defined("password", inner, "connection.password"):
+            if self.is_defined("password", inner, "connection.password", self.protocol == "file"):
                 self.password = inner["password"]
 
             if "password_encrypted" in inner:
@@ -115,9 +160,55 @@ class Config:
             if "bind" in inner:
                 self.bind = inner["bind"]
 
+            if "buffer_size" in inner:
+                self.buffer_size = int(inner["buffer_size"])
+
+            if "send_buffer" in inner:
+                self.send_buffer = inner["send_buffer"]
+
+            if "nodelay" in inner:
+                self.nodelay = inner["nodelay"]
+
+            if "compression" in inner:
+                self.compression = inner["compression"]
+
+            if "pipelining" in inner:
+                self.pipelining = inner["pipelining"]
+
+            if "pipelining_batch" in inner:
+                self.pipelining_batch = int(inner["pipelining_batch"])
+                if self.pipelining_batch < 1:
+                    self.pipelining_batch = 1
+
+            if "server_copy" in inner:
+                self.server_copy = inner["server_copy"]
+
+            if "server_delete" in inner:
+                self.server_delete = inner["server_delete"]
+
+            if "sftp_channels" in inner:
+                self.sftp_channels = int(inner["sftp_channels"])
+                if self.sftp_channels < 1:
+                    self.sftp_channels = 1
+
+            if "sftp_accept_new_host" in inner:
+                self.sftp_accept_new_host = inner["sftp_accept_new_host"]
+
         if "retry_count" in data:
             self.retry_count = data["retry_count"]
 
+        if "retry_delay" in data:
+            self.retry_delay = data["retry_delay"]
+
+        if "retry_delay_max" in data:
+            self.retry_delay_max = data["retry_delay_max"]
+
+        if "circuit_breaker_threshold" in data:
+            self.circuit_breaker_threshold = data["circuit_breaker_threshold"]
+
+        if "circuit_breaker_pause" in data:
+            self.circuit_breaker_pause = data["circuit_breaker_pause"]
+
         if "timeout" in data:
             self.timeout = data["timeout"]
 
@@ -129,27 +220,76 @@ class Config:
 
         if "purge_partial" in data:
             self.purge_partial = data["purge_partial"]
+            if not isinstance(self.purge_partial, dict):
+                raise ConfigException("purge_partial needs to be object of extensions or globs and purged paths")
 
         if "purge_threads" in data:
             self.purge_threads = data["purge_threads"]
             if self.purge_threads < 1:
                 self.purge_threads = 1
 
+        if "purge_mode" in data:
+            self.purge_mode = data["purge_mode"]
+            if self.purge_mode not in ["foreground", "background", "deferred"]:
+                raise ConfigException("purge_mode needs to be foreground, background or deferred")
+
+        if "purge_lock_timeout" in data:
+            self.purge_lock_timeout = data["purge_lock_timeout"]
+
         if "file_log" in data:
             self.file_log = data["file_log"]
 
         if "block_size" in data:
             self.block_size = data["block_size"]
 
+        if "resume_threshold" in data:
+            self.resume_threshold = data["resume_threshold"]
+
+        if "segments" in data:
+            self.segments = int(data["segments"])
+            if self.segments < 1:
+                self.segments = 1
+
+        if "segment_threshold" in data:
+            self.segment_threshold = data["segment_threshold"]
+
         if "composer" in data:
             self.composer = data["composer"].lstrip("/")
 
+        if "engine" in data:
+            self.engine = data["engine"]
+            if self.engine not in ["threads", "asyncio"]:
+                raise ConfigException("engine needs to be threads or asyncio")
+
+        if "concurrent_remove" in data:
+            self.concurrent_remove = data["concurrent_remove"]
+
+        if "staged" in data:
+            self.staged = data["staged"]
+
+        if "staging_directory" in data:
+            self.staging_directory = data["staging_directory"]
+
+        if "verify" in data:
+            self.verify = data["verify"]
+
+        if "bootstrap" in data:
+            self.bootstrap = data["bootstrap"]
+
+        if "bootstrap_trust" in data:
+            self.bootstrap_trust = data["bootstrap_trust"]
+            if self.bootstrap_trust not in ["hash", "mtime", "size"]:
+                raise ConfigException("bootstrap_trust needs to be hash, mtime or size")
+
         if "before" in data:
             self.run_before = data["before"]
 
         if "after" in data:
             self.run_after = data["after"]
 
+        if self.protocol == "file" and os.path.realpath(self.remote or "/") == self.local:
+            raise ConfigException("connection.root can't be the same directory as local")
+
         if self.composer:
             for index, value in enumerate(self.ignore):
                 if value.startswith(".ftp-"):
@@ -159,9 +299,11 @@ class Config:
                     )
                     self.ignore[index] = "/" + value
 
-    def is_defined(self, key, dictionary, description=None):
+    def is_defined(self, key, dictionary, description=None, optional=False):
         if key in dictionary:
             return True
+        elif optional:
+            return False
         else:
             if description is None:
                 description = key
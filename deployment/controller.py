@@ -0,0 +1,135 @@
+import logging
+import re
+from threading import Lock
+from time import time
+
+from deployment.hosts import HostCache
+from deployment.statistics import format_size
+
+
+class Controller:
+    INTERVAL = 3
+    IMPROVEMENT = 1.05
+
+    def __init__(self, config, statistics):
+        self.config = config
+        self.statistics = statistics
+        self.hosts = HostCache(config)
+        self.lock = Lock()
+
+        # learned limit is only starting maximum, it's probed upwards while throughput improves
+        # and only connection limit reported in this run caps connection count for good
+        self.maximum = config.threads
+        self.learned = self.hosts.get("connection_limit")
+        self.limited = False
+        if self.learned is not None and self.learned < self.maximum:
+            logging.info("Adaptive concurrency: using learned connection limit %s" % self.learned)
+            self.maximum = max(1, self.learned)
+
+        self.active = max(1, min(config.adaptive_floor, self.maximum))
+        self.sample_time = None
+        self.sample_objects = 0
+        self.sample_bytes = 0
+        self.previous = None
+        self.backoff_time = 0
+
+    def start(self):
+        self.lock.acquire()
+        self.sample_time = time()
+        self.sample_objects = self.statistics.get("completed")
+        self.sample_bytes = self.statistics.get("content_bytes")
+        self.previous = None
+        self.lock.release()
+        self.publish()
+        logging.info("Adaptive concurrency: starting with %s of %s connections" % (self.active, self.maximum))
+
+    def allowed(self, number):
+        return number < self.active
+
+    def update(self):
+        now = time()
+        if self.sample_time is None or now - self.sample_time < self.INTERVAL:
+            return
+
+        self.lock.acquire()
+        try:
+            elapsed = now - self.sample_time
+            if elapsed < self.INTERVAL:
+                return
+
+            objects = self.statistics.get("completed")
+            size = self.statistics.get("content_bytes")
+            current = ((objects - self.sample_objects) / elapsed, (size - self.sample_bytes) / elapsed)
+            self.sample_time = now
+            self.sample_objects = objects
+            self.sample_bytes = size
+
+            improved = self.previous is None or \
+                current[0] > self.previous[0] * self.IMPROVEMENT or \
+                current[1] > self.previous[1] * self.IMPROVEMENT
+            self.previous = current
+
+            if not self.limited and self.learned is not None and self.active > self.learned:
+                # more connections than learned limit worked for whole interval, limit was probably
+                # caused by other clients back then
+                self.learned = self.active
+                self.hosts.set("connection_limit", self.learned)
+
+            probe = not self.limited and self.active == self.maximum < self.config.threads
+            if improved and probe:
+                self.maximum += 1
+                logging.info("Adaptive concurrency: probing above learned connection limit")
+
+            if improved and self.active < self.maximum:
+                self.active += 1
+                self.statistics.add("controller_increases")
+                logging.info("Adaptive concurrency: increasing to %s connections (%.1f objects/s, %s/s)" % (
+                    self.active, current[0], format_size(current[1])
+                ))
+        finally:
+            self.lock.release()
+
+        self.publish()
+
+    def backoff(self, message):
+        self.lock.acquire()
+        try:
+            # several workers usually fail at once, react only to first of them
+            if time() - self.backoff_time < self.INTERVAL:
+                return
+            self.backoff_time = time()
+
+            limit = "user connections allowed" in message or "too many" in message.lower()
+            previous = self.active
+            self.active = max(1, self.active // 2)
+            self.previous = None
+
+            if limit:
+                # other connections (index, purge) count towards server limit too
+                learned = max(1, previous - 1)
+                match = re.search(r"([0-9]+) user connections allowed", message)
+                if match:
+                    learned = min(learned, int(match.group(1)))
+                self.limited = True
+                if learned < self.maximum:
+                    self.maximum = learned
+                if self.learned is None or learned != self.learned:
+                    self.learned = learned
+                    self.hosts.set("connection_limit", learned)
+                reason = "connection limit, maximum is now %s" % self.maximum
+            else:
+                reason = "timeout"
+
+            if self.active != previous:
+                self.statistics.add("controller_decreases")
+                logging.warning("Adaptive concurrency: decreasing to %s connections due to %s" % (self.active, reason))
+        finally:
+            self.lock.release()
+
+        self.publish()
+
+    def publish(self):
+        self.statistics.set("controller_active", self.active)
+        self.statistics.set("controller_maximum", self.maximum)
+        if self.active > self.statistics.get("controller_peak"):
+            self.statistics.set("controller_peak", self.active)
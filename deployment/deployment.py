@@ -1,63 +1,115 @@
+import ftplib
 from ftplib import error_perm
 import logging
 import os
 import queue
 from queue import Queue
-import re
 import sys
 from threading import Thread
 import time
 from time import sleep
+from timeit import default_timer as timer
 
+from deployment.aio import AsyncEngine
+from deployment.bootstrap import Bootstrap
 from deployment.composer import Composer
+from deployment.controller import Controller
 from deployment.counter import Counter
 from deployment.exclusion import Exclusion
-from deployment.ftp import Ftp
+from deployment.ftp import handshake_statistics
 from deployment.index import Index
+from deployment.logs import thread_name
+from deployment.partial import PartialPurge
+from deployment.pool import ConnectionPool
 from deployment.process import Process
 from deployment.purge import Purge
+from deployment.removal import RemovalPlan
 from deployment.scanner import Scanner
+from deployment.schedule import Schedule
+from deployment.staging import Staging
+from deployment.statistics import Statistics, format_size
+from deployment.transport import create_transport
+from deployment.trash import Trash
 from deployment.worker import Worker, WorkersState
 
 
 class Deployment:
     workers_state = None
 
-    def __init__(self, config):
+    def __init__(self, config, target=None):
         self.mapping = {}
-        self.extensions = []
+        self.partial = None
         self.workers = []
 
         self.config = config
         self.counter = Counter()
-        self.index = Index(self.config)
-        self.ftp = Ftp(self.config)
+        self.statistics = Statistics()
+        self.index = Index(self.config, target)
+        self.ftp = create_transport(self.config)
         self.failed = Queue()
+        self.staging = None
+        self.moves = {}
+        self.copies = {}
+        self.mismatches = []
+        self.pool = None
+        self.shared_connections = False
+        self.scanner_pool = None
+        self.directory = None
+        self.throttle = None
+        self.loop = None
+        self.changes = {"upload": 0, "remove": 0}
+        self.controller = Controller(self.config, self.statistics) if self.config.adaptive else None
+
+        if self.config.engine == "asyncio" and self.config.protocol != "ftp":
+            logging.warning("Asyncio engine supports only FTP, using threads for %s" % self.config.protocol)
 
         self.dry_run = False
 
     def deploy(self, skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force):
-        if self.dry_run:
-            logging.info("Executing DRY RUN")
+        synchronized = self.synchronize(
+            skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force
+        )
+        if synchronized:
+            self.report()
+            self.report_failed()
+
+    def synchronize(self, skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force):
+        self.start()
 
         if purge_only_enabled:
             self.purge(purge_partial_enabled)
-            return
+            return False
 
-        remove = True
-        contents = {}
+        result = self.read_index(force)
+        objects, exclusion = self.scan(skip_before_and_after)
+        self.apply(objects, exclusion, result, purge_partial_enabled, purge_skip_enabled)
+        self.finish(skip_before_and_after)
+        return True
+
+    def start(self):
+        if self.dry_run:
+            logging.info("Executing DRY RUN")
+        elif self.config.protocol != "file" and not (self.config.engine == "asyncio" and self.config.protocol == "ftp"):
+            # workers get connections already logged in while index is downloaded and local files are scanned
+            self.pool = ConnectionPool(self.config, self.shared_connections)
+            self.pool.start(self.controller.active if self.controller else self.config.threads)
+
+    def read_index(self, force):
+        result = {
+            "remove": True,
+            "contents": {},
+            "missing": False,
+        }
         if not force:
             try:
                 result = self.index.read()
-                remove = result["remove"]
-                contents = result["contents"]
             except Exception:
                 if not self.dry_run:
                     raise
-        roots = [self.config.local]
+        return result
 
-        if len(self.config.purge_partial) == 0:
-            purge_partial_enabled = False
+    def scan(self, skip_before_and_after):
+        roots = [self.config.local]
 
         if os.name == "nt":
             for index, value in enumerate(roots):
@@ -92,26 +144,41 @@ class Deployment:
         logging.info("Scanning...")
         exclusion = Exclusion(roots, self.config.ignore, self.mapping)
         scanner = Scanner(self.config, roots, exclusion)
-        self.index.hashes = objects = scanner.scan()
+        return scanner.scan(self.scanner_pool), exclusion
+
+    def apply(self, objects, exclusion, result, purge_partial_enabled, purge_skip_enabled):
+        remove = result["remove"]
+        contents = result["contents"]
+        missing = result["missing"]
+        self.index.hashes = objects
+
+        if len(self.config.purge_partial) == 0:
+            purge_partial_enabled = False
+        self.partial = PartialPurge(self.config.purge_partial)
+
+        if missing and self.config.bootstrap:
+            logging.info("Bootstrapping index from remote tree...")
+            contents = Bootstrap(self.config, self.mapping, self.pool).build(objects)
+            logging.info("Bootstrapping done")
 
         logging.info("Calculating changes...")
 
-        uploadQueue = Queue()
         to_delete = []
 
         offset = 0
+        to_upload = []
         if contents is None:
             for path in objects:
-                self.store_extension(path)
-                uploadQueue.put(path)
+                self.partial.add(path)
+                to_upload.append(path)
         else:
             for path in objects:
                 checksum = objects[path]
-                if path in contents and (checksum is None or checksum == contents[path]):
+                if path in contents and checksum == contents[path]:
                     self.index.write(path)
                 else:
-                    self.store_extension(path)
-                    uploadQueue.put(path)
+                    self.partial.add(path)
+                    to_upload.append(path)
 
             if os.path.isfile(self.index.backup_path):
                 os.remove(self.index.backup_path)
@@ -120,36 +187,85 @@ class Deployment:
                 for path in contents:
                     if path not in objects and not exclusion.is_ignored_relative(path):
                         to_delete.append(path)
+                    elif path in objects and (objects[path] is None) != (contents[path] is None):
+                        to_delete.append(path)  # file became directory or the other way around
+
+                for path in to_delete:
+                    self.partial.add(path)
+
+                self.moves = self.detect_moves(to_upload, to_delete, contents, objects)
+                if len(self.moves) > 0:
+                    moved = set(self.moves.values())
+                    to_upload = [path for path in to_upload if path not in self.moves]
+                    to_delete = [path for path in to_delete if path not in moved]
             else:
                 offset = len(contents)
 
-        if uploadQueue.qsize() == 0:
-            logging.info("Nothing to upload")
-        else:
-            logging.info("Uploading...")
+        self.copies = self.detect_copies(to_upload, contents or {}, objects)
+        if len(self.copies) > 0:
+            if self.ftp.copy_supported():
+                to_upload = [path for path in to_upload if path not in self.copies]
+            else:
+                self.copies = {}
 
-            self.counter.total = uploadQueue.qsize() + offset
-            self.counter.count = 1 + offset
+        if self.config.staged and not self.dry_run and (
+                len(to_upload) > 0 or len(self.moves) > 0 or len(self.copies) > 0):
+            self.staging = Staging(self.config, self.ftp)
+            self.staging.prepare()
 
-            self.process_queue(uploadQueue, Worker.MODE_UPLOAD)
+        if len(self.moves) > 0 and not self.staging:
+            logging.info("Moving...")
+
+            moveQueue = Queue()
+            for path in self.moves:
+                moveQueue.put(path)
+
+            self.counter.reset()
+            self.counter.total = moveQueue.qsize()
 
-            logging.info("Uploading done")
+            self.process_queue(moveQueue, Worker.MODE_MOVE)
 
-        if len(to_delete) == 0:
-            logging.info("Nothing to remove")
+            logging.info("Moving done")
+
+        self.changes = {"upload": len(to_upload) + len(self.moves) + len(self.copies), "remove": len(to_delete)}
+
+        plan = RemovalPlan(to_delete, contents)
+        retyped = set(path for path in to_delete if path in objects)
+        concurrent = self.config.concurrent_remove and not self.staging and not self.dry_run and not (
+                self.config.engine == "asyncio" and self.config.protocol == "ftp")
+
+        if concurrent:
+            self.remove_trees(plan, exclusion)
+            self.execute(to_upload, plan, retyped, offset)
         else:
-            logging.info("Removing...")
+            if len(retyped) > 0:
+                # object of the old type needs to be removed before the new one is uploaded
+                self.remove(plan, exclusion)
+            self.upload(to_upload, offset)
 
-            removeQueue = Queue()
-            for path in reversed(to_delete):
-                removeQueue.put(path)
+        if len(self.copies) > 0:
+            logging.info("Copying...")
+
+            copyQueue = Queue()
+            for path in self.copies:
+                copyQueue.put(path)
 
             self.counter.reset()
-            self.counter.total = removeQueue.qsize()
+            self.counter.total = copyQueue.qsize()
+
+            self.process_queue(copyQueue, Worker.MODE_COPY)
 
-            self.process_queue(removeQueue, Worker.MODE_REMOVE)
+            logging.info("Copying done")
 
-            logging.info("Removing done")
+        if self.staging:
+            self.commit()
+
+        if self.config.verify and not self.dry_run:
+            changed = to_upload + list(self.copies) + list(self.moves)
+            self.verify([path for path in changed if objects[path] is not None])
+
+        if not concurrent and len(retyped) == 0:
+            self.remove(plan, exclusion)
 
         if self.dry_run:
             logging.warning("Not uploading index in dry run")
@@ -162,6 +278,7 @@ class Deployment:
         if not purge_skip_enabled:
             self.purge(purge_partial_enabled)
 
+    def finish(self, skip_before_and_after):
         if len(self.config.run_after) > 0:
             if skip_before_and_after or self.dry_run:
                 logging.info("Skipping after commands")
@@ -169,14 +286,291 @@ class Deployment:
                 logging.info("Running after commands:")
                 self.run_commands(self.config.run_after)
 
+    def report_failed(self):
+        count = 0
         if not self.failed.empty():
             logging.fatal("FAILED TO PROCESS FOLLOWING OBJECTS")
             while True:
                 try:
                     object = self.failed.get_nowait()
                     logging.fatal("failed to " + object)
+                    count += 1
                 except queue.Empty:
                     break
+        return count
+
+    def upload(self, to_upload, offset):
+        if len(to_upload) == 0:
+            logging.info("Nothing to upload")
+            return
+
+        logging.info("Uploading...")
+
+        uploadQueue = Queue()
+        for path in to_upload:
+            uploadQueue.put(path)
+
+        self.counter.reset()
+        self.counter.total = uploadQueue.qsize() + offset
+        self.counter.count = 1 + offset
+
+        self.process_queue(uploadQueue, Worker.MODE_UPLOAD)
+
+        logging.info("Uploading done")
+
+    def remove(self, plan, exclusion):
+        self.remove_trees(plan, exclusion)
+        self.remove_levels(plan, plan.levels())
+
+    def remove_levels(self, plan, levels):
+        if len(levels) == 0:
+            if len(plan.trees) == 0:
+                logging.info("Nothing to remove")
+            return
+
+        logging.info("Removing...")
+
+        self.counter.reset()
+        self.counter.total = sum(len(paths) for directory, paths in levels)
+
+        for directory, paths in levels:
+            removeQueue = Queue()
+            for path in paths:
+                removeQueue.put(path)
+
+            self.process_queue(removeQueue, Worker.MODE_REMOVE_DIRECTORY if directory else Worker.MODE_REMOVE)
+
+        logging.info("Removing done")
+
+    def remove_trees(self, plan, exclusion):
+        if len(plan.to_delete) == 0 or self.dry_run or not self.ftp.delete_tree_supported():
+            return
+
+        trees = plan.collapse(exclusion, lambda tree: self.indexed_only(tree, plan.contents))
+        if len(trees) > 0:
+            logging.info("Removing " + str(len(trees)) + " directories recursively...")
+            purge = Purge(self.config, self.pool)
+            for path in trees:
+                purge.add(self.config.remote + path, True)
+            purge.process()
+
+            self.statistics.add("removed_objects", plan.collapsed())
+            self.statistics.add("removal_requests", purge.requests())
+
+    def indexed_only(self, tree, contents):
+        # recursive removal would take files which exist only on server (uploads, caches) with the tree,
+        # such tree is removed object by object and these files stay
+        pending = [tree]
+        while len(pending) > 0:
+            directory = pending.pop()
+            try:
+                entries = self.ftp.list_directory_details(self.config.remote + directory)
+            except ftplib.all_errors as e:
+                logging.info("Listing of " + directory + " failed, reason: " + str(e))
+                return False
+
+            for name, type, size, modified in entries:
+                path = directory + "/" + name
+                if path not in contents or (type == "dir") != (contents[path] is None):
+                    logging.info("Not removing " + tree + " at once, " + path + " isn't in index")
+                    return False
+                if type == "dir":
+                    pending.append(path)
+        return True
+
+    def execute(self, to_upload, plan, retyped, offset):
+        # removals don't wait for uploads, they share one pool of workers and only upload of path
+        # which changed type waits for removal of its old object
+        levels = plan.levels()
+        if len(levels) == 0 or len(to_upload) == 0:
+            self.upload(to_upload, offset)
+            self.remove_levels(plan, levels)
+            return
+
+        logging.info("Uploading and removing...")
+
+        schedule = Schedule(
+            to_upload, levels, retyped, Worker.MODE_UPLOAD, Worker.MODE_REMOVE, Worker.MODE_REMOVE_DIRECTORY
+        )
+
+        self.counter.reset()
+        self.counter.total = len(to_upload) + sum(len(paths) for directory, paths in levels) + offset
+        self.counter.count = 1 + offset
+
+        self.process_queue(schedule, Worker.MODE_UPLOAD)
+
+        logging.info("Uploading and removing done")
+
+    def commit(self):
+        # moves change live tree so in staged deploy they happen together with other changes
+        paths = self.staging.paths + list(self.moves)
+        if len(paths) == 0:
+            logging.info("Nothing to commit")
+            return
+
+        logging.info("Committing...")
+
+        commitQueue = Queue()
+        for path in paths:
+            commitQueue.put(path)
+
+        self.counter.reset()
+        self.counter.total = commitQueue.qsize()
+
+        start = timer()
+        self.process_queue(commitQueue, Worker.MODE_COMMIT)
+        elapsed = timer() - start
+
+        self.statistics.add("commit_files", len(paths))
+        self.statistics.add("commit_time", elapsed)
+
+        logging.info("Committing done")
+
+    def verify(self, paths):
+        # mismatching files are uploaded again directly and checked once more, files which still don't match
+        # are marked in index so next deploy uploads them
+        if len(paths) == 0:
+            logging.info("Nothing to verify")
+            return
+
+        logging.info("Verifying...")
+        start = timer()
+        mismatches = self.verify_paths(paths)
+
+        if len(mismatches) > 0:
+            logging.warning("%s files don't match on server, uploading them again" % len(mismatches))
+            self.statistics.add("verify_mismatches", len(mismatches))
+            self.staging = None
+
+            uploadQueue = Queue()
+            for path in mismatches:
+                uploadQueue.put(path)
+
+            self.counter.reset()
+            self.counter.total = uploadQueue.qsize()
+
+            self.process_queue(uploadQueue, Worker.MODE_UPLOAD)
+
+            for path in self.verify_paths(mismatches):
+                self.index.invalidate(path)
+                self.failed.put("verify " + path)
+
+        self.statistics.add("verify_time", timer() - start)
+
+        logging.info("Verifying done")
+
+    def verify_paths(self, paths):
+        verifyQueue = Queue()
+        for path in paths:
+            verifyQueue.put(path)
+
+        self.counter.reset()
+        self.counter.total = verifyQueue.qsize()
+
+        self.mismatches = []
+        self.process_queue(verifyQueue, Worker.MODE_VERIFY)
+
+        return self.mismatches
+
+    def detect_moves(self, to_upload, to_delete, contents, objects):
+        # file removed from one path and added to another with the same content is renamed on server instead
+        deleted = {}
+        for path in to_delete:
+            checksum = contents[path]
+            if checksum is not None:
+                if checksum not in deleted:
+                    deleted[checksum] = []
+                deleted[checksum].append(path)
+
+        moves = {}
+        for path in to_upload:
+            checksum = objects[path]
+            if checksum is None or checksum not in deleted:
+                continue
+
+            for candidate in deleted[checksum]:
+                if not path.startswith(candidate + "/"):
+                    moves[path] = candidate
+                    deleted[checksum].remove(candidate)
+                    break
+
+        return moves
+
+    def detect_copies(self, to_upload, contents, objects):
+        # file with the same content as unchanged file or as another uploaded file is copied on server from it
+        sources = {}
+        for path in objects:
+            checksum = objects[path]
+            if checksum is not None and checksum not in sources and contents.get(path) == checksum:
+                sources[checksum] = path
+
+        copies = {}
+        for path in to_upload:
+            checksum = objects[path]
+            if checksum is None:
+                continue
+
+            if checksum in sources:
+                copies[path] = sources[checksum]
+            else:
+                sources[checksum] = path
+
+        return copies
+
+    def report(self):
+        if self.statistics.get("commit_files") > 0:
+            logging.info("Commit phase: %s files in %.3f seconds" % (
+                self.statistics.get("commit_files"), self.statistics.get("commit_time")
+            ))
+
+        if self.statistics.get("moved_files") > 0:
+            logging.info("Moved %s files on server instead of uploading them, %s not transferred" % (
+                self.statistics.get("moved_files"), format_size(self.statistics.get("moved_bytes"))
+            ))
+
+        if self.statistics.get("copied_files") > 0:
+            logging.info("Copied %s files on server instead of uploading them, %s not transferred" % (
+                self.statistics.get("copied_files"), format_size(self.statistics.get("copied_bytes"))
+            ))
+
+        if self.statistics.get("verified_files") > 0:
+            logging.info("Verified %s files in %.3f seconds, %s didn't match and were uploaded again" % (
+                self.statistics.get("verified_files"), self.statistics.get("verify_time"),
+                self.statistics.get("verify_mismatches")
+            ))
+
+        if self.statistics.get("removed_objects") > 0:
+            logging.info("Removed %s objects in %s round-trips (%.2f per object)" % (
+                self.statistics.get("removed_objects"), self.statistics.get("removal_requests"),
+                self.statistics.get("removal_requests") / self.statistics.get("removed_objects")
+            ))
+
+        if self.statistics.get("resumed_files") > 0:
+            logging.info("Resumed uploads: %s files, %s not transferred again" % (
+                self.statistics.get("resumed_files"), format_size(self.statistics.get("resumed_bytes"))
+            ))
+
+        if self.controller:
+            logging.info("Adaptive concurrency: peak %s, final %s, maximum %s connections (%s increases, "
+                         "%s decreases)" % (
+                self.statistics.get("controller_peak"), self.statistics.get("controller_active"),
+                self.statistics.get("controller_maximum"), self.statistics.get("controller_increases"),
+                self.statistics.get("controller_decreases")
+            ))
+
+        if self.config.secure:
+            handshakes = handshake_statistics()
+            logging.info("TLS handshakes: control %s full, %s resumed; data %s full, %s resumed" % (
+                handshakes["control_full"], handshakes["control_resumed"],
+                handshakes["data_full"], handshakes["data_resumed"]
+            ))
+
+        content = self.statistics.get("content_bytes")
+        if content > 0:
+            wire = self.statistics.get("wire_bytes")
+            logging.info("Transferred %s of content as %s on the wire (%.1f%%)" % (
+                format_size(content), format_size(wire), wire / content * 100
+            ))
 
     def purge(self, purge_partial_enabled):
         if len(self.config.purge) == 0:
@@ -189,64 +583,58 @@ class Deployment:
             logging.info("Purging...")
 
             to_purge = self.config.purge
-            extension_count = len(self.extensions)
-            if extension_count > 0 and purge_partial_enabled:
+            if purge_partial_enabled and self.partial and self.partial.changes > 0:
                 to_purge = []
-                for extension in self.extensions:
-                    if extension in self.config.purge_partial and self.config.purge_partial[extension] not in to_purge:
-                        to_purge.append(self.config.purge_partial[extension])
+                for target in self.partial.targets:
+                    for path in self.partial.expand(self.ftp, self.config.remote, target):
+                        if path not in to_purge:
+                            to_purge.append(path)
 
-            to_delete = []
-            base_folders = {}
             suffix = str(int(time.time())) + ".tmp"
             for path in to_purge:
                 current = self.config.remote + path
 
-                name = os.path.basename(current)
-                base = os.path.dirname(current)
-                if base not in base_folders:
-                    base_folders[base] = []
-                if name not in base_folders[base]:
-                    base_folders[base].append(name)
-
                 try:
                     self.ftp.delete_file(current)
                 except error_perm:
                     try:
                         new = current + "_" + suffix
                         self.ftp.rename(current, new)
-                        to_delete.append(new)
                         self.ftp.create_directory(current)
-                        self.ftp.chmod(current, 777)
+                        # renamed directory is only deleted, nobody else than deploying user needs access to it
+                        self.ftp.chmod(new, 700)
                     except error_perm:
                         pass
 
-            for base, names in base_folders.items():
-                try:
-                    objects = self.ftp.list_directory_contents(base)
-                    for object in objects:
-                        for name in names:
-                            if re.search(r"^" + name + r"_[0-9]+\.tmp$", object):
-                                to_delete.append(base + "/" + object)
-                except error_perm as e:
-                    message = str(e)
-                    if message.startswith("550"):  # directory not exists
-                        continue
-                    raise e
-
-            purge = Purge(self.config)
-            for path in to_delete:
-                purge.add(path)
-            directories, files = purge.process()
-
-            logging.info("Purging done, " + str(files) + " files and " + str(directories) + " directories")
+            trash = Trash(self.config, self.ftp, self.pool)
+            to_delete = trash.find(to_purge)
+            if len(to_delete) == 0:
+                logging.info("Purging done, nothing to delete")
+            elif self.config.purge_mode == Trash.MODE_DEFERRED:
+                logging.info("Purging done, %s trash directories pending deletion" % len(to_delete))
+            elif self.config.purge_mode == Trash.MODE_BACKGROUND:
+                pid = trash.spawn(to_delete)
+                logging.info("Purging done, deleting %s trash directories in background (pid %s, log %s)" % (
+                    len(to_delete), pid, Trash.log_path
+                ))
+            else:
+                if trash.delete(to_delete) is None:
+                    logging.info("Purging done, %s trash directories pending deletion" % len(to_delete))
+                else:
+                    logging.info("Purging done")
 
     def process_queue(self, item_queue, mode):
         if self.dry_run:
             if mode == "upload":
                 mode = "Uploading"
-            elif mode == "remove":
+            elif mode in ("remove", "remove directory"):
                 mode = "Removing"
+            elif mode == "commit":
+                mode = "Committing"
+            elif mode == "move":
+                mode = "Moving"
+            elif mode == "copy":
+                mode = "Copying"
 
             while True:
                 try:
@@ -259,17 +647,32 @@ class Deployment:
 
             return
 
+        if self.config.engine == "asyncio" and self.config.protocol == "ftp" and mode != Worker.MODE_VERIFY:
+            engine = AsyncEngine(
+                self.config, self.counter, self.index, self.failed, self.mapping, self.statistics, self.staging,
+                self.moves, self.copies
+            )
+            engine.loop = self.loop
+            engine.process_queue(item_queue, mode)
+            return
+
         self.workers_state = WorkersState()
 
+        if self.controller:
+            self.controller.start()
+
         self.workers = []
         for number in range(self.config.threads):
             worker = Worker(
-                item_queue, self.config, self.counter, self.index, self.failed, mode, self.mapping, self.workers_state
+                item_queue, self.config, self.counter, self.index, self.failed, mode, self.mapping, self.workers_state,
+                self.staging, self.statistics, self.controller, number, self.moves, self.copies, self.mismatches,
+                self.pool, self.throttle
             )
             worker.start()
             self.workers.append(worker)
 
-        Thread(target=self.monitor, args=(self.workers, item_queue), daemon=True).start()
+        Thread(target=self.monitor, args=(self.workers, item_queue), name=thread_name(self.config, "monitor"),
+               daemon=True).start()
 
         with item_queue.all_tasks_done:
             while item_queue.unfinished_tasks and self.workers_state.running:
@@ -303,21 +706,19 @@ class Deployment:
             sleep(5)
 
     def close(self):
+        if self.pool:
+            self.pool.close()
         self.index.close()
         self.ftp.close()
 
-    def store_extension(self, path):
-        extension = os.path.splitext(path)[1][1:]
-        if extension and extension not in self.extensions:
-            self.extensions.append(extension)
-
     def run_commands(self, list):
         def callback(line):
             logging.info(line)
 
         for command in list:
             logging.info("Command " + command + " started")
-            process = Process(command).execute(None, callback)
+            process = Process(command, popen_override={"cwd": self.directory} if self.directory else None)
+            process.execute(None, callback)
             if process.return_code() != 0:
                 logging.info("Command " + command + " failed with return code: " + str(process.return_code()))
                 exit(1)
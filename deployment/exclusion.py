@@ -27,33 +27,33 @@ class Exclusion:
             else:
                 formatted.append(pattern)
 
-        analyzed = []
-        for pattern in formatted:
-            kind = None
-            if "*" in pattern:
-                pieces = pattern.split("*")
-                pieces = list(map(re.escape, pieces))
-                pattern = ".*".join(pieces)
-                pattern = re.compile("^" + pattern + r"$", flags=re.I | re.DOTALL)
-                kind = "regex"
-            elif pattern.startswith("/") or re.match(r"^[a-z]+:/", pattern, flags=re.I) is not None:
-                kind = "root"
+        return [self.analyze(pattern) for pattern in formatted]
 
-            analyzed.append((kind, pattern))
+    @staticmethod
+    def analyze(pattern):
+        kind = None
+        if "*" in pattern:
+            pieces = pattern.split("*")
+            pieces = list(map(re.escape, pieces))
+            pattern = ".*".join(pieces)
+            pattern = re.compile("^" + pattern + r"$", flags=re.I | re.DOTALL)
+            kind = "regex"
+        elif pattern.startswith("/") or re.match(r"^[a-z]+:/", pattern, flags=re.I) is not None:
+            kind = "root"
 
-        return analyzed
+        return kind, pattern
+
+    @staticmethod
+    def matches(kind, pattern, path):
+        if kind == "regex":
+            return pattern.search(path) is not None
+        elif kind == "root":
+            return path.startswith(pattern)
+        return pattern in path
 
     def is_ignored_absolute(self, path):
         for kind, pattern in self.patterns:
-            if kind == "regex":
-                if pattern.search(path):
-                    return pattern
-
-            elif kind == "root":
-                if path.startswith(pattern):
-                    return pattern
-
-            elif pattern in path:
+            if self.matches(kind, pattern, path):
                 return pattern
 
         return False
@@ -63,3 +63,12 @@ class Exclusion:
             if self.is_ignored_absolute(root + path):
                 return True
         return False
+
+    def has_ignored_inside_relative(self, directory):
+        # only patterns bound to root can point to objects which exist just on server (local config, uploads)
+        for root in self.roots:
+            prefix = root + directory + "/"
+            for kind, pattern in self.patterns:
+                if kind == "root" and pattern.startswith(prefix):
+                    return True
+        return False
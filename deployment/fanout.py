@@ -0,0 +1,150 @@
+import logging
+import sys
+from threading import Thread
+from timeit import default_timer as timer
+
+from deployment.aio import SharedLoop
+from deployment.deployment import Deployment
+from deployment.exceptions import MessageException
+from deployment.logs import bind_file_log, close_file_log, thread_name
+from deployment.throttle import Throttle
+
+
+class FanOut:
+    def __init__(self, configs, connections=None, bandwidth=None):
+        # targets share local root, so files are scanned and hashed once and every target
+        # only compares them with its own index and runs its own workers
+        first = configs[0]
+        for config in configs[1:]:
+            if len([other for other in configs if other.name == config.name]) > 1:
+                raise MessageException("Configuration with name %s is used more than once" % config.name)
+            if config.local != first.local or config.ignore != first.ignore or config.composer != first.composer:
+                raise MessageException(
+                    "Configuration %s doesn't share local root, ignore and composer with %s" % (
+                        config.name, first.name
+                    )
+                )
+
+        share_connections(configs, connections)
+        for config in configs:
+            bind_file_log(config, config.name)
+
+        throttle = Throttle(bandwidth * 1024 * 1024) if bandwidth else None
+        asynchronous = [config for config in configs if config.engine == "asyncio" and config.protocol == "ftp"]
+        self.loop = SharedLoop() if len(asynchronous) > 1 else None
+        self.deployments = []
+        for config in configs:
+            deployment = Deployment(config, config.name)
+            deployment.throttle = throttle
+            if config in asynchronous:
+                deployment.loop = self.loop
+            self.deployments.append(deployment)
+
+        self.dry_run = False
+        self.results = {}
+
+    def deploy(self, skip_before_and_after, purge_partial_enabled, purge_only_enabled, purge_skip_enabled, force):
+        first = self.deployments[0]
+        for deployment in self.deployments:
+            deployment.dry_run = self.dry_run
+            deployment.start()
+            self.results[deployment] = {"start": timer(), "error": None}
+
+        if purge_only_enabled:
+            self.run(lambda deployment: deployment.purge(purge_partial_enabled))
+            return self.summarize()
+
+        logging.info("Downloading indexes of %s targets..." % len(self.deployments))
+        indexes = {}
+        self.run(lambda deployment: indexes.update({deployment: deployment.read_index(force)}))
+
+        objects, exclusion = first.scan(skip_before_and_after)
+        for deployment in self.deployments[1:]:
+            deployment.mapping = dict(first.mapping)
+
+        self.run(lambda deployment: deployment.apply(
+            objects, exclusion, indexes[deployment], purge_partial_enabled, purge_skip_enabled
+        ), [deployment for deployment in self.deployments if deployment in indexes])
+
+        # before and after commands are shared as well, they run once for all targets
+        if self.failures() == 0:
+            first.finish(skip_before_and_after)
+        elif len(first.config.run_after) > 0:
+            logging.warning("Skipping after commands, some targets failed")
+
+        return self.summarize()
+
+    def run(self, action, deployments=None):
+        # every target runs in its own thread, failure of one target doesn't stop the others
+        threads = []
+        for deployment in self.deployments if deployments is None else deployments:
+            name = thread_name(deployment.config, "deploy")
+            thread = Thread(target=self.execute, args=(action, deployment), name=name, daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def execute(self, action, deployment):
+        result = self.results[deployment]
+        try:
+            action(deployment)
+        except MessageException as e:
+            result["error"] = str(e)
+            logging.error("Target %s failed, reason: %s" % (deployment.config.name, str(e)))
+        except SystemExit as e:
+            result["error"] = "terminated with code %s" % e.code
+            logging.error("Target %s terminated with code %s" % (deployment.config.name, e.code))
+        except:
+            result["error"] = str(sys.exc_info()[1]) or sys.exc_info()[0].__name__
+            logging.exception("Target %s failed" % deployment.config.name)
+        finally:
+            result["elapsed"] = timer() - result["start"]
+
+    def failures(self):
+        return len([result for result in self.results.values() if result["error"] is not None])
+
+    def summarize(self):
+        # reports are printed one after another so lines of different targets aren't mixed
+        for deployment in self.deployments:
+            name = deployment.config.name
+            result = self.results[deployment]
+
+            logging.info("Target %s:" % name)
+            deployment.report()
+            failed = deployment.report_failed()
+
+            if result["error"] is not None:
+                logging.error("Target %s failed after %.3f seconds, reason: %s" % (
+                    name, result["elapsed"], result["error"]
+                ))
+            else:
+                logging.info("Target %s done in %.3f seconds, %s changed, %s removed, %s failed" % (
+                    name, result["elapsed"], deployment.changes["upload"], deployment.changes["remove"], failed
+                ))
+
+        return self.failures() == 0
+
+    def close(self):
+        for deployment in self.deployments:
+            deployment.close()
+            close_file_log(deployment.config)
+        if self.loop:
+            self.loop.close()
+
+
+def share_connections(configs, connections):
+    # connection budget is split between targets in proportion to their threads, every target keeps at least one
+    if connections is None:
+        return
+
+    total = sum(config.threads for config in configs)
+    if total <= connections:
+        return
+
+    for config in configs:
+        config.threads = max(1, config.threads * connections // total)
+        if config.purge_threads is not None:
+            config.purge_threads = min(config.purge_threads, config.threads)
+        config.adaptive_floor = min(config.adaptive_floor, config.threads)
@@ -0,0 +1,327 @@
+import errno
+import ftplib
+import functools
+import logging
+import os
+
+from deployment.ftp import DirectoryNotEmptyException, InvalidStateException
+
+
+def translate_errors(method):
+    # callers understand ftplib errors and messages, rejected operations are mapped to their FTP equivalents
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise ftplib.error_perm("552 " + str(e.strerror))
+            if e.errno in (errno.ENOENT, errno.EISDIR, errno.ENOTDIR, errno.EACCES, errno.EPERM, errno.EEXIST,
+                           errno.ENOTEMPTY):
+                raise ftplib.error_perm("550 %s: %s" % (e.strerror, e.filename))
+            raise
+
+    return wrapper
+
+
+class Filesystem:
+    wire_bytes = 0
+    copy_file_range = hasattr(os, "copy_file_range")
+    sendfile = hasattr(os, "sendfile")
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        return self
+
+    def noop(self):
+        pass
+
+    @translate_errors
+    def rename(self, current, new):
+        os.rename(current, new)
+
+    @translate_errors
+    def replace(self, current, new):
+        try:
+            os.replace(current, new)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(new), exist_ok=True)
+            os.replace(current, new)
+
+    @translate_errors
+    def create_directory(self, directory, exclusive=False):
+        if exclusive:
+            os.mkdir(directory)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    @translate_errors
+    def chmod(self, path, chmod):
+        os.chmod(path, int(str(chmod), 8))
+
+    @translate_errors
+    def upload_file(self, local, remote, callback, ensure_directory=True):
+        self.wire_bytes = 0
+        with open(local, "rb") as source:
+            try:
+                target = open(remote, "wb")
+            except FileNotFoundError:
+                if not ensure_directory:
+                    raise
+                os.makedirs(os.path.dirname(remote), exist_ok=True)
+                target = open(remote, "wb")
+
+            with target:
+                self.copy(source, target, 0, callback)
+
+    @translate_errors
+    def resume_file(self, local, remote, offset, callback):
+        total = os.path.getsize(local)
+        with open(local, "rb") as source, open(remote, "r+b") as target:
+            target.truncate(offset)
+            self.copy(source, target, offset, callback)
+
+        size = self.size(remote)
+        if size != total:
+            raise ftplib.error_temp("451 Resumed upload size mismatch (%s instead of %s)" % (size, total))
+
+    def segmented_upload_supported(self):
+        return False
+
+    def copy(self, source, target, offset, callback):
+        # kernel copies data without passing it through user space, copy_file_range can even share extents
+        # or copy server side on NFS 4.2 and SMB, each method falls back to next one when it isn't supported
+        total = os.fstat(source.fileno()).st_size
+        position = offset
+
+        if self.copy_file_range:
+            try:
+                position = self.copy_with(os.copy_file_range, source, target, position, total, callback)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                    raise
+
+        if position < total and self.sendfile:
+            try:
+                position = self.copy_with(self.send_file, source, target, position, total, callback)
+            except OSError as e:
+                if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+
+        if position < total:
+            source.seek(position)
+            target.seek(position)
+            while True:
+                data = source.read(self.config.buffer_size)
+                if not data:
+                    break
+                target.write(data)
+                if callback:
+                    callback(len(data))
+
+        self.wire_bytes = total - offset
+
+    def copy_with(self, function, source, target, position, total, callback):
+        while position < total:
+            copied = function(source.fileno(), target.fileno(), min(self.config.buffer_size, total - position),
+                              position, position)
+            if copied == 0:
+                break
+            position += copied
+            if callback:
+                callback(copied)
+        return position
+
+    def send_file(self, source, target, count, source_offset, target_offset):
+        os.lseek(target, target_offset, os.SEEK_SET)
+        return os.sendfile(target, source, source_offset, count)
+
+    def size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def verification_method(self):
+        return "SIZE"
+
+    def verify_files(self, files):
+        # reading whole file back could be as slow as writing it on network filesystem, only size is compared
+        results = []
+        for remote, local, checksum in files:
+            size = self.size(remote)
+            expected = os.path.getsize(local)
+            if size is None:
+                results.append("missing on server")
+            elif size != expected:
+                results.append("size %s instead of %s" % (size, expected))
+            else:
+                results.append(None)
+        return results
+
+    def features(self):
+        return []
+
+    def supports(self, feature):
+        return False
+
+    @translate_errors
+    def ensure_directory_exists(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def pipelining_supported(self):
+        return False
+
+    def delete_files(self, files):
+        errors = []
+        for file in files:
+            try:
+                self.delete_file(file)
+                errors.append(None)
+            except ftplib.error_perm as e:
+                errors.append(e)
+        return errors
+
+    def delete_directories(self, directories):
+        errors = []
+        for directory in directories:
+            try:
+                self.delete_directory(directory)
+                errors.append(None)
+            except ftplib.error_perm as e:
+                errors.append(e)
+        return errors
+
+    def rename_files(self, pairs):
+        errors = []
+        for current, new in pairs:
+            try:
+                self.rename(current, new)
+                errors.append(None)
+            except ftplib.error_perm as e:
+                errors.append(e)
+        return errors
+
+    def copy_supported(self):
+        return self.config.server_copy
+
+    @translate_errors
+    def copy_file(self, source, target, ensure_directory=True):
+        with open(source, "rb") as file:
+            try:
+                output = open(target, "wb")
+            except FileNotFoundError:
+                if not ensure_directory:
+                    raise
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                output = open(target, "wb")
+
+            with output:
+                self.copy(file, output, 0, None)
+
+    def download_file_bytes(self, file):
+        try:
+            with open(file, "rb") as source:
+                return source.read()
+        except FileNotFoundError:
+            return None  # not exists - ignore
+        except OSError as e:
+            logging.error("File download failed, reason: " + str(e))
+        return False
+
+    @translate_errors
+    def delete_file(self, file):
+        self._delete_sanity_check(file)
+
+        os.remove(file)
+
+    @translate_errors
+    def delete_file_or_directory(self, target):
+        self._delete_sanity_check(target)
+
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            return
+        except (IsADirectoryError, PermissionError):
+            try:
+                os.rmdir(target)
+            except OSError as e:
+                if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise DirectoryNotEmptyException("Directory not empty '%s' " % target)
+                raise e
+
+    @translate_errors
+    def delete_directory(self, directory, verify=False):
+        self._delete_sanity_check(directory)
+
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            if not verify:
+                raise
+
+    def delete_tree_supported(self):
+        return self.config.server_delete
+
+    @translate_errors
+    def delete_tree(self, directory):
+        # returns number of removed directories and files, missing directory isn't error
+        self._delete_sanity_check(directory)
+
+        directories = 0
+        files = 0
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    if entry.is_dir(follow_symlinks=False):
+                        removed = self.delete_tree(entry.path)
+                        directories += removed[0]
+                        files += removed[1]
+                    else:
+                        os.remove(entry.path)
+                        files += 1
+            os.rmdir(directory)
+            directories += 1
+        except FileNotFoundError:
+            pass
+
+        return directories, files
+
+    def _delete_sanity_check(self, path):
+        if ".." in path:
+            raise InvalidStateException("dot directory detected")
+
+    @translate_errors
+    def list_directory_contents(self, directory, extended=False):
+        objects = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if extended:
+                    objects.append((entry.name, "dir" if entry.is_dir(follow_symlinks=False) else "file"))
+                else:
+                    objects.append(entry.name)
+
+        return objects
+
+    @translate_errors
+    def list_directory_stream(self, directory, callback):
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                callback(entry.name, "dir" if entry.is_dir(follow_symlinks=False) else "file")
+
+    @translate_errors
+    def list_directory_details(self, directory):
+        objects = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                attributes = entry.stat(follow_symlinks=False)
+                type = "dir" if entry.is_dir(follow_symlinks=False) else "file"
+                objects.append((entry.name, type, attributes.st_size, attributes.st_mtime))
+
+        return objects
+
+    def close(self):
+        pass
@@ -1,3 +1,5 @@
+import calendar
+from concurrent.futures import ThreadPoolExecutor
 import ftplib
 from io import BytesIO
 import logging
@@ -5,15 +7,45 @@ import os
 import platform
 import re
 import socket
+import ssl
 from subprocess import check_output, CalledProcessError, STDOUT
+from threading import Lock
+import time
+import zlib
 
+from deployment.checksum import md5_checksum, sha256_checksum
+from deployment.compression import is_compressible
 from deployment.config import ConfigException
 from deployment.exceptions import MessageException
+from deployment.hosts import HostCache
+from deployment.logs import thread_name
+
+pipelining_hosts = {}
+pipelining_lock = Lock()
+
+copy_hosts = {}
+copy_lock = Lock()
+
+segmented_hosts = {}
+segmented_lock = Lock()
+
+delete_hosts = {}
+delete_lock = Lock()
+
+tls_contexts = {}
+tls_sessions = {}
+tls_handshakes = {"control_full": 0, "control_resumed": 0, "data_full": 0, "data_resumed": 0}
+tls_lock = Lock()
 
 
 class Ftp:
     ftp = None
     mlsd = True
+    feature_list = None
+    buffer = None
+    transfer_mode = "S"
+    hash_selected = False
+    wire_bytes = 0
     error_file_failed_no_directory = [
         "could not create file",
         "no such file or directory",
@@ -40,14 +72,20 @@ class Ftp:
                 parameters["source_address"] = (address, 0)
 
             if self.config.secure:
-                self.ftp = FTP_TLS(**parameters)
+                self.ftp = FTP_TLS(context=shared_context(self.config.host, self.config.port), **parameters)
+                self.ftp.session_key = (self.config.host, self.config.port)
             else:
                 self.ftp = FTP(**parameters)
 
             if self.config.passive_workaround:
                 self.ftp.passive_workaround = True
 
-            self.ftp.connect(self.config.host)
+            self.ftp.send_buffer = self.config.send_buffer
+
+            self.ftp.connect(self.config.host, self.config.port)
+
+            if self.config.nodelay:
+                self.ftp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
             if self.config.secure and self.config.implicit:
                 self.ftp.prot_p()
@@ -55,21 +93,43 @@ class Ftp:
             self.ftp.login(self.config.user, self.config.password)
             self.ftp.set_pasv(self.config.passive)
 
+            if self.config.secure:
+                # TLS 1.3 tickets arrive after handshake, session is resumable only once server replied to login
+                store_session(self.ftp.session_key, self.ftp.sock.session)
+
         return self.ftp
 
+    def noop(self):
+        if self.ftp:
+            self.ftp.voidcmd("NOOP")
+
     def rename(self, current, new):
         self.connect()
 
         self.ftp.rename(current, new)
 
-    def create_directory(self, directory):
+    def replace(self, current, new):
+        self.connect()
+
+        try:
+            self.ftp.rename(current, new)
+        except ftplib.error_perm:
+            # target may be missing parent directory or server refuses to overwrite existing file
+            self.ensure_directory_exists(os.path.dirname(new))
+            try:
+                self.ftp.delete(new)
+            except ftplib.error_perm:
+                pass
+            self.ftp.rename(current, new)
+
+    def create_directory(self, directory, exclusive=False):
         self.connect()
 
         try:
             self.ftp.mkd(directory)
         except ftplib.error_perm as e:
             message = str(e)
-            if message.startswith("550"):
+            if message.startswith("550") and not exclusive:
                 return  # already exists - ignore
             raise e
 
@@ -81,9 +141,11 @@ class Ftp:
     def upload_file(self, local, remote, callback, ensure_directory=True):
         self.connect()
 
+        compress = self.config.compression and self.supports("MODE Z") and is_compressible(local)
+
         with open(local, "rb") as file:
             try:
-                self.ftp.storbinary("STOR " + remote, file, 8192, callback)
+                self.store("STOR " + remote, file, callback, compress=compress)
             except ftplib.all_errors as e:
                 message = str(e).lower()
                 if ensure_directory:
@@ -95,20 +157,469 @@ class Ftp:
 
                 raise e
 
+    def resume_file(self, local, remote, offset, callback):
+        self.connect()
+
+        total = os.path.getsize(local)
+        with open(local, "rb") as file:
+            file.seek(offset)
+            if self.supports("REST STREAM"):
+                self.store("STOR " + remote, file, callback, rest=offset)
+            else:
+                self.store("APPE " + remote, file, callback)
+
+        size = self.size(remote)
+        if size != total:
+            raise ftplib.error_temp("451 Resumed upload size mismatch (%s instead of %s)" % (size, total))
+
+    def segmented_upload_supported(self):
+        if self.config.segments < 2 or not self.supports("REST STREAM"):
+            return False
+
+        key = (self.config.host, self.config.port)
+        with segmented_lock:
+            if key not in segmented_hosts:
+                segmented_hosts[key] = HostCache(self.config).get("segmented_upload", True)
+
+        return segmented_hosts[key]
+
+    def upload_segmented(self, local, remote, connections, callback, checksum=None):
+        # every connection writes its own part of the same remote file with REST + STOR, first part truncates
+        # the file when it's opened so other parts can start only once server confirmed the first one
+        self.connect()
+
+        total = os.path.getsize(local)
+        length = -(-total // (len(connections) + 1))
+        lock = Lock()
+
+        def progress(sent):
+            if callback:
+                with lock:
+                    callback(sent)
+
+        self.ftp.voidcmd("TYPE I")
+        self.set_transfer_mode("S")
+        self.wire_bytes = 0
+        try:
+            connection = self.ftp.transfercmd("STOR " + remote)
+        except ftplib.error_perm as e:
+            message = str(e).lower()
+            if not any(error in message for error in self.error_file_failed_no_directory):
+                raise e
+            self.ensure_directory_exists(os.path.dirname(remote))
+            connection = self.ftp.transfercmd("STOR " + remote)
+
+        with ThreadPoolExecutor(len(connections), thread_name(self.config, "segment")) as executor:
+            futures = []
+            for number, ftp in enumerate(connections):
+                offset = (number + 1) * length
+                if offset < total:
+                    futures.append(executor.submit(
+                        ftp.store_segment, local, remote, offset, min(length, total - offset), progress
+                    ))
+
+            with connection, open(local, "rb") as file:
+                self.send_range(connection, file, 0, min(length, total), progress)
+                if isinstance(connection, ssl.SSLSocket):
+                    connection.unwrap()
+            self.ftp.voidresp()
+
+            for future in futures:
+                future.result()
+
+        self.wire_bytes += sum(ftp.wire_bytes for ftp in connections)
+        self.verify_segmented(local, remote, checksum)
+
+    def store_segment(self, local, remote, offset, length, callback):
+        self.connect()
+
+        self.ftp.voidcmd("TYPE I")
+        self.set_transfer_mode("S")
+        self.wire_bytes = 0
+        with self.ftp.transfercmd("STOR " + remote, offset) as connection, open(local, "rb") as file:
+            self.send_range(connection, file, offset, length, callback)
+            if isinstance(connection, ssl.SSLSocket):
+                connection.unwrap()
+        self.ftp.voidresp()
+
+    def verify_segmented(self, local, remote, checksum):
+        mismatch = self.verify_files([(remote, local, checksum)])[0]
+        if mismatch is not None:
+            # server accepted REST at arbitrary offsets but didn't write parts in place
+            key = (self.config.host, self.config.port)
+            with segmented_lock:
+                segmented_hosts[key] = False
+            HostCache(self.config).set("segmented_upload", False)
+            raise ftplib.error_temp("451 Segmented upload mismatch (%s), server doesn't support it" % mismatch)
+
+    def verification_method(self):
+        for line in self.features():
+            if line.startswith("HASH "):
+                if "SHA-256" in line:
+                    return "HASH SHA-256"
+                if "MD5" in line:
+                    return "HASH MD5"
+
+        for method in ["XSHA256", "XMD5", "SIZE", "MLST"]:
+            if self.supports(method):
+                return method
+        return "SIZE"
+
+    def verify_files(self, files):
+        # files is list of (remote, local, sha256 or None), result is None for every matching file
+        # and description of mismatch otherwise, commands are pipelined when server supports it
+        self.connect()
+
+        method = self.verification_method()
+        if method.startswith("HASH "):
+            if not self.hash_selected:
+                self.ftp.voidcmd("OPTS " + method)
+                self.hash_selected = True
+            command = "HASH "
+        elif method == "SIZE":
+            self.ftp.voidcmd("TYPE I")
+            command = "SIZE "
+        else:
+            command = method + " "
+
+        size = sum(os.path.getsize(local) for remote, local, checksum in files)
+        timeout = self.ftp.sock.gettimeout()
+        if timeout and method not in ("SIZE", "MLST"):
+            self.ftp.sock.settimeout(timeout + size / 52428800)  # server hashes at least 50 MiB/s
+        try:
+            responses = self.pipeline([command + remote for remote, local, checksum in files])
+        finally:
+            self.ftp.sock.settimeout(timeout)
+
+        results = []
+        for (remote, local, checksum), response in zip(files, responses):
+            if isinstance(response, Exception):
+                results.append(str(response))
+                continue
+
+            if method in ("SIZE", "MLST"):
+                expected = str(os.path.getsize(local))
+                match = re.search(r"size=([0-9]+);" if method == "MLST" else r"^213 ([0-9]+)", response, re.I)
+            else:
+                if "SHA" in method:
+                    expected = checksum or sha256_checksum(local, self.config.block_size)
+                else:
+                    expected = md5_checksum(local, self.config.block_size)
+                match = re.search(r"\b([0-9a-f]{%s})\b" % len(expected), response, re.I)
+
+            if not match:
+                results.append("unexpected reply " + response)
+            elif match.group(1).lower() != expected:
+                results.append("%s %s instead of %s" % (method, match.group(1).lower(), expected))
+            else:
+                results.append(None)
+        return results
+
+    def send_range(self, connection, file, offset, length, callback):
+        end = offset + length
+        if isinstance(connection, ssl.SSLSocket):
+            self.allocate_buffer()
+            view = memoryview(self.buffer)
+            file.seek(offset)
+            while offset < end:
+                read = file.readinto(view[:min(len(view), end - offset)])
+                if not read:
+                    break
+                connection.sendall(view[:read])
+                offset += read
+                self.wire_bytes += read
+                if callback:
+                    callback(read)
+        else:
+            while offset < end:
+                sent = connection.sendfile(file, offset, min(self.config.buffer_size, end - offset))
+                if sent == 0:
+                    break
+                offset += sent
+                self.wire_bytes += sent
+                if callback:
+                    callback(sent)
+
+    def store(self, command, file, callback, rest=None, compress=False):
+        self.ftp.voidcmd("TYPE I")
+        self.set_transfer_mode("Z" if compress else "S")
+        self.wire_bytes = 0
+        with self.ftp.transfercmd(command, rest) as connection:
+            if compress:
+                self.send_compressed(connection, file, callback)
+            elif isinstance(connection, ssl.SSLSocket):
+                self.send_buffered(connection, file, callback)
+            else:
+                self.send_zero_copy(connection, file, callback)
+
+            if isinstance(connection, ssl.SSLSocket):
+                connection.unwrap()
+        return self.ftp.voidresp()
+
+    def send_zero_copy(self, connection, file, callback):
+        # chunks are only used to report progress, kernel copies data directly from file to socket
+        offset = file.tell()
+        while True:
+            sent = connection.sendfile(file, offset, self.config.buffer_size)
+            if sent == 0:
+                break
+            offset += sent
+            self.wire_bytes += sent
+            if callback:
+                callback(sent)
+
+    def send_buffered(self, connection, file, callback):
+        self.allocate_buffer()
+
+        view = memoryview(self.buffer)
+        while True:
+            length = file.readinto(self.buffer)
+            if not length:
+                break
+            connection.sendall(view[:length])
+            self.wire_bytes += length
+            if callback:
+                callback(length)
+
+    def send_compressed(self, connection, file, callback):
+        self.allocate_buffer()
+
+        compressor = zlib.compressobj()
+        view = memoryview(self.buffer)
+        while True:
+            length = file.readinto(self.buffer)
+            if not length:
+                break
+            data = compressor.compress(view[:length])
+            if data:
+                connection.sendall(data)
+                self.wire_bytes += len(data)
+            if callback:
+                callback(length)
+
+        data = compressor.flush()
+        connection.sendall(data)
+        self.wire_bytes += len(data)
+
+    def allocate_buffer(self):
+        if self.buffer is None or len(self.buffer) != self.config.buffer_size:
+            self.buffer = bytearray(self.config.buffer_size)
+
+    def set_transfer_mode(self, mode):
+        # MODE Z compresses every data transfer including listings, so it's turned off when not wanted
+        if self.transfer_mode != mode:
+            self.ftp.voidcmd("MODE " + mode)
+            self.transfer_mode = mode
+
+    def size(self, path):
+        self.connect()
+
+        try:
+            self.ftp.voidcmd("TYPE I")
+            return self.ftp.size(path)
+        except ftplib.error_perm:
+            return None
+
+    def features(self):
+        self.connect()
+
+        if self.feature_list is None:
+            self.feature_list = []
+            try:
+                response = self.ftp.sendcmd("FEAT")
+                for line in response.split("\n")[1:-1]:
+                    self.feature_list.append(line.strip().upper())
+            except ftplib.error_perm:
+                pass
+
+        return self.feature_list
+
+    def supports(self, feature):
+        for line in self.features():
+            if line.startswith(feature):
+                return True
+        return False
+
     def ensure_directory_exists(self, path):
+        paths = []
         previous = []
         for directory in path.split("/"):
             if directory == "":
                 continue
 
             previous.append(directory)
-            path = "/".join(previous)
+            paths.append("/".join(previous))
+
+        if len(paths) > 1 and self.pipelining_supported():
+            for result in self.pipeline(["MKD " + path for path in paths]):
+                if isinstance(result, ftplib.error_perm) and not str(result).startswith("550"):
+                    raise result  # 550 - already exists - ignore
+            return
+
+        for path in paths:
             self.create_directory(path)
 
+    def pipelining_supported(self):
+        if not self.config.pipelining:
+            return False
+
+        self.connect()
+
+        key = (self.config.host, self.config.port)
+        with pipelining_lock:
+            if key not in pipelining_hosts:
+                hosts = HostCache(self.config)
+                supported = hosts.get("pipelining")
+                if supported is None:
+                    supported = self.probe_pipelining()
+                    hosts.set("pipelining", supported)
+                    logging.info("Server %s pipelining of control commands" % (
+                        "supports" if supported else "doesn't support"
+                    ))
+                pipelining_hosts[key] = supported
+
+        return pipelining_hosts[key]
+
+    def probe_pipelining(self):
+        try:
+            responses = self.pipeline(["NOOP", "NOOP", "NOOP"], True)
+            for response in responses:
+                if not isinstance(response, str) or not response.startswith("2"):
+                    raise ftplib.error_reply(str(response))
+            return True
+        except ftplib.all_errors:
+            # connection state is unknown at this point
+            self.close()
+            self.connect()
+            return False
+
+    def pipeline(self, commands, force=False):
+        # sends batch of independent commands at once and matches replies in order,
+        # result is list of responses or exceptions, falls back to lock-step when not supported
+        self.connect()
+
+        if not force and not self.pipelining_supported():
+            results = []
+            for command in commands:
+                try:
+                    results.append(self.ftp.sendcmd(command))
+                except (ftplib.error_perm, ftplib.error_temp) as e:
+                    results.append(e)
+            return results
+
+        payload = ""
+        for command in commands:
+            if "\r" in command or "\n" in command:
+                raise ValueError("an illegal newline character should not be contained")
+            payload += command + "\r\n"
+
+        results = []
+        try:
+            self.ftp.sock.sendall(payload.encode(self.ftp.encoding))
+            for command in commands:
+                try:
+                    results.append(self.ftp.getresp())
+                except (ftplib.error_perm, ftplib.error_temp) as e:
+                    results.append(e)
+        except:
+            # replies left unread would be taken as replies of next commands, connection is dropped without QUIT
+            self.ftp.close()
+            self.close()
+            raise
+        return results
+
+    def delete_files(self, files):
+        for file in files:
+            self._delete_sanity_check(file)
+
+        errors = []
+        for result in self.pipeline(["DELE " + file for file in files]):
+            errors.append(result if isinstance(result, Exception) else None)
+        return errors
+
+    def delete_directories(self, directories):
+        for directory in directories:
+            self._delete_sanity_check(directory)
+
+        errors = []
+        for result in self.pipeline(["RMD " + directory for directory in directories]):
+            errors.append(result if isinstance(result, Exception) else None)
+        return errors
+
+    def rename_files(self, pairs):
+        return self.send_pairs("RNFR ", "RNTO ", pairs)
+
+    def copy_files(self, pairs):
+        return self.send_pairs("SITE CPFR ", "SITE CPTO ", pairs)
+
+    def send_pairs(self, first, second, pairs):
+        # second command works with source remembered by connection, it can't be sent ahead (or after rejected
+        # first command, server could use source of previous pair), so pairs aren't pipelined
+        self.connect()
+
+        errors = []
+        for source, target in pairs:
+            try:
+                response = self.ftp.sendcmd(first + source)
+                if not response.startswith("3"):
+                    raise ftplib.error_reply(response)
+                self.ftp.sendcmd(second + target)
+                errors.append(None)
+            except (ftplib.error_perm, ftplib.error_temp, ftplib.error_reply) as e:
+                errors.append(e)
+        return errors
+
+    def copy_supported(self):
+        if not self.config.server_copy:
+            return False
+
+        self.connect()
+
+        key = (self.config.host, self.config.port)
+        with copy_lock:
+            if key not in copy_hosts:
+                hosts = HostCache(self.config)
+                supported = hosts.get("copy")
+                if supported is None:
+                    supported = self.probe_copy()
+                    hosts.set("copy", supported)
+                    logging.info("Server %s copying of files" % ("supports" if supported else "doesn't support"))
+                copy_hosts[key] = supported
+
+        return copy_hosts[key]
+
+    def probe_copy(self):
+        # ProFTPD mod_copy isn't listed in FEAT by most servers, HELP SITE lists it among SITE commands
+        for line in self.features():
+            if "CPFR" in line:
+                return True
+
+        try:
+            response = self.ftp.sendcmd("HELP SITE").upper()
+        except ftplib.error_perm:
+            return False
+        return "CPFR" in response and "CPTO" in response
+
+    def copy_file(self, source, target, ensure_directory=True):
+        self.connect()
+
+        response = self.ftp.sendcmd("SITE CPFR " + source)
+        if not response.startswith("3"):
+            raise ftplib.error_reply(response)
+
+        try:
+            self.ftp.voidcmd("SITE CPTO " + target)
+        except ftplib.error_perm as e:
+            if not ensure_directory:
+                raise e
+            self.ensure_directory_exists(os.path.dirname(target))
+            self.copy_file(source, target, False)
+
     def download_file_bytes(self, file):
         self.connect()
 
         try:
+            self.set_transfer_mode("S")
             buffer = BytesIO()
             self.ftp.retrbinary("RETR " + file, buffer.write)
             return buffer.getvalue()
@@ -156,16 +667,63 @@ class Ftp:
 
         try:
             self.ftp.rmd(directory)
-        except ftplib.error_perm:
+        except ftplib.error_perm as e:
             if not verify:
                 raise
+            # directory which is already gone isn't failure, servers word it differently and some (vsftpd)
+            # don't tell it at all, then listing of parent decides without changing working directory
+            from deployment.purge import Purge
+            if Purge.missing(e):
+                return
             try:
-                self.ftp.cwd(directory)
-                raise
-            except ftplib.error_perm as e:
-                if "failed to change directory" in str(e).lower():
-                    return
-                raise
+                entries = self.list_directory_details(os.path.dirname(directory))
+            except ftplib.error_perm:
+                return  # parent is gone as well
+            if os.path.basename(directory) not in [entry[0] for entry in entries]:
+                return
+            raise e
+
+    def delete_tree_supported(self):
+        if not self.config.server_delete:
+            return False
+
+        self.connect()
+
+        key = (self.config.host, self.config.port)
+        with delete_lock:
+            if key not in delete_hosts:
+                hosts = HostCache(self.config)
+                command = hosts.get("delete_tree")
+                if command is None:
+                    command = self.probe_delete_tree()
+                    hosts.set("delete_tree", command)
+                    logging.info("Server %s recursive removal of directories" % (
+                        "supports" if command else "doesn't support"
+                    ))
+                delete_hosts[key] = command
+
+        return bool(delete_hosts[key])
+
+    def probe_delete_tree(self):
+        # RMDA is listed in FEAT by servers implementing the draft, ProFTPD mod_site_misc has recursive SITE RMDIR
+        for line in self.features():
+            if line.split(" ")[0] == "RMDA":
+                return "RMDA"
+
+        try:
+            response = self.ftp.sendcmd("HELP SITE").upper()
+        except ftplib.error_perm:
+            return False
+        return "SITE RMDIR" if re.search(r"\bRMDIR\b", response) else False
+
+    def delete_tree(self, directory):
+        # server doesn't report how many objects it removed
+        if not self.delete_tree_supported():
+            raise ftplib.error_perm("502 Recursive removal is not supported")
+
+        self._delete_sanity_check(directory)
+
+        self.ftp.voidcmd(delete_hosts[(self.config.host, self.config.port)] + " " + directory)
 
     def _delete_sanity_check(self, path):
         if ".." in path:
@@ -173,6 +731,7 @@ class Ftp:
 
     def list_directory_contents(self, directory, extended=False):
         self.connect()
+        self.set_transfer_mode("S")
 
         objects = []
         if extended:
@@ -211,6 +770,69 @@ class Ftp:
 
         return filtered
 
+    def list_directory_stream(self, directory, callback):
+        # callback gets (name, "dir" or "file") while listing is still being received, so caller can hand
+        # directories over to other connections without waiting for whole listing
+        self.connect()
+        self.set_transfer_mode("S")
+
+        if self.mlsd:
+            received = []
+
+            def entry(line):
+                facts, _, name = line.partition(" ")
+                type = ""
+                for fact in facts.rstrip(";").split(";"):
+                    key, _, value = fact.partition("=")
+                    if key.lower() == "type":
+                        type = value.lower()
+                received.append(name)
+                if name not in (".", "..") and type not in ("cdir", "pdir"):
+                    callback(name, "dir" if type == "dir" else "file")
+
+            try:
+                self.ftp.retrlines("MLSD " + directory, entry)
+                return
+            except ftplib.error_perm as e:
+                if received or str(e)[:3] not in ("500", "502"):
+                    raise
+                self.mlsd = False
+
+        def line(line):
+            parts = re.split(r"\s+", line, 8)
+            if len(parts) < 9 or parts[8] in (".", ".."):
+                return
+            callback(parts[8], "dir" if parts[0][0] == "d" else "file")
+
+        self.ftp.dir(directory, line)
+
+    def list_directory_details(self, directory):
+        # list of (name, type, size, modification timestamp or None), LIST doesn't have reliable modification time
+        self.connect()
+        self.set_transfer_mode("S")
+
+        objects = []
+        if self.mlsd:
+            try:
+                for name, entry in self.ftp.mlsd(directory, ["type", "size", "modify"]):
+                    size = int(entry["size"]) if entry.get("size", "").isdigit() else None
+                    objects.append((name, entry.get("type", "").lower(), size, parse_modify(entry.get("modify"))))
+            except ftplib.error_perm:
+                self.mlsd = False
+                objects = []
+
+        if not self.mlsd:
+            lines = []
+            self.ftp.dir(directory, lines.append)
+            for line in lines:
+                parts = re.split(r"\s+", line, 8)
+                if len(parts) < 9:
+                    continue
+                size = int(parts[4]) if parts[4].isdigit() else None
+                objects.append((parts[8], "dir" if parts[0][0] == "d" else "file", size, None))
+
+        return [object for object in objects if object[0] not in (".", "..") and object[1] in ("dir", "file")]
+
     def close(self):
         if self.ftp:
             try:
@@ -221,6 +843,9 @@ class Ftp:
                 pass
             finally:
                 self.ftp = None
+                self.feature_list = None
+                self.transfer_mode = "S"
+                self.hash_selected = False
 
     def translate_interface_to_address(self, bind):
         if re.match(r"^[0-9.]+$", bind):
@@ -286,9 +911,53 @@ def makepasv(self):
     return host, port
 
 
+def parse_modify(value):
+    if not value or len(value) < 14 or not value[:14].isdigit():
+        return None
+    return calendar.timegm(time.strptime(value[:14], "%Y%m%d%H%M%S"))
+
+
+def shared_context(host, port):
+    # all connections to same target share context, otherwise cached sessions can't be resumed
+    with tls_lock:
+        if (host, port) not in tls_contexts:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            tls_contexts[(host, port)] = context
+        return tls_contexts[(host, port)]
+
+
+def store_session(key, session):
+    if session is not None:
+        with tls_lock:
+            tls_sessions[key] = session
+
+
+def record_handshake(connection, kind):
+    with tls_lock:
+        tls_handshakes[kind + ("_resumed" if connection.session_reused else "_full")] += 1
+
+
+def handshake_statistics():
+    with tls_lock:
+        return dict(tls_handshakes)
+
+
+def configure_data_connection(connection, send_buffer):
+    if send_buffer:
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+
+
 class FTP(ftplib.FTP):
     passive_workaround = False
     local_address = None
+    send_buffer = None
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        configure_data_connection(conn, self.send_buffer)
+        return conn, size
 
 
 FTP.makepasv = makepasv
@@ -297,11 +966,27 @@ FTP.makepasv = makepasv
 class FTP_TLS(ftplib.FTP_TLS):
     passive_workaround = False
     public_address = None
+    send_buffer = None
+    session_key = None
+
+    def auth(self):
+        if isinstance(self.sock, ssl.SSLSocket):
+            raise ValueError("Already using TLS")
+
+        response = self.voidcmd("AUTH TLS")
+        with tls_lock:
+            session = tls_sessions.get(self.session_key)
+        self.sock = self.context.wrap_socket(self.sock, server_hostname=self.host, session=session)
+        self.file = self.sock.makefile(mode="r", encoding=self.encoding)
+        record_handshake(self.sock, "control")
+        return response
 
     def ntransfercmd(self, cmd, rest=None):
         conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        configure_data_connection(conn, self.send_buffer)
         if self._prot_p:
             conn = self.context.wrap_socket(conn, server_hostname=self.host, session=self.sock.session)
+            record_handshake(conn, "data")
         return conn, size
 
 
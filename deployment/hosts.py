@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import tempfile
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class HostCache:
+    lock = Lock()
+    file_path = os.path.join(os.path.expanduser("~"), ".ftp-deploy", "hosts.json")
+
+    def __init__(self, config):
+        self.key = "%s@%s:%s" % (config.user, config.host, config.port)
+
+    def get(self, name, default=None):
+        self.lock.acquire()
+        try:
+            data = self.load()
+        finally:
+            self.lock.release()
+
+        if self.key in data and name in data[self.key]:
+            return data[self.key][name]
+        return default
+
+    def set(self, name, value):
+        # other deploys running at once update the file too, change is made under lock of file
+        # and written to temporary file which replaces the original, so readers never see it half written
+        self.lock.acquire()
+        try:
+            directory = os.path.dirname(self.file_path)
+            os.makedirs(directory, exist_ok=True)
+            lock = self.lock_file()
+            try:
+                data = self.load()
+                if self.key not in data:
+                    data[self.key] = {}
+                data[self.key][name] = value
+
+                handle, temporary = tempfile.mkstemp(prefix=".hosts-", suffix=".tmp", dir=directory)
+                try:
+                    with os.fdopen(handle, "w") as file:
+                        json.dump(data, file, indent=4)
+                    os.replace(temporary, self.file_path)
+                except:
+                    os.remove(temporary)
+                    raise
+            finally:
+                self.unlock_file(lock)
+        except OSError as e:
+            logging.warning("Failed to save host cache " + self.file_path + ", reason: " + str(e))
+        finally:
+            self.lock.release()
+
+    def lock_file(self):
+        file = open(self.file_path + ".lock", "a")
+        try:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        except:
+            file.close()
+            raise
+        return file
+
+    def unlock_file(self, file):
+        try:
+            if fcntl:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            file.close()
+
+    def load(self):
+        if not os.path.isfile(self.file_path):
+            return {}
+
+        try:
+            with open(self.file_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
@@ -6,25 +6,34 @@ from multiprocessing import Lock
 import os
 
 from deployment.exceptions import DownloadFailedException
-from deployment.ftp import Ftp
+from deployment.retry import RetryPolicy
+from deployment.transport import create_transport
 
 
 class Index:
     FILE_NAME = "/.deployment-index"
     BACKUP_FILE_NAME = "/.deployment-index.backup"
+    INVALID = "invalid"  # never matches checksum and unlike None (directory) it's still file
 
     file = None
     lock = Lock()
     hashes = {}
 
-    def __init__(self, config):
+    def __init__(self, config, target=None):
         self.config = config
 
+        self.written = set()
+
+        # targets deployed from the same local root at once need their own local copy of index
         self.file_path = self.config.local + self.FILE_NAME
         self.backup_path = self.config.local + self.BACKUP_FILE_NAME
+        if target is not None:
+            self.file_path += target if target.startswith(".") else "-" + target
+            self.backup_path = self.file_path + ".backup"
 
     def read(self):
         remove = True
+        missing = False
 
         if os.path.isfile(self.file_path) and not os.path.isfile(self.backup_path):
             os.rename(self.file_path, self.backup_path)
@@ -35,12 +44,13 @@ class Index:
             remove = False
         else:
             logging.info("Downloading index...")
-            ftp = Ftp(self.config)
+            ftp = create_transport(self.config)
             contents = ftp.download_file_bytes(self.config.remote + self.FILE_NAME)
             ftp.close()
             if contents is False:
                 raise DownloadFailedException("Index downloading failed")
-            logging.info("Index downloaded")
+            missing = contents is None
+            logging.info("Index not found" if missing else "Index downloaded")
 
         if contents:
             try:
@@ -76,16 +86,25 @@ class Index:
 
         return {
             "remove": remove,
-            "contents": contents
+            "contents": contents,
+            "missing": missing,
         }
 
     def write(self, path):
-        self.lock.acquire()
-
         value = None
         if path in self.hashes:
             value = self.hashes[path]
 
+        self.write_line(value, path)
+
+    def invalidate(self, path):
+        # later line wins, file with invalid checksum is uploaded again on next deploy
+        self.write_line(self.INVALID, path)
+        self.written.discard(path)
+
+    def write_line(self, value, path):
+        self.lock.acquire()
+
         if not self.file:
             if os.path.isfile(self.file_path) and not os.path.isfile(self.backup_path):
                 os.rename(self.file_path, self.backup_path)
@@ -93,26 +112,36 @@ class Index:
 
         line = str(value) + " " + path + "\n"
         self.file.write(line.encode("utf-8"))
+        self.written.add(path)
 
         self.lock.release()
 
+    def is_written(self, path):
+        return path in self.written
+
     def upload(self):
         self.close()
 
-        local = self.config.local + self.FILE_NAME
+        local = self.file_path
         remote = self.config.remote + self.FILE_NAME
-        retries = 10
+        retry_policy = RetryPolicy(self.config)
+        retry = 0
         while True:
-            ftp = Ftp(self.config)
+            retry_policy.wait_allowed()
+            ftp = create_transport(self.config)
             try:
                 ftp.upload_file(local, remote, None)
+                retry_policy.success()
                 break
             except ftplib.all_errors as e:
-                retries -= 1
-                if retries == 0:
+                retry_policy.failure(e)
+                if not retry_policy.retryable(e, retry):
                     logging.fatal("Failed to upload index")
                     raise e
                 logging.warning("Retrying to upload index due to error: " + str(e))
+                ftp.close()
+                retry_policy.wait(e, retry)
+                retry += 1
             finally:
                 ftp.close()
 
@@ -120,9 +149,8 @@ class Index:
 
     def remove(self):
         self.close()
-        path = self.config.local + self.FILE_NAME
-        if os.path.exists(path):
-            os.remove(path)
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
 
     def close(self):
         if self.file is not None:
@@ -0,0 +1,126 @@
+from getpass import getpass
+import logging
+import os
+
+from deployment import encryption
+from deployment.config import Config
+from deployment.exceptions import MessageException
+from deployment.logs import open_file_log
+
+
+def add_arguments(parser):
+    parser.add_argument("-s", "--skip", action="store_true", help="skip before and after commands", default=False)
+    parser.add_argument("-pp", "--purge-partial", action="store_true", help="activate partial purge", default=False)
+    parser.add_argument("-po", "--purge-only", action="store_true", help="only purge", default=False)
+    parser.add_argument("-ps", "--purge-skip", action="store_true", help="skip purge", default=False)
+    parser.add_argument("-t", "--threads", help="override config threads", default=None, type=int)
+    parser.add_argument("-a", "--adaptive", action="store_true", help="adapt connection count up to threads",
+                        default=False)
+    parser.add_argument("-pt", "--purge-threads", help="override config threads", default=None, type=int)
+    parser.add_argument("--purge-mode", help="override config purge mode",
+                        choices=["foreground", "background", "deferred"], default=None)
+    parser.add_argument("-b", "--bind", help="bind interface or source address", default=None)
+    parser.add_argument("-f", "--force", action="store_true", help="force whole upload", default=False)
+    parser.add_argument("--engine", help="override config engine", choices=["threads", "asyncio"], default=None)
+    parser.add_argument("--staged", action="store_true", help="upload to staging and commit by rename",
+                        default=False)
+    parser.add_argument("--bootstrap", action="store_true", help="build missing index from remote tree",
+                        default=False)
+    parser.add_argument("--verify", action="store_true", help="verify uploaded files on server", default=False)
+    parser.add_argument("--connections", help="limit connections of all targets together", default=None,
+                        type=int)
+    parser.add_argument("--bandwidth", help="limit upload bandwidth of all targets together (MiB/s)", default=None,
+                        type=float)
+    parser.add_argument("--dry-run", action="store_true", help="just report changes", default=False)
+    parser.add_argument("--use-encryption", action="store_true", help="use encryption for passwords", default=False)
+    shared_passphrase_help = "use shared passphrase, this option requires path to persistent file where " \
+                             "shared passphrase verification data is stored"
+    parser.add_argument("--shared-passphrase", help=shared_passphrase_help)
+    ssh_agent_help = "enable ssh-agent support (ssh-agent, pageant, gpg-agent), requires --shared-passphrase"
+    parser.add_argument("--ssh-agent", action="store_true", help=ssh_agent_help)
+    ssh_key_help = "what ssh key to use, you can specify either name (ssh-rsa, ssh-ed25519, ...) or by comment"
+    parser.add_argument("--ssh-key", help=ssh_key_help)
+
+
+def load_config(name, args, formatter):
+    fileName = name
+    if not os.path.isfile(fileName):
+        fileName = ".ftp-%s.json" % fileName
+
+    if not os.path.isfile(fileName):
+        raise MessageException("Configuration file %s doesn't exist" % fileName)
+
+    config = Config()
+    config.parse(fileName)
+
+    if args.threads is not None:
+        config.threads = args.threads
+
+    if args.adaptive:
+        config.adaptive = True
+
+    if args.purge_threads is not None:
+        config.purge_threads = args.purge_threads
+
+    if args.purge_mode is not None:
+        config.purge_mode = args.purge_mode
+
+    if args.bind is not None:
+        config.bind = args.bind
+
+    if args.engine is not None:
+        config.engine = args.engine
+
+    if args.staged:
+        config.staged = True
+
+    if args.verify:
+        config.verify = True
+
+    if args.bootstrap:
+        config.bootstrap = True
+
+    if config.file_log:
+        open_file_log(config, os.path.join(config.local, "%s.log" % os.path.basename(fileName)), formatter)
+
+    if args.use_encryption:
+        config.password_encryption = True
+
+    if args.shared_passphrase:
+        config.shared_passphrase_verify_file = args.shared_passphrase
+
+    return config
+
+
+def unlock_password(config, args, decrypting=False):
+    passphrase = None
+    encrypting = config.password_encryption and config.password is not None
+    need_passphrase = decrypting or encrypting or config.password_encrypted
+
+    if config.password is None and config.password_encrypted is None and config.protocol != "file":
+        config.password = getpass("Password: ")
+
+    if need_passphrase and args.ssh_agent:
+        if args.shared_passphrase is None:
+            raise MessageException(
+                "If your want to use --ssh-agent then you need to also use --shared-passphrase"
+            )
+        passphrase = encryption.decrypt_passphrase_via_ssh_agent(config, args.ssh_key)
+
+    if decrypting:
+        logging.info("Decrypting password...")
+        if config.password is not None:
+            raise MessageException("Password is not encrypted")
+
+    if encrypting:
+        logging.info("Found plaintext password, please provide your passphrase for encryption:")
+        try:
+            encryption.encrypt_config_password(config, passphrase)
+            encryption.save_encrypted_password(config)
+            logging.info("Plaintext password was successfully encrypted")
+        except ImportError:
+            raise MessageException(
+                "Encryption is enabled but cryptography dependency is missing, please install requirements.txt"
+            )
+    elif config.password_encrypted:
+        encryption.decrypt_config_password(config, passphrase)
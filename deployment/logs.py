@@ -0,0 +1,67 @@
+from contextvars import ContextVar
+import logging
+from logging import FileHandler
+
+# coroutines of several targets share thread of one event loop, they carry their target in context
+current_target = ContextVar("target", default=None)
+
+# handlers are kept aside, configuration is sent to scanning processes and has to stay picklable
+file_logs = {}
+
+
+def thread_name(config, role):
+    # threads working for target of fan-out or batch are named after it, so their log lines can be told apart
+    if config.target is None:
+        return None
+    return config.target + ": " + role
+
+
+def target_of(record):
+    target = current_target.get()
+    if target is not None:
+        return target
+    if ": " in record.threadName:
+        return record.threadName.rsplit(": ", 1)[0]
+    return None
+
+
+def open_file_log(config, path, formatter):
+    file = FileHandler(path)
+    file.setLevel(logging.INFO)
+    file.setFormatter(formatter)
+    logging.getLogger().addHandler(file)
+    file_logs[config.file_path] = file
+
+
+def bind_file_log(config, target):
+    # file log of target takes only lines of its own threads, not lines of other targets deployed at once
+    config.target = target
+    if config.file_path in file_logs:
+        file_logs[config.file_path].addFilter(TargetFilter(target))
+
+
+def close_file_log(config):
+    file = file_logs.pop(config.file_path, None)
+    if file is not None:
+        logging.getLogger().removeHandler(file)
+        file.close()
+
+
+class TargetFilter(logging.Filter):
+    def __init__(self, target):
+        super(TargetFilter, self).__init__()
+        self.target = target
+
+    def filter(self, record):
+        return target_of(record) == self.target
+
+
+class TargetFormatter(logging.Formatter):
+    def formatMessage(self, record):
+        target = target_of(record)
+        if target is None:
+            return super(TargetFormatter, self).formatMessage(record)
+
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = "[" + target + "] " + record.message
+        return super(TargetFormatter, self).formatMessage(record)
@@ -0,0 +1,68 @@
+import fnmatch
+import ftplib
+import os
+import re
+
+from deployment.exclusion import Exclusion
+
+
+class PartialPurge:
+    def __init__(self, rules):
+        # key is either extension ("latte") or pattern of changed path matched like ignored paths
+        # ("/app/Modules/Admin/*.latte"), value is path or list of paths to purge which can contain wildcards too
+        self.extensions = {}
+        self.patterns = []
+        for key, targets in rules.items():
+            if isinstance(targets, str):
+                targets = [targets]
+            targets = ["/" + target.lstrip("/") for target in targets]
+
+            if "/" in key or "*" in key:
+                self.patterns.append((Exclusion.analyze("/" + key.lstrip("/")), targets))
+            else:
+                self.extensions[key] = targets
+
+        self.changes = 0
+        self.targets = []
+
+    def add(self, path):
+        # rules stay active for all changed paths, targets are collected only once
+        self.changes += 1
+
+        extension = os.path.splitext(path)[1][1:]
+        if extension and extension in self.extensions:
+            self.extend(self.extensions[extension])
+
+        for (kind, pattern), targets in self.patterns:
+            if Exclusion.matches(kind, pattern, path):
+                self.extend(targets)
+
+    def extend(self, targets):
+        for target in targets:
+            if target not in self.targets:
+                self.targets.append(target)
+
+    def expand(self, ftp, remote, path):
+        # wildcards are resolved by listing, renamed directories of previous purges are never matched
+        if not any(character in path for character in "*?["):
+            return [path]
+
+        current = [""]
+        for component in path.strip("/").split("/"):
+            if not any(character in component for character in "*?["):
+                current = [directory + "/" + component for directory in current]
+                continue
+
+            matched = []
+            for directory in current:
+                try:
+                    names = ftp.list_directory_contents(remote + directory)
+                except ftplib.error_perm:
+                    continue  # directory not exists
+
+                for name in names:
+                    if fnmatch.fnmatchcase(name, component) and not re.search(r"_[0-9]+\.tmp$", name):
+                        matched.append(directory + "/" + name)
+            current = matched
+
+        return current
@@ -0,0 +1,152 @@
+import ftplib
+import logging
+from threading import Condition, Event, Lock, Thread
+
+from deployment.logs import thread_name
+from deployment.transport import create_transport
+
+parked = {}
+parked_lock = Lock()
+
+
+class ConnectionPool:
+    KEEPALIVE = 30
+
+    def __init__(self, config, shared=False):
+        # connections are opened and logged in while local files are scanned, idle ones are kept alive
+        # and handed over to workers of every phase so the first transfer doesn't wait for login,
+        # shared pool leaves its idle connections to next deploy to the same server
+        self.config = config
+        self.shared = shared
+        self.condition = Condition()
+        self.stopped = Event()
+        self.idle = []
+        self.pending = 0
+        self.closed = False
+
+    def start(self, count):
+        with self.condition:
+            self.pending += count
+        Thread(target=self.open_all, args=(count,), name=thread_name(self.config, "connect"), daemon=True).start()
+        Thread(target=self.keep_alive, name=thread_name(self.config, "keep alive"), daemon=True).start()
+
+    def open_all(self, count):
+        reused = unpark(self.config, count) if self.shared else []
+        for ftp in reused:
+            Thread(target=self.check, args=(ftp,), name=thread_name(self.config, "check"), daemon=True).start()
+
+        count -= len(reused)
+        if count > 0 and len(reused) == 0:
+            # first login stores TLS session (or opens SSH transport) which other connections reuse
+            self.open()
+            count -= 1
+        for number in range(count):
+            Thread(target=self.open, name=thread_name(self.config, "connect"), daemon=True).start()
+
+    def open(self):
+        ftp = create_transport(self.config)
+        try:
+            ftp.connect()
+        except Exception as e:
+            # worker connects on its own later and handles error with its usual retry policy
+            logging.info("Pre-connecting failed, reason: " + (str(e) or type(e).__name__))
+            ftp.close()
+            ftp = None
+        self.put(ftp)
+
+    def check(self, ftp):
+        # idle connection could be dropped by server meanwhile, connection left by other deploy
+        # (with the same server and login) continues with configuration of this one
+        ftp.config = self.config
+        try:
+            ftp.noop()
+        except ftplib.all_errors:
+            ftp.close()  # connects again when it's used
+        self.put(ftp)
+
+    def put(self, ftp):
+        # connection which was being opened or kept alive is available again
+        with self.condition:
+            self.pending -= 1
+            if ftp is not None and not self.closed:
+                self.idle.append(ftp)
+                ftp = None
+            self.condition.notify_all()
+
+        if ftp is not None:
+            ftp.close()
+
+    def acquire(self):
+        # pending connection is waited for, otherwise there would be more connections than threads
+        with self.condition:
+            while len(self.idle) == 0 and self.pending > 0:
+                self.condition.wait()
+            if len(self.idle) > 0:
+                return self.idle.pop()
+        return create_transport(self.config)
+
+    def release(self, ftp):
+        with self.condition:
+            if not self.closed:
+                self.idle.append(ftp)
+                self.condition.notify_all()
+                return
+        ftp.close()
+
+    def keep_alive(self):
+        while not self.stopped.wait(self.KEEPALIVE):
+            with self.condition:
+                connections = list(self.idle)
+
+            # connections are checked one by one, the rest stays available to workers meanwhile
+            for ftp in connections:
+                with self.condition:
+                    if self.closed or ftp not in self.idle:
+                        continue  # taken by worker in the meantime
+                    self.idle.remove(ftp)
+                    self.pending += 1
+                self.check(ftp)
+
+    def close(self):
+        self.stopped.set()
+        with self.condition:
+            self.closed = True
+            connections = self.idle
+            self.idle = []
+            self.condition.notify_all()
+
+        if self.shared:
+            park(self.config, connections)
+        else:
+            for ftp in connections:
+                ftp.close()
+
+
+def server_key(config):
+    # connection is logged in already, password isn't kept around with it
+    return (
+        config.protocol, config.host, config.port, config.user, config.secure, config.implicit,
+        config.passive, config.passive_workaround, config.bind
+    )
+
+
+def park(config, connections):
+    with parked_lock:
+        parked.setdefault(server_key(config), []).extend(connections)
+
+
+def unpark(config, count):
+    with parked_lock:
+        connections = parked.get(server_key(config), [])
+        taken = connections[:count]
+        del connections[:count]
+        return taken
+
+
+def close_parked():
+    with parked_lock:
+        connections = [ftp for entries in parked.values() for ftp in entries]
+        parked.clear()
+
+    for ftp in connections:
+        ftp.close()
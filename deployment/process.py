@@ -36,7 +36,9 @@ class Process:
             self.encoding = encoding
 
     def execute(self, input=None, callback=None):
-        self.thread = threading.Thread(target=self.target, args=(input, callback), daemon=True)
+        # output is logged under the name of thread which runs command, it tells target of fan-out or batch
+        name = threading.current_thread().name + " command"
+        self.thread = threading.Thread(target=self.target, args=(input, callback), name=name, daemon=True)
         self.thread.start()
 
         if self.timeout > 0:
@@ -1,55 +1,148 @@
+import collections
 import ftplib
 import logging
-import os
-from queue import Empty
-from queue import Queue
 import sys
-from threading import Thread
+from threading import Condition, Thread
+from timeit import default_timer as timer
 
-from deployment.ftp import Ftp
+from deployment.logs import thread_name
+from deployment.retry import RetryPolicy
+from deployment.transport import create_transport
 from deployment.worker import WorkersState
 
 
 class Purge:
-    TYPE_FILE = "file"
-    TYPE_DIRECTORY = "directory"
-    TYPE_LISTING = "listing"
-    TYPE_UNKNOWN = "unknown"
-
-    queue = Queue()
-    workers = []
-
-    def __init__(self, config):
+    TASK_ROOT = "root"
+    TASK_LISTING = "listing"
+    TASK_FILES = "files"
+    TASK_DIRECTORY = "directory"
+
+    error_missing = [
+        "no such file",
+        "not found",
+        "cannot find",
+        "does not exist",
+        "doesn't exist",
+    ]
+
+    def __init__(self, config, pool=None):
         self.config = config
+        self.pool = pool
         self.shared_state = WorkersState()
+        self.condition = Condition()
+        self.roots = []
+        self.workers = []
+        self.outstanding = 0
 
-    def add(self, path):
-        self.queue.put((path, self.TYPE_UNKNOWN))
+    def add(self, path, directory=False):
+        self.roots.append((path, directory))
 
     def process(self):
-        self.workers = []
+        start = timer()
+        if self.config.protocol == "file":
+            directories, files = self.delete_trees()
+            self.report(directories, files, timer() - start)
+            return directories, files
+
         threads = self.config.threads if self.config.purge_threads is None else self.config.purge_threads
         logging.info("Using " + str(threads) + " threads")
+
+        self.workers = []
         for number in range(threads):
-            worker = Worker(self.queue, self.config, self.shared_state)
+            self.workers.append(Worker(self, number))
+
+        for number, (path, directory) in enumerate(self.roots):
+            self.push(self.workers[number % threads], (self.TASK_ROOT, path, directory))
+
+        for worker in self.workers:
             worker.start()
-            self.workers.append(worker)
 
-        with self.queue.all_tasks_done:
-            while self.queue.unfinished_tasks and self.shared_state.running:
-                try:
-                    self.queue.all_tasks_done.wait(0.1)
-                except TimeoutError:
-                    pass
+        with self.condition:
+            while self.outstanding and self.shared_state.running:
+                self.condition.wait(0.1)
 
-        if self.queue.unfinished_tasks:
+        if self.outstanding:
             logging.error("Worker queue failed to process")
 
         self.shared_state.stop()
+        with self.condition:
+            self.condition.notify_all()
         for worker in self.workers:
             worker.join()
 
-        return self.count()
+        directories, files = self.count()
+        self.report(directories, files, timer() - start)
+        return directories, files
+
+    def push(self, worker, task, directory=None):
+        # directory waits for every task spawned from its listing before it's removed
+        with self.condition:
+            if directory is not None:
+                directory.pending += 1
+            self.outstanding += 1
+            worker.tasks.append(task)
+            self.condition.notify()
+
+    def take(self, worker):
+        # own work is taken depth first, idle worker steals the oldest task of another worker
+        # which is the highest in tree and so has the most work under it
+        with self.condition:
+            while self.shared_state.running:
+                if worker.tasks:
+                    return worker.tasks.pop()
+
+                for offset in range(1, len(self.workers)):
+                    victim = self.workers[(worker.number + offset) % len(self.workers)]
+                    if victim.tasks:
+                        return victim.tasks.popleft()
+
+                self.condition.wait(0.1)
+
+        return None
+
+    def done(self):
+        with self.condition:
+            self.outstanding -= 1
+            if self.outstanding == 0:
+                self.condition.notify_all()
+
+    def release(self, worker, directory):
+        with self.condition:
+            directory.pending -= 1
+            ready = directory.pending == 0
+
+        if ready:
+            self.push(worker, (self.TASK_DIRECTORY, directory.path, directory))
+
+    @classmethod
+    def missing(cls, error):
+        message = str(error).lower()
+        return any(string in message for string in cls.error_missing)
+
+    def delete_trees(self):
+        # local filesystem doesn't need round-trips, whole trees are removed directly
+        filesystem = create_transport(self.config)
+        directories = 0
+        files = 0
+        for path, directory in self.roots:
+            logging.info("Cleaning " + path)
+            if not directory:
+                try:
+                    filesystem.delete_file(path)
+                    files += 1
+                    continue
+                except ftplib.error_perm:
+                    pass
+
+            try:
+                removed = filesystem.delete_tree(path)
+            except ftplib.all_errors as e:
+                logging.warning("Removing " + path + " failed, reason: " + str(e))
+                continue
+            directories += removed[0]
+            files += removed[1]
+
+        return directories, files
 
     def count(self):
         directories = 0
@@ -61,162 +154,208 @@ class Purge:
 
         return directories, files
 
+    def requests(self):
+        if self.config.protocol == "file":
+            return len(self.roots)
+        return sum(worker.requests for worker in self.workers)
+
+    def report(self, directories, files, elapsed):
+        if directories + files > 0:
+            logging.info("Deleted %s objects in %.3f seconds (%.0f objects/s)" % (
+                directories + files, elapsed, (directories + files) / max(elapsed, 0.001)
+            ))
+
+        trees = sum(worker.trees for worker in self.workers)
+        if trees > 0:
+            logging.info("Server removed %s directories recursively in %.3f seconds" % (trees, elapsed))
+
+
+class Directory:
+    def __init__(self, path, parent):
+        self.path = path
+        self.parent = parent
+        self.pending = 1  # own listing
+        self.failed = False
+
 
 class Worker(Thread):
-    running = True
-    directories = 0
-    files = 0
-    not_empty = {}
-
-    def __init__(self, queue, config, shared_state):
-        super(Worker, self).__init__(daemon=True)
-        self.queue = queue
-        self.config = config
-        self.shared_state = shared_state
-        self.ftp = Ftp(self.config)
+    def __init__(self, purge, number):
+        super(Worker, self).__init__(name=thread_name(purge.config, "purge %s" % (number + 1)), daemon=True)
+        self.purge = purge
+        self.number = number
+        self.config = purge.config
+        self.shared_state = purge.shared_state
+        self.tasks = collections.deque()
+        self.directories = 0
+        self.files = 0
+        self.trees = 0
+        self.requests = 0
+        self.pool = purge.pool
+        self.ftp = self.pool.acquire() if self.pool else create_transport(self.config)
+        self.retry_policy = RetryPolicy(self.config)
 
     def run(self):
         try:
-            while self.shared_state.running:
-                try:
-                    parent, type = self.queue.get_nowait()
+            while True:
+                task = self.purge.take(self)
+                if task is None:
+                    break
 
-                    try:
-                        if type is Purge.TYPE_UNKNOWN or type is Purge.TYPE_LISTING:
-                            logging.info("Cleaning " + parent)
-
-                        if type is Purge.TYPE_UNKNOWN:
-                            try:
-                                self.retry(self.ftp.delete_file, {"file": parent}, [
-                                    "invalid argument",
-                                    "operation failed",
-                                    "is a directory",
-                                    "access is denied",
-                                    "cannot find the file",
-                                    "cannot find the path",
-                                ])
-                            except (ExpectedError, EOFError):
-                                type = Purge.TYPE_LISTING
-
-                        elif type is Purge.TYPE_FILE:
-                            try:
-                                self.retry(self.ftp.delete_file, {"file": parent}, [
-                                    "operation failed",
-                                    "access is denied",
-                                    "cannot find the file",
-                                    "cannot find the path",
-                                ])
-                                self.files += 1
-                            except EOFError:
-                                parent = os.path.dirname(parent)
-                                type = Purge.TYPE_LISTING
-                            except ExpectedError:
-                                pass
-
-                        elif type is Purge.TYPE_DIRECTORY:
-                            try:
-                                self.retry(self.ftp.delete_directory, {"directory": parent, "verify": True}, [
-                                    "directory not empty",
-                                    "operation failed",
-                                    "access is denied",
-                                    "directory is not empty",
-                                    "cannot find the file",
-                                    "cannot find the path",
-                                ])
-                                self.directories += 1
-                            except (ExpectedError, EOFError):
-                                if parent not in self.not_empty:
-                                    self.not_empty[parent] = 0
-                                self.not_empty[parent] += 1
-
-                                if self.not_empty[parent] > 5:
-                                    self.not_empty[parent] = -20
-                                    self.queue.put((parent, Purge.TYPE_LISTING))
-                                else:
-                                    self.queue.put((parent, Purge.TYPE_DIRECTORY))
-
-                        if type is Purge.TYPE_LISTING:
-                            parameters = {
-                                "directory": parent,
-                                "extended": True,
-                            }
-                            try:
-                                list = self.retry(self.ftp.list_directory_contents, parameters, [
-                                    "access is denied",
-                                    "cannot find the file",
-                                    "cannot find the path",
-                                ], fallback=[])
-                                for path, kind in list:
-                                    path = parent + "/" + path
-                                    if kind == "file":
-                                        self.queue.put((path, Purge.TYPE_FILE))
-                                    else:
-                                        self.queue.put((path, Purge.TYPE_LISTING))
-
-                                self.queue.put((parent, Purge.TYPE_DIRECTORY))
-                            except EOFError:
-                                pass
-                            except ExpectedError:
-                                pass
-
-                        self.queue.task_done()
-                    except (KeyboardInterrupt, SystemExit):
-                        raise
-                    except ftplib.all_errors as e:
-                        self.ftp.close()
-
-                        logging.exception(e)
-
-                        self.queue.task_done()
-                except Empty:
-                    pass
+                try:
+                    self.process(task)
+                finally:
+                    self.purge.done()
 
         except (KeyboardInterrupt, SystemExit):
             self.shared_state.stop()
+            self.ftp.close()
             raise
         except:
             self.shared_state.stop()
+            self.ftp.close()
             logging.exception(sys.exc_info()[0])
         finally:
-            self.ftp.close()
-            self.running = False
+            if self.pool:
+                self.pool.release(self.ftp)
+            else:
+                self.ftp.close()
 
-    def stop(self):
-        self.running = False
+    def process(self, task):
+        type, path, directory = task
 
-    def retry(self, callable, arguments, expected_error=None, fallback=None):
-        if expected_error and not isinstance(expected_error, list):
-            expected_error = [expected_error]
+        if type == Purge.TASK_ROOT:
+            if not directory:
+                try:
+                    self.retry(self.ftp.delete_file, path)
+                    self.files += 1
+                    return
+                except ftplib.error_perm as e:
+                    if self.purge.missing(e):
+                        return
+                except ftplib.all_errors as e:
+                    logging.warning("Purge of " + path + " failed, reason: " + str(e))
+                    return
 
-        retries = 10
-        while True:
-            try:
-                if arguments:
-                    return callable(**arguments)
-                else:
-                    return callable()
-            except ftplib.all_errors as e:
-                message = str(e).lower()
+            if self.delete_tree(path):
+                return
 
-                if "no such file or directory" in message:
-                    break
+            self.listing(Directory(path, None))
 
-                if expected_error and isinstance(e, ftplib.error_perm):
-                    for string in expected_error:
-                        if string in message:
-                            exception = ExpectedError(e)
-                            exception.error = string
-                            raise exception
+        elif type == Purge.TASK_LISTING:
+            self.listing(directory)
 
-                if isinstance(e, EOFError) or isinstance(e, OSError):
-                    self.ftp.close()
+        elif type == Purge.TASK_FILES:
+            self.delete_files(path, directory)
+            self.purge.release(self, directory)
 
-                retries -= 1
-                if retries == 0:
-                    raise e
+        elif type == Purge.TASK_DIRECTORY:
+            self.delete_directory(directory)
+
+    def delete_tree(self, path):
+        # one command removes whole tree on server, it's deleted object by object when it fails
+        try:
+            if not self.ftp.delete_tree_supported():
+                return False
+
+            logging.info("Removing " + path + " on server")
+            self.retry(self.ftp.delete_tree, path)
+            self.trees += 1
+            return True
+        except ftplib.all_errors as e:
+            logging.info("Recursive removal of " + path + " failed, reason: " + str(e))
+            return False
+
+    def listing(self, directory):
+        # directories and batches of files are queued while listing is still being received,
+        # names already queued are skipped when listing is retried after connection failure
+        logging.info("Cleaning " + directory.path)
+
+        queued = set()
+        files = []
+
+        def entry(name, type):
+            if name in queued:
+                return
+            queued.add(name)
+
+            path = directory.path + "/" + name
+            if type == "dir":
+                self.purge.push(self, (Purge.TASK_LISTING, path, Directory(path, directory)), directory)
+            else:
+                files.append(path)
+                if len(files) >= self.config.pipelining_batch:
+                    self.purge.push(self, (Purge.TASK_FILES, files[:], directory), directory)
+                    del files[:]
+
+        try:
+            self.retry(self.ftp.list_directory_stream, directory.path, entry)
+        except ftplib.all_errors as e:
+            if not self.purge.missing(e):
+                logging.warning("Listing of " + directory.path + " failed, reason: " + str(e))
+                directory.failed = True
+
+        if files:
+            self.purge.push(self, (Purge.TASK_FILES, files, directory), directory)
 
-        return fallback
+        self.purge.release(self, directory)
 
+    def delete_files(self, files, directory):
+        try:
+            if len(files) > 1 and self.ftp.pipelining_supported():
+                errors = self.retry(self.ftp.delete_files, files)
+            else:
+                errors = []
+                for file in files:
+                    try:
+                        self.retry(self.ftp.delete_file, file)
+                        errors.append(None)
+                    except ftplib.error_perm as e:
+                        errors.append(e)
+        except ftplib.all_errors as e:
+            logging.warning("Deleting files in " + directory.path + " failed, reason: " + str(e))
+            directory.failed = True
+            return
+
+        for file, error in zip(files, errors):
+            if error is None:
+                self.files += 1
+            elif not self.purge.missing(error):
+                logging.warning("Deleting " + file + " failed, reason: " + str(error))
+                directory.failed = True
+
+    def delete_directory(self, directory):
+        # listing and all spawned tasks are finished so directory is empty unless something failed
+        try:
+            self.retry(self.ftp.delete_directory, directory.path, True)
+            self.directories += 1
+        except ftplib.all_errors as e:
+            if not directory.failed:
+                logging.warning("Removing " + directory.path + " failed, reason: " + str(e))
+            if directory.parent is not None:
+                directory.parent.failed = True
+
+        if directory.parent is not None:
+            self.purge.release(self, directory.parent)
+
+    def retry(self, callable, *arguments):
+        # rejected requests are final, only broken connections and temporary errors are retried
+        retry = 0
+        while True:
+            self.retry_policy.wait_allowed()
+            self.requests += 1
+            try:
+                result = callable(*arguments)
+                self.retry_policy.success()
+                return result
+            except ftplib.error_perm:
+                self.retry_policy.success()
+                raise
+            except ftplib.all_errors as e:
+                self.ftp.close()
+
+                self.retry_policy.failure(e)
+                if not self.retry_policy.retryable(e, retry):
+                    raise e
 
-class ExpectedError(Exception):
-    error = None
+                self.retry_policy.wait(e, retry)
+                retry += 1
@@ -0,0 +1,70 @@
+import os
+
+
+class RemovalPlan:
+    def __init__(self, to_delete, contents):
+        self.to_delete = to_delete
+        self.contents = contents
+        self.trees = []
+
+    def collapse(self, exclusion, verify=None):
+        # directory removed together with everything indexed under it is removed on server at once,
+        # topmost such directories are kept as trees, rejected tree is tried again by its subdirectories
+        deleted = set(self.to_delete)
+        kept = set()
+        for path in self.contents:
+            if path not in deleted:
+                parent = os.path.dirname(path)
+                while parent not in ("", "/") and parent not in kept:
+                    kept.add(parent)
+                    parent = os.path.dirname(parent)
+
+        candidates = set()
+        for path in self.to_delete:
+            if self.contents[path] is None and path not in kept and not exclusion.has_ignored_inside_relative(path):
+                candidates.add(path)
+
+        self.trees = []
+        pending = [path for path in self.to_delete if path in candidates and
+                   not self.is_inside(os.path.dirname(path), candidates)]
+        while len(pending) > 0:
+            path = pending.pop(0)
+            if verify is None or verify(path):
+                self.trees.append(path)
+            else:
+                pending.extend(child for child in self.to_delete if child in candidates and
+                               os.path.dirname(child) == path)
+        return self.trees
+
+    def collapsed(self):
+        trees = set(self.trees)
+        return len([path for path in self.to_delete if self.is_inside(path, trees)])
+
+    def levels(self):
+        # type of every object is known from index, all files go first and then directories level by level
+        # from the deepest one, objects of one level don't depend on each other and are removed in parallel
+        trees = set(self.trees)
+        files = []
+        directories = {}
+        for path in reversed(self.to_delete):
+            if self.is_inside(path, trees):
+                continue
+
+            if self.contents[path] is None:
+                directories.setdefault(path.count("/"), []).append(path)
+            else:
+                files.append(path)
+
+        levels = []
+        if len(files) > 0:
+            levels.append((False, files))
+        for depth in sorted(directories, reverse=True):
+            levels.append((True, directories[depth]))
+        return levels
+
+    def is_inside(self, path, directories):
+        while path not in ("", "/"):
+            if path in directories:
+                return True
+            path = os.path.dirname(path)
+        return False
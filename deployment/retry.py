@@ -0,0 +1,192 @@
+import ftplib
+import logging
+import random
+from threading import Lock
+from time import time, sleep
+
+
+class RetryPolicy:
+    ERROR_TRANSIENT = "transient"
+    ERROR_PERMISSION = "permission"
+    ERROR_QUOTA = "quota"
+    ERROR_CONNECTION_LIMIT = "connection limit"
+    ERROR_MISSING_PARENT = "missing parent"
+    ERROR_OTHER = "other"
+
+    error_connection_limit = [
+        "user connections allowed at a time",
+        "too many users",
+        "too many connections",
+        "too many open connections",
+    ]
+    error_quota = [
+        "quota",
+        "disk full",
+        "no space left",
+        "insufficient storage",
+        "exceeded storage allocation",
+    ]
+    error_missing_parent = [
+        "could not create file",
+        "no such file or directory",
+        "cannot find the path",
+    ]
+    error_permission = [
+        "permission denied",
+        "access denied",
+        "access is denied",
+        "not allowed",
+        "forbidden",
+    ]
+
+    breakers = {}
+    lock = Lock()
+    generation = None
+
+    def __init__(self, config):
+        self.config = config
+
+        key = "%s@%s:%s" % (config.user, config.host, config.port)
+        with self.lock:
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(key, config.circuit_breaker_threshold, config.circuit_breaker_pause)
+            self.breaker = self.breakers[key]
+
+    def classify(self, error):
+        message = str(error).lower()
+        code = message[:3]
+
+        for string in self.error_connection_limit:
+            if string in message:
+                return self.ERROR_CONNECTION_LIMIT
+
+        if code in ("452", "552") or any(string in message for string in self.error_quota):
+            return self.ERROR_QUOTA
+
+        if isinstance(error, ftplib.error_perm):
+            for string in self.error_missing_parent:
+                if string in message:
+                    return self.ERROR_MISSING_PARENT
+
+            if code in ("530", "532") or any(string in message for string in self.error_permission):
+                return self.ERROR_PERMISSION
+
+            return self.ERROR_OTHER
+
+        # temporary replies, broken or timed out connections and garbled replies
+        return self.ERROR_TRANSIENT
+
+    def retryable(self, error, retry):
+        if retry >= self.config.retry_count:
+            return False
+
+        return self.classify(error) not in (self.ERROR_PERMISSION, self.ERROR_QUOTA)
+
+    def delay(self, error, retry):
+        kind = self.classify(error)
+        if kind == self.ERROR_MISSING_PARENT:
+            return 0  # parent directory is created on next attempt
+
+        delay = min(self.config.retry_delay_max, self.config.retry_delay * (2 ** retry))
+        delay = random.uniform(delay / 2, delay)
+
+        if kind == self.ERROR_CONNECTION_LIMIT:
+            delay = max(delay, self.config.connection_limit_wait)
+
+        return delay
+
+    def wait(self, error, retry):
+        delay = self.delay(error, retry)
+        if delay > 0:
+            logging.info("Waiting %.1f seconds before retry (%s error)" % (delay, self.classify(error)))
+            sleep(delay)
+
+    def success(self):
+        self.breaker.record(True, self.generation)
+
+    def failure(self, error):
+        # only failures caused by server or network state count, rejected requests mean server is responsive
+        success = self.classify(error) not in (self.ERROR_TRANSIENT, self.ERROR_CONNECTION_LIMIT)
+        self.breaker.record(success, self.generation)
+
+    def allowed(self):
+        # outcome is reported with generation in which the request was let through
+        self.generation = self.breaker.allowed()
+        return self.generation is not None
+
+    def wait_allowed(self):
+        while not self.allowed():
+            sleep(0.1)
+
+
+class CircuitBreaker:
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half-open"
+
+    WINDOW = 20
+
+    def __init__(self, name, threshold, pause):
+        self.name = name
+        self.threshold = threshold
+        self.pause = pause
+        self.lock = Lock()
+        self.state = self.STATE_CLOSED
+        self.outcomes = []
+        self.open_until = 0
+        self.probing = False
+        self.generation = 0
+
+    def allowed(self):
+        # returns generation of breaker the request belongs to, None when it has to wait
+        if self.state == self.STATE_CLOSED:
+            return self.generation
+
+        with self.lock:
+            if self.state == self.STATE_OPEN and time() >= self.open_until:
+                logging.info("Circuit breaker for %s is half-open, trying single request" % self.name)
+                self.state = self.STATE_HALF_OPEN
+                self.probing = False
+
+            # probe which didn't report back in time (nothing to process, hung connection) is replaced by another
+            if self.state == self.STATE_HALF_OPEN and (not self.probing or time() >= self.open_until):
+                self.probing = True
+                self.open_until = time() + self.pause
+                self.generation += 1
+                return self.generation
+
+            return self.generation if self.state == self.STATE_CLOSED else None
+
+    def record(self, success, generation):
+        if not self.threshold:
+            return
+
+        with self.lock:
+            if generation != self.generation:
+                return  # request started before breaker opened or probe which was already replaced
+
+            if self.state == self.STATE_HALF_OPEN:
+                if success:
+                    logging.info("Circuit breaker for %s is closed again" % self.name)
+                    self.state = self.STATE_CLOSED
+                    self.outcomes = []
+                else:
+                    self.open()
+                return
+
+            self.outcomes.append(success)
+            if len(self.outcomes) > self.WINDOW:
+                self.outcomes.pop(0)
+
+            failures = self.outcomes.count(False)
+            if failures >= self.threshold and failures * 2 >= len(self.outcomes):
+                self.open()
+
+    def open(self):
+        logging.warning("Circuit breaker for %s is open, pausing all connections for %s seconds" % (
+            self.name, self.pause
+        ))
+        self.state = self.STATE_OPEN
+        self.open_until = time() + self.pause
+        self.outcomes = []
+        self.generation += 1
@@ -9,7 +9,6 @@ from queue import Empty
 import re
 import signal
 import sys
-from time import sleep, time
 
 from deployment.checksum import sha256_checksum
 
@@ -22,29 +21,26 @@ class Scanner:
         self.prefix = None
         self.result = {}
 
-    def scan(self):
-        scan_queue = Manager().Queue()
-        hash_queue = Manager().Queue()
-        result_queue = Manager().Queue()
-        running = Manager().Value(bool, True)
-        running_count = Manager().Value(int, 0)
+    def scan(self, pool=None):
+        shared = pool is not None
+        if not shared:
+            pool = ScannerPool()
 
-        scanning_pool = None
-        hashing_pool = None
+        manager = pool.manager
+        scan_queue = manager.Queue()
+        hash_queue = manager.Queue()
+        result_queue = manager.Queue()
+        running = manager.Value(bool, True)
 
+        tasks = []
         try:
-            worker_count = cpu_count()
-            original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-            scanning_pool = Pool(processes=worker_count, initializer=setup_logging)
-            hashing_pool = Pool(processes=worker_count, initializer=setup_logging)
-            signal.signal(signal.SIGINT, original_sigint_handler)
-            for count in range(0, worker_count):
-                scanning_pool.apply_async(self.scanning_worker, (
-                    running, running_count, scan_queue, hash_queue, result_queue
-                ))
-                hashing_pool.apply_async(self.hashing_worker, (
-                    running, running_count, hash_queue, result_queue
-                ))
+            for count in range(0, pool.worker_count):
+                tasks.append(pool.scanning_pool.apply_async(self.scanning_worker, (
+                    running, scan_queue, hash_queue, result_queue
+                )))
+                tasks.append(pool.hashing_pool.apply_async(self.hashing_worker, (
+                    running, hash_queue, result_queue
+                )))
 
             for root in self.roots:
                 self.prefix = prefix = len(root)
@@ -60,12 +56,12 @@ class Scanner:
                 pass
         finally:
             running.set(False)
-            deadline = time() + 10
-            while running_count.get() > 0 and deadline < time():
-                sleep(0.1)
-            if running_count.get() > 0:
-                scanning_pool.terminate()
-                hashing_pool.terminate()
+            # processes are free once workers of this scan notice it's finished, worker terminated while it still
+            # sends its result would leave the pool locked
+            for task in tasks:
+                task.wait(10)
+            if not shared:
+                pool.close()
 
         keys = list(self.result.keys())
         keys.sort()
@@ -78,9 +74,7 @@ class Scanner:
 
         return ordered
 
-    def scanning_worker(self, running, running_count, scan_queue, hash_queue, result_queue):
-        running_count.set(running_count.get() + 1)
-
+    def scanning_worker(self, running, scan_queue, hash_queue, result_queue):
         try:
             while running.get():
                 try:
@@ -120,11 +114,7 @@ class Scanner:
         except:
             logging.exception(sys.exc_info()[0])
 
-        running_count.set(running_count.get() - 1)
-
-    def hashing_worker(self, running, running_count, hash_queue, result_queue):
-        running_count.set(running_count.get() + 1)
-
+    def hashing_worker(self, running, hash_queue, result_queue):
         try:
             while running.get():
                 try:
@@ -142,7 +132,25 @@ class Scanner:
         except:
             logging.exception(sys.exc_info()[0])
 
-        running_count.set(running_count.get() - 1)
+
+class ScannerPool:
+    def __init__(self):
+        # scanning and hashing processes, batch of projects starts them once and its scans take turns on them
+        self.worker_count = cpu_count()
+        self.manager = Manager()
+
+        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            self.scanning_pool = Pool(processes=self.worker_count, initializer=setup_logging)
+            self.hashing_pool = Pool(processes=self.worker_count, initializer=setup_logging)
+        finally:
+            signal.signal(signal.SIGINT, original_sigint_handler)
+
+    def close(self):
+        self.scanning_pool.terminate()
+        self.hashing_pool.terminate()
+        # unreferenced manager would be shut down by garbage collector in whatever thread runs it, that can hang
+        self.manager.shutdown()
 
 
 def setup_logging():
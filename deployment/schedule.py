@@ -0,0 +1,59 @@
+import os
+from queue import Queue
+from threading import Lock
+
+
+class Schedule(Queue):
+    def __init__(self, uploads, levels, removed, upload_mode, file_mode, directory_mode):
+        # uploads and removals share one queue and one pool of workers, next level of removals is queued
+        # once the previous one is finished and upload of path which changed type waits until
+        # object of the old type is removed
+        super(Schedule, self).__init__()
+        self.lock = Lock()
+        self.levels = []
+        self.outstanding = 0
+        self.blocked = {}
+
+        pending = set()
+        for directory, paths in levels:
+            pending.update(paths)
+            mode = directory_mode if directory else file_mode
+            self.levels.append([{"path": path, "retry": 0, "mode": mode} for path in paths])
+
+        self.next_level()
+
+        for path in uploads:
+            item = {"path": path, "retry": 0, "mode": upload_mode}
+            conflict = self.conflict(path, removed, pending)
+            if conflict is None:
+                self.put(item)
+            else:
+                self.blocked.setdefault(conflict, []).append(item)
+
+    def conflict(self, path, removed, pending):
+        # object of other type removed from the same path or from its parent
+        while path not in ("", "/"):
+            if path in removed and path in pending:
+                return path
+            path = os.path.dirname(path)
+        return None
+
+    def next_level(self):
+        if len(self.levels) > 0:
+            level = self.levels.pop(0)
+            self.outstanding = len(level)
+            for item in level:
+                self.put(item)
+
+    def finished(self, path, removal):
+        # called before task is marked as done so queue never looks empty while something is still waiting
+        if not removal:
+            return
+
+        with self.lock:
+            for item in self.blocked.pop(path, []):
+                self.put(item)
+
+            self.outstanding -= 1
+            if self.outstanding == 0:
+                self.next_level()
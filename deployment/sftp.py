@@ -0,0 +1,534 @@
+import ftplib
+import functools
+from io import BytesIO
+import logging
+import os
+import shlex
+import socket
+import stat
+from threading import Lock
+import uuid
+
+import paramiko
+
+from deployment.config import ConfigException
+from deployment.exceptions import MessageException
+from deployment.ftp import Ftp, DirectoryNotEmptyException, InvalidStateException
+from deployment.hosts import HostCache
+
+transports = {}
+transports_lock = Lock()
+
+delete_hosts = {}
+delete_lock = Lock()
+
+host_keys_lock = Lock()
+
+logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+
+def translate_errors(method):
+    # callers understand ftplib errors and messages, SFTP status codes are mapped to their FTP equivalents
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except paramiko.AuthenticationException as e:
+            self.close()
+            raise ftplib.error_perm("530 " + (str(e) or type(e).__name__))
+        except paramiko.SSHException as e:
+            self.close()
+            raise ftplib.error_temp("421 " + (str(e) or type(e).__name__))
+        except FileNotFoundError as e:
+            raise ftplib.error_perm("550 No such file or directory: " + str(e.strerror))
+        except PermissionError as e:
+            raise ftplib.error_perm("550 Permission denied: " + str(e.strerror))
+        except OSError as e:
+            if type(e) is OSError and e.errno is None:
+                raise ftplib.error_perm("550 Operation failed: " + str(e))
+            raise
+
+    return wrapper
+
+
+class Sftp:
+    BLOCK_SIZE = 32768
+    WINDOW_SIZE = 16777216  # 16 MiB
+
+    sftp = None
+    entry = None
+    mlsd = False
+    wire_bytes = 0
+
+    def __init__(self, config):
+        self.config = config
+
+    @translate_errors
+    def connect(self):
+        if not self.sftp:
+            if not self.config.host:
+                raise ConfigException("host is missing")
+
+            self.entry = self.acquire_transport()
+            try:
+                self.sftp = paramiko.SFTPClient.from_transport(self.entry["transport"])
+            except BaseException:
+                self.release_transport()
+                raise
+            self.sftp.get_channel().settimeout(self.config.timeout)
+
+        return self.sftp
+
+    @translate_errors
+    def noop(self):
+        if self.sftp:
+            self.sftp.stat(".")
+
+    def acquire_transport(self):
+        # all workers share one SSH connection, every worker has its own channel on it,
+        # another connection is opened only when channel limit of server is reached
+        key = (self.config.user, self.config.host, self.config.port)
+        with transports_lock:
+            entries = [entry for entry in transports.get(key, []) if entry["transport"].is_active()]
+            for entry in entries:
+                if entry["channels"] < self.config.sftp_channels:
+                    break
+            else:
+                entry = {"transport": self.open_transport(), "channels": 0}
+                entries.append(entry)
+
+            transports[key] = entries
+            entry["channels"] += 1
+            return entry
+
+    def release_transport(self):
+        if self.entry:
+            with transports_lock:
+                self.entry["channels"] -= 1
+            self.entry = None
+
+    def open_transport(self):
+        parameters = {}
+        if self.config.bind:
+            address = Ftp(self.config).translate_interface_to_address(self.config.bind)
+            parameters["source_address"] = (address, 0)
+
+        sock = socket.create_connection((self.config.host, self.config.port), self.config.timeout, **parameters)
+        if self.config.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        transport = paramiko.Transport(sock, default_window_size=self.WINDOW_SIZE)
+        try:
+            transport.start_client(timeout=self.config.timeout)
+            self.verify_host_key(transport.get_remote_server_key())
+            transport.auth_password(self.config.user, self.config.password)
+        except BaseException:
+            transport.close()
+            raise
+
+        return transport
+
+    def verify_host_key(self, key):
+        name = self.config.host
+        if self.config.port != 22:
+            name = "[%s]:%s" % (self.config.host, self.config.port)
+
+        known = paramiko.HostKeys()
+        path = os.path.expanduser(os.path.join("~", ".ssh", "known_hosts"))
+        if os.path.isfile(path):
+            known.load(path)
+
+        entry = known.lookup(name)
+        if entry is not None and key.get_name() in entry:
+            if entry[key.get_name()] != key:
+                raise MessageException("Host key of %s doesn't match known_hosts, possible man-in-the-middle attack" % (
+                    name
+                ))
+        elif self.config.sftp_accept_new_host:
+            # like StrictHostKeyChecking=accept-new of OpenSSH, key is trusted from now on
+            logging.warning("Host key of %s isn't in known_hosts, adding %s key with fingerprint %s" % (
+                name, key.get_name(), key.fingerprint
+            ))
+            with host_keys_lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a") as file:
+                    file.write("%s %s %s\n" % (name, key.get_name(), key.get_base64()))
+        else:
+            raise MessageException(
+                "Host key of %s isn't in known_hosts, %s fingerprint is %s, add it to known_hosts or enable "
+                "sftp_accept_new_host" % (name, key.get_name(), key.fingerprint)
+            )
+
+    @translate_errors
+    def rename(self, current, new):
+        self.connect()
+
+        self.sftp.rename(current, new)
+
+    @translate_errors
+    def replace(self, current, new):
+        self.connect()
+
+        try:
+            # OpenSSH extension overwrites target atomically, plain rename refuses existing target
+            self.sftp.posix_rename(current, new)
+        except IOError:
+            self.ensure_directory_exists(os.path.dirname(new))
+            try:
+                self.sftp.remove(new)
+            except IOError:
+                pass
+            self.sftp.rename(current, new)
+
+    @translate_errors
+    def create_directory(self, directory, exclusive=False):
+        self.connect()
+
+        try:
+            self.sftp.mkdir(directory)
+        except IOError as e:
+            if exclusive:
+                raise e
+            try:
+                if stat.S_ISDIR(self.sftp.stat(directory).st_mode):
+                    return  # already exists - ignore
+            except IOError:
+                pass
+            raise e
+
+    @translate_errors
+    def chmod(self, path, chmod):
+        self.connect()
+
+        self.sftp.chmod(path, int(str(chmod), 8))
+
+    @translate_errors
+    def upload_file(self, local, remote, callback, ensure_directory=True):
+        self.connect()
+
+        size = os.path.getsize(local)
+        self.wire_bytes = 0
+        try:
+            with open(local, "rb") as file:
+                # putfo writes pipelined, replies are checked when remote file is closed
+                self.sftp.putfo(file, remote, size, self.progress(callback), confirm=False)
+        except FileNotFoundError:
+            if not ensure_directory:
+                raise
+            self.ensure_directory_exists(os.path.dirname(remote))
+            self.upload_file(local, remote, callback, False)
+            return
+
+        self.wire_bytes = size
+
+    @translate_errors
+    def resume_file(self, local, remote, offset, callback):
+        self.connect()
+
+        total = os.path.getsize(local)
+        with open(local, "rb") as file, self.sftp.open(remote, "r+b") as target:
+            file.seek(offset)
+            target.seek(offset)
+            target.set_pipelined(True)
+            while True:
+                data = file.read(self.BLOCK_SIZE)
+                if not data:
+                    break
+                target.write(data)
+                if callback:
+                    callback(len(data))
+        self.wire_bytes = total - offset
+
+        size = self.size(remote)
+        if size != total:
+            raise ftplib.error_temp("451 Resumed upload size mismatch (%s instead of %s)" % (size, total))
+
+    def segmented_upload_supported(self):
+        return False
+
+    def progress(self, callback):
+        if not callback:
+            return None
+
+        state = {"sent": 0}
+
+        def report(sent, total):
+            callback(sent - state["sent"])
+            state["sent"] = sent
+
+        return report
+
+    @translate_errors
+    def size(self, path):
+        self.connect()
+
+        try:
+            return self.sftp.stat(path).st_size
+        except IOError:
+            return None
+
+    def verification_method(self):
+        return "SIZE"
+
+    def verify_files(self, files):
+        # checksum extensions aren't supported by OpenSSH, only size is compared
+        results = []
+        for remote, local, checksum in files:
+            size = self.size(remote)
+            expected = os.path.getsize(local)
+            if size is None:
+                results.append("missing on server")
+            elif size != expected:
+                results.append("size %s instead of %s" % (size, expected))
+            else:
+                results.append(None)
+        return results
+
+    def features(self):
+        return []
+
+    def supports(self, feature):
+        return False
+
+    @translate_errors
+    def ensure_directory_exists(self, path):
+        previous = []
+        for directory in path.split("/"):
+            if directory == "":
+                continue
+
+            previous.append(directory)
+            self.create_directory("/".join(previous))
+
+    def pipelining_supported(self):
+        return False
+
+    def delete_files(self, files):
+        errors = []
+        for file in files:
+            try:
+                self.delete_file(file)
+                errors.append(None)
+            except (ftplib.error_perm, ftplib.error_temp) as e:
+                errors.append(e)
+        return errors
+
+    def delete_directories(self, directories):
+        errors = []
+        for directory in directories:
+            try:
+                self.delete_directory(directory)
+                errors.append(None)
+            except (ftplib.error_perm, ftplib.error_temp) as e:
+                errors.append(e)
+        return errors
+
+    def rename_files(self, pairs):
+        errors = []
+        for current, new in pairs:
+            try:
+                self.rename(current, new)
+                errors.append(None)
+            except (ftplib.error_perm, ftplib.error_temp) as e:
+                errors.append(e)
+        return errors
+
+    def copy_supported(self):
+        return False  # copy-data extension isn't available in paramiko
+
+    def copy_file(self, source, target, ensure_directory=True):
+        raise ftplib.error_perm("502 Copying is not supported")
+
+    @translate_errors
+    def download_file_bytes(self, file):
+        self.connect()
+
+        try:
+            buffer = BytesIO()
+            self.sftp.getfo(file, buffer)
+            return buffer.getvalue()
+        except FileNotFoundError:
+            return None  # not exists - ignore
+        except IOError as e:
+            logging.error("File download failed, reason: " + str(e))
+        return False
+
+    @translate_errors
+    def delete_file(self, file):
+        self.connect()
+
+        self._delete_sanity_check(file)
+
+        self.sftp.remove(file)
+
+    @translate_errors
+    def delete_file_or_directory(self, target):
+        self.connect()
+
+        self._delete_sanity_check(target)
+
+        try:
+            self.sftp.remove(target)
+        except IOError:
+            try:
+                self.sftp.rmdir(target)
+            except FileNotFoundError:
+                return  # directory not exists
+            except IOError as e:
+                if e.errno is None:
+                    raise DirectoryNotEmptyException("Directory not empty '%s' " % target)
+                raise e
+
+    @translate_errors
+    def delete_directory(self, directory, verify=False):
+        self.connect()
+
+        self._delete_sanity_check(directory)
+
+        try:
+            self.sftp.rmdir(directory)
+        except IOError:
+            if not verify:
+                raise
+            try:
+                self.sftp.stat(directory)
+            except FileNotFoundError:
+                return
+            raise
+
+    def delete_tree_supported(self):
+        if not self.config.server_delete:
+            return False
+
+        key = (self.config.user, self.config.host, self.config.port)
+        with delete_lock:
+            if key not in delete_hosts:
+                hosts = HostCache(self.config)
+                supported = hosts.get("delete_tree")
+                if supported is None:
+                    supported = self.probe_delete_tree()
+                    if supported is None:
+                        # probe failed for other reason than missing support, try it again next time
+                        logging.info("Detecting recursive removal of directories failed")
+                        supported = False
+                    else:
+                        hosts.set("delete_tree", supported)
+                        logging.info("Server %s recursive removal of directories" % (
+                            "supports" if supported else "doesn't support"
+                        ))
+                delete_hosts[key] = supported
+
+        return delete_hosts[key]
+
+    def probe_delete_tree(self):
+        # shell has to be available and has to see the same paths as SFTP (chroot of internal-sftp doesn't apply
+        # to it), so it has to remove marker directory created over SFTP, only definitive answer is returned,
+        # None when probe itself failed
+        marker = (self.config.remote or ".") + "/.deployment-probe-" + uuid.uuid4().hex
+        try:
+            self.create_directory(marker)
+        except ftplib.all_errors:
+            return None
+
+        try:
+            if self.execute("rm -r -- " + shlex.quote(marker)) != 0:
+                return False
+            return self.size(marker) is None
+        except ftplib.error_perm:
+            return False
+        except (paramiko.SSHException,) + ftplib.all_errors:
+            return None  # channel couldn't be opened (channel limit, timeout), it says nothing about support
+        finally:
+            try:
+                self.sftp.rmdir(marker)
+            except IOError:
+                pass
+
+    def execute(self, command):
+        # exec channel counts towards channel limit of server like SFTP channels of workers
+        entry = self.acquire_transport()
+        try:
+            channel = entry["transport"].open_session(timeout=self.config.timeout)
+            try:
+                try:
+                    channel.exec_command(command)
+                except paramiko.SSHException as e:
+                    raise ftplib.error_perm("502 Command execution was refused: " + (str(e) or type(e).__name__))
+                return channel.recv_exit_status()
+            finally:
+                channel.close()
+        finally:
+            with transports_lock:
+                entry["channels"] -= 1
+
+    @translate_errors
+    def delete_tree(self, directory):
+        # server doesn't report how many objects it removed
+        if not self.delete_tree_supported():
+            raise ftplib.error_perm("502 Recursive removal is not supported")
+
+        self._delete_sanity_check(directory)
+
+        status = self.execute("rm -rf -- " + shlex.quote(directory))
+        if status != 0:
+            raise ftplib.error_perm("550 Recursive removal failed with exit status %s" % status)
+
+    def _delete_sanity_check(self, path):
+        if ".." in path:
+            raise InvalidStateException("dot directory detected")
+
+    @translate_errors
+    def list_directory_contents(self, directory, extended=False):
+        self.connect()
+
+        objects = []
+        for attributes in self.sftp.listdir_attr(directory):
+            name = attributes.filename
+            if name == "." or name == "..":
+                continue
+
+            if extended:
+                objects.append((name, "dir" if stat.S_ISDIR(attributes.st_mode) else "file"))
+            else:
+                objects.append(name)
+
+        return objects
+
+    @translate_errors
+    def list_directory_stream(self, directory, callback):
+        self.connect()
+
+        # listdir_iter keeps several READDIR requests in flight and yields entries as they arrive
+        for attributes in self.sftp.listdir_iter(directory):
+            name = attributes.filename
+            if name == "." or name == "..":
+                continue
+
+            callback(name, "dir" if stat.S_ISDIR(attributes.st_mode) else "file")
+
+    @translate_errors
+    def list_directory_details(self, directory):
+        self.connect()
+
+        objects = []
+        for attributes in self.sftp.listdir_attr(directory):
+            name = attributes.filename
+            if name == "." or name == "..":
+                continue
+
+            type = "dir" if stat.S_ISDIR(attributes.st_mode) else "file"
+            objects.append((name, type, attributes.st_size, attributes.st_mtime))
+
+        return objects
+
+    def close(self):
+        if self.sftp:
+            try:
+                self.sftp.close()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception:
+                pass
+            finally:
+                self.sftp = None
+                self.release_transport()
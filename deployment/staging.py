@@ -0,0 +1,41 @@
+import ftplib
+import hashlib
+import logging
+
+from deployment.purge import Purge
+
+
+class Staging:
+    DIRECTORY_NAME = "/.deployment-staging"
+
+    def __init__(self, config, ftp):
+        self.config = config
+        self.ftp = ftp
+        self.paths = []
+
+        if self.config.staging_directory:
+            self.directory = self.config.staging_directory.rstrip("/")
+        else:
+            self.directory = self.config.remote + self.DIRECTORY_NAME
+
+    def prepare(self):
+        try:
+            orphans = self.ftp.list_directory_contents(self.directory)
+        except ftplib.error_perm:
+            orphans = []
+            self.ftp.close()
+            self.ftp.ensure_directory_exists(self.directory)
+
+        if len(orphans) > 0:
+            logging.info("Removing " + str(len(orphans)) + " orphaned staging files from previous run")
+            purge = Purge(self.config)
+            for name in orphans:
+                purge.add(self.directory + "/" + name)
+            purge.process()
+
+    def staged_path(self, path):
+        name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return self.directory + "/" + name
+
+    def add(self, path):
+        self.paths.append(path)
@@ -0,0 +1,37 @@
+from threading import Lock
+
+
+class Statistics:
+    def __init__(self):
+        self.values = {}
+        self.lock = Lock()
+
+    def add(self, name, value=1):
+        self.lock.acquire()
+        self.values[name] = self.values.get(name, 0) + value
+        self.lock.release()
+
+    def set(self, name, value):
+        self.lock.acquire()
+        self.values[name] = value
+        self.lock.release()
+
+    def get(self, name, default=0):
+        self.lock.acquire()
+        try:
+            return self.values.get(name, default)
+        finally:
+            self.lock.release()
+
+
+def format_size(size):
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = "TiB"
+
+    if unit == "B":
+        return "%d %s" % (size, unit)
+    return "%.2f %s" % (size, unit)
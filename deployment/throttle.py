@@ -0,0 +1,21 @@
+from threading import Lock
+from time import sleep
+from timeit import default_timer as timer
+
+
+class Throttle:
+    def __init__(self, rate):
+        # rate in bytes per second shared by all workers (of all targets), block which was just sent
+        # takes next free time slot and its sender waits until that slot ends
+        self.rate = rate
+        self.lock = Lock()
+        self.next = timer()
+
+    def consume(self, length):
+        with self.lock:
+            now = timer()
+            self.next = max(self.next, now) + length / self.rate
+            delay = self.next - now
+
+        if delay > 0:
+            sleep(delay)
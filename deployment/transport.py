@@ -0,0 +1,17 @@
+from deployment.exceptions import MessageException
+from deployment.filesystem import Filesystem
+from deployment.ftp import Ftp
+
+
+def create_transport(config):
+    if config.protocol == "sftp":
+        try:
+            from deployment.sftp import Sftp
+        except ImportError as e:
+            raise MessageException("SFTP requires paramiko, install it with pip install -r requirements.txt (%s)" % e)
+        return Sftp(config)
+
+    if config.protocol == "file":
+        return Filesystem(config)
+
+    return Ftp(config)
@@ -0,0 +1,196 @@
+import ftplib
+import json
+import logging
+from logging import FileHandler
+import os
+import re
+import subprocess
+import sys
+import time
+
+from deployment.config import Config
+from deployment.purge import Purge
+from deployment.transport import create_transport
+
+
+class Trash:
+    MODE_FOREGROUND = "foreground"
+    MODE_BACKGROUND = "background"
+    MODE_DEFERRED = "deferred"
+
+    LOCK_NAME = "/.deployment-purge.lock"
+    log_path = os.path.join(os.path.expanduser("~"), ".ftp-deploy", "purge.log")
+
+    # only connection and purge settings are passed to background process, not the whole project configuration
+    config_fields = [
+        "name", "protocol", "host", "port", "user", "password", "remote", "secure", "implicit", "passive",
+        "passive_workaround", "bind", "send_buffer", "nodelay", "buffer_size", "compression", "pipelining",
+        "pipelining_batch", "server_copy", "server_delete", "sftp_channels", "sftp_accept_new_host", "timeout",
+        "connection_limit_wait", "retry_count", "retry_delay", "retry_delay_max", "circuit_breaker_threshold",
+        "circuit_breaker_pause", "threads", "purge_threads", "purge_lock_timeout",
+    ]
+
+    def __init__(self, config, ftp, pool=None):
+        self.config = config
+        self.ftp = ftp
+        self.pool = pool
+        self.lock_path = self.config.remote + self.LOCK_NAME
+
+    def find(self, paths):
+        # purged directories renamed by previous runs which weren't deleted yet (deferred, interrupted or locked)
+        base_folders = {}
+        for path in paths:
+            current = self.config.remote + path
+            base = os.path.dirname(current)
+            if base not in base_folders:
+                base_folders[base] = []
+            if os.path.basename(current) not in base_folders[base]:
+                base_folders[base].append(os.path.basename(current))
+
+        trash = []
+        for base, names in base_folders.items():
+            try:
+                objects = self.ftp.list_directory_contents(base)
+            except ftplib.error_perm as e:
+                if str(e).startswith("550"):  # directory not exists
+                    continue
+                raise e
+
+            for object in objects:
+                for name in names:
+                    if re.search(r"^" + re.escape(name) + r"_[0-9]+\.tmp$", object):
+                        trash.append(base + "/" + object)
+
+        return trash
+
+    def delete(self, trash):
+        # returns None when other deploy is deleting trash at the moment
+        if not self.lock():
+            return None
+
+        try:
+            purge = Purge(self.config, self.pool)
+            for path in trash:
+                purge.add(path, True)
+            return purge.process()
+        finally:
+            self.unlock()
+
+    def spawn(self, trash):
+        # rename already invalidated caches, deletion of renamed trees doesn't need to hold up deploy,
+        # connection settings are passed through pipe so password doesn't have to be entered or decrypted again
+        parameters = {}
+        if os.name == "nt":
+            parameters["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            parameters["start_new_session"] = True
+
+        process = subprocess.Popen(
+            [sys.executable, "-m", "deployment.trash"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            **parameters
+        )
+        config = dict((field, getattr(self.config, field)) for field in self.config_fields)
+        process.stdin.write(json.dumps({"config": config, "trash": trash}).encode("utf-8"))
+        process.stdin.close()
+
+        return process.pid
+
+    def lock(self):
+        # directory creation is atomic on every transport, lock left by crashed process expires,
+        # its creation time is kept as name of directory inside since LIST doesn't have reliable modification time
+        if self.retry_lock(False):
+            return True
+
+        modified = None
+        name = os.path.basename(self.lock_path)
+        for entry in self.ftp.list_directory_details(os.path.dirname(self.lock_path) or "/"):
+            if entry[0] == name:
+                modified = entry[3]
+                break
+        else:
+            return self.retry_lock()  # released meanwhile
+
+        stamps = self.stamps()
+        if len(stamps) > 0:
+            modified = max(stamps)
+        elif modified is None:
+            # lock without any time (crashed right after it was created) expires from now on
+            self.stamp()
+            modified = time.time()
+
+        if time.time() - modified < self.config.purge_lock_timeout:
+            logging.info("Trash is being deleted by other deploy (remove %s if it isn't)" % self.lock_path)
+            return False
+
+        logging.warning("Removing stale purge lock " + self.lock_path)
+        try:
+            self.remove_lock()
+        except ftplib.error_perm:
+            pass
+        return self.retry_lock()
+
+    def retry_lock(self, report=True):
+        try:
+            self.ftp.create_directory(self.lock_path, exclusive=True)
+        except ftplib.error_perm:
+            if report:
+                logging.info("Trash is being deleted by other deploy")
+            return False
+
+        self.stamp()
+        return True
+
+    def stamp(self):
+        try:
+            self.ftp.create_directory("%s/%d" % (self.lock_path, time.time()))
+        except ftplib.all_errors as e:
+            logging.warning("Failed to stamp purge lock " + self.lock_path + ", reason: " + str(e))
+
+    def stamps(self):
+        try:
+            entries = self.ftp.list_directory_details(self.lock_path)
+        except ftplib.all_errors:
+            return []
+        return [int(entry[0]) for entry in entries if entry[0].isdigit()]
+
+    def remove_lock(self):
+        for stamp in self.stamps():
+            self.ftp.delete_directory("%s/%d" % (self.lock_path, stamp), True)
+        self.ftp.delete_directory(self.lock_path, True)
+
+    def unlock(self):
+        try:
+            self.remove_lock()
+        except ftplib.all_errors as e:
+            logging.warning("Failed to remove purge lock " + self.lock_path + ", reason: " + str(e))
+
+
+def main():
+    data = json.load(sys.stdin.buffer)
+    config = Config()
+    for field, value in data["config"].items():
+        setattr(config, field, value)
+    trash = data["trash"]
+
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    os.makedirs(os.path.dirname(Trash.log_path), exist_ok=True)
+    file = FileHandler(Trash.log_path)
+    file.setFormatter(logging.Formatter("%(asctime)s - %(process)d - %(levelname)s - %(message)s"))
+    logger.addHandler(file)
+
+    ftp = create_transport(config)
+    try:
+        logging.info("Deleting %s trash directories of %s" % (len(trash), config.name))
+        if Trash(config, ftp).delete(trash) is not None:
+            logging.info("Purging done")
+    except:
+        logging.exception(sys.exc_info()[0])
+    finally:
+        ftp.close()
+
+
+if __name__ == "__main__":
+    main()
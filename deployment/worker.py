@@ -6,12 +6,21 @@ import sys
 from threading import Thread
 from time import time, sleep
 
-from deployment.ftp import Ftp
+from deployment.logs import thread_name
+from deployment.retry import RetryPolicy
+from deployment.schedule import Schedule
+from deployment.statistics import format_size
+from deployment.transport import create_transport
 
 
 class Worker(Thread):
     MODE_UPLOAD = "upload"
     MODE_REMOVE = "remove"
+    MODE_REMOVE_DIRECTORY = "remove directory"
+    MODE_COMMIT = "commit"
+    MODE_MOVE = "move"
+    MODE_COPY = "copy"
+    MODE_VERIFY = "verify"
 
     running = True
     mode = None
@@ -22,9 +31,12 @@ class Worker(Thread):
     next_percent_update = 0
     phase = "init"
     local_counter = 0
+    postponed = None
 
-    def __init__(self, queue, config, counter, index, failed, mode, mapping, state):
-        super(Worker, self).__init__(daemon=True)
+    def __init__(self, queue, config, counter, index, failed, mode, mapping, state, staging=None, statistics=None,
+                 controller=None, number=0, moves=None, copies=None,
+                 mismatches=None, pool=None, throttle=None):
+        super(Worker, self).__init__(name=thread_name(config, "worker %s" % (number + 1)), daemon=True)
 
         self.queue = queue
         self.failed = failed
@@ -34,108 +46,523 @@ class Worker(Thread):
         self.index = index
         self.mapping = mapping
         self.shared_state = state
-        self.ftp = Ftp(self.config)
+        self.staging = staging
+        self.statistics = statistics
+        self.controller = controller
+        self.number = number
+        self.moves = moves if moves is not None else {}
+        self.copies = copies if copies is not None else {}
+        self.mismatches = mismatches if mismatches is not None else []
+        self.pool = pool
+        self.throttle = throttle
+        self.ftp = pool.acquire() if pool else create_transport(self.config)
+        self.retry_policy = RetryPolicy(self.config)
 
     def run(self):
         try:
             while self.shared_state.running:
-                try:
-                    self.phase = "fetch"
-                    value = self.queue.get_nowait()
-                    if type(value) is dict:
-                        path = value["path"]
-                        retry = value["retry"]
-                    else:
-                        path = value
-                        retry = 0
-                    try:
-                        if path:
-                            if self.mode == self.MODE_UPLOAD:
-                                if retry > 0:
-                                    counter = str(retry) + " of " + str(self.config.retry_count)
-                                    self.prefix = "Retrying to upload (" + counter + ") " + path
-                                    logging.info(self.prefix)
-                                else:
-                                    self.prefix = "Uploading (" + self.counter.counter() + ") " + path
-                                    logging.info(self.prefix)
-
-                                self.phase = "upload"
-                                self.upload(path)
-
-                                self.phase = "index"
-                                self.index.write(path)
-
-                            elif self.mode == self.MODE_REMOVE:
-                                if retry > 0:
-                                    counter = str(retry) + " of " + str(self.config.retry_count)
-                                    logging.info("Retrying to remove (" + counter + ") " + path)
-                                else:
-                                    logging.info("Removing (" + self.counter.counter() + ") " + path)
-
-                                self.phase = "delete"
-                                self.ftp.delete_file_or_directory(self.config.remote + path)
-
-                        self.phase = "done"
+                if self.controller and not self.controller.allowed(self.number):
+                    if self.postponed is not None:
+                        self.queue.put(self.postponed)
                         self.queue.task_done()
-                        self.local_counter += 1
-                    except ftplib.all_errors as e:
-                        self.phase = "error"
-                        message = str(e)
-                        logging.warning("Upload of " + path + " failed, will retry later, reason: " + message)
-                        if "user connections allowed at a time" in message:
-                            if self.config.connection_limit_wait > 0:
-                                logging.warning(
-                                    "Connection limit reached, will now wait for %s seconds" %
-                                    self.config.connection_limit_wait
-                                )
-                                sleep(self.config.connection_limit_wait)
-
-                        if retry < self.config.retry_count:
-                            self.queue.put({
-                                "path": path,
-                                "retry": retry + 1,
-                            })
-                        else:
-                            logging.exception(e)
-                            self.failed.put(self.mode + " " + path + " (" + message + ")")
-
-                        self.phase = "close"
+                        self.postponed = None
+                    if self.phase != "idle":
                         self.ftp.close()
+                        self.phase = "idle"
+                    sleep(0.1)
+                    continue
 
-                        self.queue.task_done()
+                if not self.retry_policy.allowed():
+                    self.phase = "paused"
+                    sleep(0.1)
+                    continue
+
+                try:
+                    self.phase = "fetch"
+                    if self.postponed is not None:
+                        value = self.postponed
+                        self.postponed = None
+                    else:
+                        value = self.queue.get(timeout=0.1)
+                    if type(value) is dict and "mode" in value:
+                        self.mode = value["mode"]
+                    if self.mode == self.MODE_VERIFY:
+                        for value in self.verify_batch(self.prefetch(value)):
+                            self.process(value)
+                    elif self.config.pipelining and self.mode in [
+                        self.MODE_REMOVE, self.MODE_REMOVE_DIRECTORY, self.MODE_COMMIT, self.MODE_MOVE, self.MODE_COPY
+                    ]:
+                        for value in self.process_pipelined(self.prefetch(value)):
+                            self.process(value)
+                    else:
+                        self.process(value)
                 except Empty:
                     pass
         except (KeyboardInterrupt, SystemExit):
             self.shared_state.stop()
+            self.ftp.close()
         except:
             self.shared_state.stop()
+            self.ftp.close()
             logging.exception(sys.exc_info()[0])
         finally:
-            self.ftp.close()
+            self.release()
             self.running = False
 
-    def upload(self, remote):
-        local = self.apply_mapping(remote)
-        if local == remote:
+    def process(self, value):
+        if type(value) is dict:
+            path = value["path"]
+            retry = value["retry"]
+        else:
+            path = value
+            retry = 0
+        try:
+            if path:
+                if self.mode == self.MODE_UPLOAD:
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        self.prefix = "Retrying to upload (" + counter + ") " + path
+                        logging.info(self.prefix)
+                    else:
+                        self.prefix = "Uploading (" + self.counter.counter() + ") " + path
+                        logging.info(self.prefix)
+
+                    self.phase = "upload"
+                    if self.upload(path, retry):
+                        self.staging.add(path)
+                    else:
+                        self.phase = "index"
+                        self.index.write(path)
+
+                elif self.mode in (self.MODE_REMOVE, self.MODE_REMOVE_DIRECTORY):
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        logging.info("Retrying to remove (" + counter + ") " + path)
+                    else:
+                        logging.info("Removing (" + self.counter.counter() + ") " + path)
+
+                    self.phase = "delete"
+                    self.remove(path)
+
+                elif self.mode == self.MODE_COMMIT:
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        logging.info("Retrying to commit (" + counter + ") " + path)
+                    else:
+                        logging.info("Committing (" + self.counter.counter() + ") " + path)
+
+                    self.phase = "commit"
+                    if path in self.moves:
+                        self.move(path)
+                    else:
+                        self.ftp.replace(self.staging.staged_path(path), self.config.remote + path)
+
+                    self.phase = "index"
+                    self.index.write(path)
+
+                elif self.mode == self.MODE_MOVE:
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        logging.info("Retrying to move (" + counter + ") " + self.moves[path] + " to " + path)
+                    else:
+                        logging.info("Moving (" + self.counter.counter() + ") " + self.moves[path] + " to " + path)
+
+                    self.phase = "move"
+                    self.move(path)
+
+                    self.phase = "index"
+                    self.index.write(path)
+
+                elif self.mode == self.MODE_COPY:
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        self.prefix = "Retrying to copy (" + counter + ") " + self.copies[path] + " to " + path
+                    else:
+                        self.prefix = "Copying (" + self.counter.counter() + ") " + self.copies[path] + " to " + path
+                    logging.info(self.prefix)
+
+                    self.phase = "copy"
+                    if self.copy(path):
+                        self.staging.add(path)
+                    else:
+                        self.phase = "index"
+                        self.index.write(path)
+
+                elif self.mode == self.MODE_VERIFY:
+                    if retry > 0:
+                        counter = str(retry) + " of " + str(self.config.retry_count)
+                        logging.info("Retrying to verify (" + counter + ") " + path)
+                    else:
+                        logging.info("Verifying (" + self.counter.counter() + ") " + path)
+
+                    self.phase = "verify"
+                    self.record_verification(path, self.ftp.verify_files([self.verified_file(path)])[0])
+
+            self.phase = "done"
+            self.complete(path)
+            self.queue.task_done()
+            self.local_counter += 1
+            self.retry_policy.success()
+
+            if self.controller:
+                self.statistics.add("completed")
+                self.controller.update()
+        except ftplib.all_errors as e:
+            self.phase = "error"
+            message = str(e) or type(e).__name__
+            kind = self.retry_policy.classify(e)
+            self.retry_policy.failure(e)
+            if self.controller and (kind == RetryPolicy.ERROR_CONNECTION_LIMIT or isinstance(e, TimeoutError)):
+                self.controller.backoff(message)
+
+            self.phase = "close"
+            self.ftp.close()
+
+            if self.retry_policy.retryable(e, retry):
+                logging.warning("Upload of " + path + " failed, will retry later, reason: " + message)
+                self.phase = "backoff"
+                self.retry_policy.wait(e, retry)
+                self.queue.put({
+                    "path": path,
+                    "retry": retry + 1,
+                    "mode": self.mode,
+                })
+            else:
+                logging.error("Upload of " + path + " failed (" + kind + " error), reason: " + message)
+                self.failed.put(self.mode + " " + path + " (" + message + ")")
+                self.complete(path)
+
+            self.queue.task_done()
+
+    def prefetch(self, value):
+        # item of other mode from combined schedule is kept for next round
+        values = [value]
+        while len(values) < self.config.pipelining_batch:
+            try:
+                value = self.queue.get_nowait()
+            except Empty:
+                break
+            if type(value) is dict and value.get("mode", self.mode) != self.mode:
+                self.postponed = value
+                break
+            values.append(value)
+        return values
+
+    def release(self):
+        # connection is handed over to workers of next phase
+        if self.pool:
+            self.pool.release(self.ftp)
+        else:
+            self.ftp.close()
+
+    def retried(self, value):
+        return type(value) is dict and value["retry"] > 0
+
+    def complete(self, path):
+        if isinstance(self.queue, Schedule):
+            self.queue.finished(path, self.mode != self.MODE_UPLOAD)
+
+    def process_pipelined(self, values):
+        # first attempts are sent in one batch, failed and retried items continue one by one
+        batch = []
+        remaining = []
+        for value in values:
+            if self.retried(value):
+                remaining.append(value)
+            else:
+                batch.append(value["path"] if type(value) is dict else value)
+
+        if len(batch) < 2:
+            return values
+
+        try:
+            if not self.ftp.pipelining_supported():
+                return values
+
+            self.phase = "pipeline"
+            if self.mode == self.MODE_REMOVE:
+                errors = self.ftp.delete_files([self.config.remote + path for path in batch])
+            elif self.mode == self.MODE_REMOVE_DIRECTORY:
+                errors = self.ftp.delete_directories([self.config.remote + path for path in batch])
+            elif self.mode == self.MODE_COPY:
+                sources = {}
+                for path in batch:
+                    sources[path] = self.copy_source(path)
+                remaining += [path for path in batch if sources[path] is None]
+                batch = [path for path in batch if sources[path] is not None]
+                errors = self.ftp.copy_files([(sources[path], self.copy_target(path)) for path in batch])
+            else:
+                errors = self.ftp.rename_files([
+                    (self.rename_source(path), self.config.remote + path) for path in batch
+                ])
+        except ftplib.all_errors as e:
+            logging.warning("Pipelined commands failed, continuing one by one, reason: " + str(e))
+            self.ftp.close()
+            return values
+
+        if self.mode in (self.MODE_REMOVE, self.MODE_REMOVE_DIRECTORY):
+            self.statistics.add("removal_requests")
+
+        for path, error in zip(batch, errors):
+            if error is not None:
+                remaining.append(path)
+                continue
+
+            if self.mode in (self.MODE_REMOVE, self.MODE_REMOVE_DIRECTORY):
+                logging.info("Removing (" + self.counter.counter() + ") " + path)
+                self.statistics.add("removed_objects")
+            elif self.mode == self.MODE_COPY:
+                logging.info("Copying (" + self.counter.counter() + ") " + self.copies[path] + " to " + path)
+                self.record_copy(path)
+                if self.staging:
+                    self.staging.add(path)
+                else:
+                    self.index.write(path)
+            else:
+                if self.mode == self.MODE_MOVE:
+                    logging.info("Moving (" + self.counter.counter() + ") " + self.moves[path] + " to " + path)
+                else:
+                    logging.info("Committing (" + self.counter.counter() + ") " + path)
+                if path in self.moves:
+                    self.record_move(path)
+                self.index.write(path)
+
+            self.complete(path)
+            self.queue.task_done()
+            self.local_counter += 1
+            self.retry_policy.success()
+
+            if self.controller:
+                self.statistics.add("completed")
+                self.controller.update()
+
+        return remaining
+
+    def verify_batch(self, values):
+        # whole batch is checked at once, retried items and batch which failed continue one by one
+        batch = [value for value in values if not self.retried(value)]
+        remaining = [value for value in values if self.retried(value)]
+        if len(batch) < 2:
+            return values
+
+        try:
+            self.phase = "verify"
+            results = self.ftp.verify_files([self.verified_file(path) for path in batch])
+        except ftplib.all_errors as e:
+            logging.warning("Verification of batch failed, continuing one by one, reason: " + str(e))
+            self.ftp.close()
+            return values
+
+        for path, result in zip(batch, results):
+            logging.info("Verifying (" + self.counter.counter() + ") " + path)
+            self.record_verification(path, result)
+
+            self.queue.task_done()
+            self.local_counter += 1
+            self.retry_policy.success()
+
+            if self.controller:
+                self.statistics.add("completed")
+                self.controller.update()
+
+        return remaining
+
+    def verified_file(self, path):
+        return self.config.remote + path, self.local_path(path), self.index.hashes.get(path)
+
+    def record_verification(self, path, mismatch):
+        if mismatch is not None:
+            logging.warning("Verification of " + path + " failed: " + mismatch)
+            self.mismatches.append(path)
+        if self.statistics:
+            self.statistics.add("verified_files")
+
+    def remove(self, path):
+        # type of object is known from index so file isn't tried as directory, children of directory
+        # were removed on previous level and whatever is left there wasn't deployed so it isn't retried
+        remote = self.config.remote + path
+        self.statistics.add("removal_requests")
+        try:
+            if self.mode == self.MODE_REMOVE_DIRECTORY:
+                self.ftp.delete_directory(remote, True)
+            else:
+                self.ftp.delete_file(remote)
+        except ftplib.error_perm as e:
+            if self.mode == self.MODE_REMOVE_DIRECTORY:
+                logging.error("Removing of " + path + " failed, reason: " + str(e))
+                self.failed.put(self.mode + " " + path + " (" + str(e) + ")")
+                return
+            # file which is already gone counts as removed, SIZE can't tell that when server doesn't support it
+            from deployment.purge import Purge
+            if not Purge.missing(e):
+                raise
+
+        self.statistics.add("removed_objects")
+
+    def rename_source(self, path):
+        if path in self.moves:
+            return self.config.remote + self.moves[path]
+        return self.staging.staged_path(path)
+
+    def move(self, path):
+        try:
+            self.ftp.replace(self.config.remote + self.moves[path], self.config.remote + path)
+        except ftplib.error_perm as e:
+            # original is gone or can't be renamed, content still has to get to new path
+            logging.warning("Moving " + self.moves[path] + " failed, uploading " + path + " instead, reason: " + str(e))
+            self.upload(path, direct=True)
+            return
+
+        self.record_move(path)
+
+    def record_move(self, path):
+        if self.statistics:
+            self.statistics.add("moved_files")
+            self.statistics.add("moved_bytes", os.path.getsize(self.local_path(path)))
+
+    def copy(self, path):
+        source = self.copy_source(path)
+        try:
+            if source is None:
+                raise ftplib.error_perm("550 Source " + self.copies[path] + " wasn't uploaded")
+            self.ftp.copy_file(source, self.copy_target(path))
+        except ftplib.error_perm as e:
+            logging.warning("Copying " + self.copies[path] + " failed, uploading " + path + " instead, reason: " +
+                            str(e))
+            return self.upload(path)
+
+        self.record_copy(path)
+        return self.staging is not None
+
+    def copy_source(self, path):
+        # unchanged file is already in place, source uploaded in this deploy is usable only once its upload succeeded
+        source = self.copies[path]
+        if self.index.is_written(source):
+            return self.config.remote + source
+        if self.staging:
+            return self.staging.staged_path(source)
+        return None
+
+    def copy_target(self, path):
+        if self.staging:
+            return self.staging.staged_path(path)
+        return self.config.remote + path
+
+    def record_copy(self, path):
+        if self.statistics:
+            self.statistics.add("copied_files")
+            self.statistics.add("copied_bytes", os.path.getsize(self.local_path(path)))
+
+    def local_path(self, path):
+        local = self.apply_mapping(path)
+        if local == path:
             local = self.config.local + local
-        remote = self.config.remote + remote
+        return local
+
+    def upload(self, path, retry=0, direct=False):
+        local = self.local_path(path)
+        remote = self.config.remote + path
 
+        staged = False
         if os.path.isdir(local):
             self.ftp.create_directory(remote)
         elif os.path.isfile(local):
             self.size = os.path.getsize(local)
+            self.written = 0
             if self.size > (1024 * 1024):
                 self.percent = 0
                 self.next_percent_update = 0
                 callback = self.upload_progress
+            elif self.throttle:
+                callback = self.throttle.consume
             else:
                 callback = None
-            self.ftp.upload_file(local, remote, callback)
+
+            if self.staging and not direct:
+                remote = self.staging.staged_path(path)
+                staged = True
+
+            # partially written segmented upload has gaps so it's never resumed, it's uploaded again
+            if self.upload_segmented(path, local, remote, callback):
+                self.record_transfer(self.size)
+            elif retry == 0 or not self.resume(path, local, remote, callback):
+                self.ftp.upload_file(local, remote, callback)
+                self.record_transfer(self.size)
         else:
             raise Exception(local + " doesn't exist!")
 
-    def upload_progress(self, block):
-        self.written += len(block)
+        return staged
+
+    def upload_segmented(self, path, local, remote, callback):
+        threshold = self.config.segment_threshold
+        if not threshold or self.size < threshold or not self.ftp.segmented_upload_supported():
+            return False
+
+        # extra connections are opened only for this file, idle connections would time out between big files
+        connections = []
+        try:
+            for number in range(self.config.segments - 1):
+                ftp = create_transport(self.config)
+                connections.append(ftp)
+                ftp.connect()
+        except ftplib.all_errors as e:
+            logging.warning("Failed to open connection for segmented upload, reason: " + str(e))
+            connections.pop().close()
+
+        try:
+            if len(connections) == 0:
+                return False
+
+            logging.info(self.prefix + " in " + str(len(connections) + 1) + " segments")
+            try:
+                self.ftp.upload_segmented(local, remote, connections, callback, self.index.hashes.get(path))
+            except ftplib.all_errors as e:
+                logging.warning("Segmented upload of " + path + " failed, uploading whole file, reason: " + str(e))
+                self.ftp.close()
+                self.written = 0
+                self.percent = 0
+                self.ftp.upload_file(local, remote, callback)
+        finally:
+            for ftp in connections:
+                ftp.close()
+
+        return True
+
+    def resume(self, path, local, remote, callback):
+        threshold = self.config.resume_threshold
+        if not threshold or self.size < threshold:
+            return False
+
+        offset = self.ftp.size(remote)
+        if not offset or offset >= self.size:
+            return False
+
+        logging.info(self.prefix + " resuming from " + format_size(offset))
+        self.written = offset
+        try:
+            self.ftp.resume_file(local, remote, offset, callback)
+        except ftplib.error_perm as e:
+            logging.warning("Resuming upload of " + path + " failed, uploading whole file, reason: " + str(e))
+            self.written = 0
+            return False
+
+        if self.statistics:
+            self.statistics.add("resumed_files")
+            self.statistics.add("resumed_bytes", offset)
+        self.record_transfer(self.size - offset)
+
+        return True
+
+    def record_transfer(self, size):
+        if self.statistics:
+            self.statistics.add("content_bytes", size)
+            self.statistics.add("wire_bytes", self.ftp.wire_bytes)
+
+    def upload_progress(self, length):
+        if self.throttle:
+            self.throttle.consume(length)
+
+        self.written += length
         percent = int(round((float(self.written) / float(self.size)) * 100))
 
         if self.percent != percent:
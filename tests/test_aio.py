@@ -0,0 +1,48 @@
+import asyncio
+import ftplib
+import queue
+import unittest
+
+from deployment.aio import AsyncEngine
+from deployment.config import Config
+from deployment.counter import Counter
+
+
+class AsyncEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.config = Config()
+        self.config.host = "aio-test"
+        self.config.threads = 3
+        self.config.retry_count = 2
+        self.config.retry_delay = 0.05
+        self.config.circuit_breaker_threshold = 0
+
+        counter = Counter()
+        counter.total = 3
+        self.failed = queue.Queue()
+        self.engine = AsyncEngine(self.config, counter, None, self.failed, {})
+        self.attempts = []
+
+    async def process(self, ftp, path, retry, mode):
+        self.attempts.append((path, retry))
+        await asyncio.sleep(0.01)
+        if path == "/retried" and retry == 0:
+            raise ftplib.error_temp("421 Try again later")
+        if path == "/rejected":
+            raise ftplib.error_perm("550 Permission denied")
+
+    def test_retried_item_is_processed_after_queue_was_emptied(self):
+        self.engine.process = self.process
+        items = queue.Queue()
+        for path in ["/retried", "/rejected", "/uploaded"]:
+            items.put(path)
+
+        self.engine.process_queue(items, AsyncEngine.MODE_UPLOAD)
+
+        self.assertEqual(sorted(self.attempts), [("/rejected", 0), ("/retried", 0), ("/retried", 1), ("/uploaded", 0)])
+        self.assertEqual(self.failed.get_nowait(), "upload /rejected (550 Permission denied)")
+        self.assertTrue(self.failed.empty())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from deployment.compression import is_compressible
+
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def file(self, name, contents):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as file:
+            file.write(contents)
+        return path
+
+    def test_small_file(self):
+        self.assertFalse(is_compressible(self.file("index.php", b"<?php " * 10)))
+
+    def test_by_extension(self):
+        random = os.urandom(4096)
+        self.assertTrue(is_compressible(self.file("App.JS", random)))
+        self.assertFalse(is_compressible(self.file("logo.png", b"a" * 4096)))
+
+    def test_dotfile_by_name(self):
+        self.assertTrue(is_compressible(self.file(".htaccess", os.urandom(4096))))
+
+    def test_unknown_type_by_sample(self):
+        self.assertTrue(is_compressible(self.file("data.bin", b"repeated contents " * 1000)))
+        self.assertFalse(is_compressible(self.file("random.bin", os.urandom(4096))))
+        self.assertFalse(is_compressible(self.file("README", os.urandom(4096))))
+
+
+if __name__ == "__main__":
+    unittest.main()
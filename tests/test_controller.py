@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from deployment.config import Config
+from deployment.controller import Controller
+from deployment.hosts import HostCache
+from deployment.statistics import Statistics
+
+
+class ControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = 1000.0
+        patchers = [
+            mock.patch.object(HostCache, "file_path", os.path.join(self.directory, "hosts.json")),
+            mock.patch("deployment.controller.time", lambda: self.now),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.config = Config()
+        self.config.host = "example.com"
+        self.config.user = "user"
+        self.config.threads = 8
+        self.config.adaptive_floor = 2
+        self.statistics = Statistics()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def controller(self):
+        controller = Controller(self.config, self.statistics)
+        controller.start()
+        return controller
+
+    def interval(self, controller, objects):
+        self.now += Controller.INTERVAL
+        self.statistics.add("completed", objects)
+        controller.update()
+
+    def test_increases_while_throughput_improves(self):
+        controller = self.controller()
+        self.assertEqual(controller.active, 2)
+        self.assertTrue(controller.allowed(1))
+        self.assertFalse(controller.allowed(2))
+
+        self.interval(controller, 10)
+        self.assertEqual(controller.active, 3)
+        self.interval(controller, 20)
+        self.assertEqual(controller.active, 4)
+        self.interval(controller, 20)
+        self.assertEqual(controller.active, 4)
+        self.assertEqual(self.statistics.get("controller_peak"), 4)
+
+    def test_update_waits_for_interval(self):
+        controller = self.controller()
+        self.now += 1
+        self.statistics.add("completed", 10)
+        controller.update()
+        self.assertEqual(controller.active, 2)
+
+    def test_timeout_halves_connections_once(self):
+        self.config.adaptive_floor = 8
+        controller = self.controller()
+
+        controller.backoff("timed out")
+        controller.backoff("timed out")
+        self.assertEqual(controller.active, 4)
+        self.assertEqual(controller.maximum, 8)
+        self.assertIsNone(HostCache(self.config).get("connection_limit"))
+
+    def test_connection_limit_is_learned(self):
+        self.config.adaptive_floor = 8
+        controller = self.controller()
+
+        controller.backoff("421 There are too many connections from your internet address.")
+        self.assertEqual(controller.active, 4)
+        self.assertEqual(controller.maximum, 7)
+        self.assertEqual(HostCache(self.config).get("connection_limit"), 7)
+
+        self.now += Controller.INTERVAL
+        controller.backoff("421 Sorry, 3 user connections allowed at a time")
+        self.assertEqual(controller.active, 2)
+        self.assertEqual(controller.maximum, 3)
+        self.assertEqual(HostCache(self.config).get("connection_limit"), 3)
+
+    def test_learned_limit_is_probed_upwards(self):
+        HostCache(self.config).set("connection_limit", 2)
+        controller = self.controller()
+        self.assertEqual(controller.maximum, 2)
+
+        self.interval(controller, 10)
+        self.assertEqual((controller.active, controller.maximum), (3, 3))
+        self.interval(controller, 20)
+        self.assertEqual(HostCache(self.config).get("connection_limit"), 3)
+        self.assertEqual((controller.active, controller.maximum), (4, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
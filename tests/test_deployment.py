@@ -0,0 +1,112 @@
+import bz2
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from deployment.config import Config
+from deployment.deployment import Deployment
+from deployment.index import Index
+
+
+class DeploymentTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local = os.path.join(self.directory, "local")
+        self.remote = os.path.join(self.directory, "remote")
+        os.makedirs(os.path.join(self.local, "assets"))
+        os.makedirs(self.remote)
+
+        self.write(self.local + "/index.html", "index")
+        self.write(self.local + "/assets/app.js", "app")
+
+        self.config_path = os.path.join(self.directory, ".ftp-test.json")
+        with open(self.config_path, "w") as file:
+            json.dump({
+                "local": self.local,
+                "connection": {"protocol": "file", "root": self.remote, "threads": 2},
+            }, file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, path, contents):
+        with open(path, "w") as file:
+            file.write(contents)
+
+    def read(self, path):
+        with open(path, "r") as file:
+            return file.read()
+
+    def deploy(self, purge_only=False):
+        config = Config()
+        config.parse(self.config_path)
+
+        deployment = Deployment(config)
+        try:
+            deployment.synchronize(True, False, purge_only, False, False)
+        finally:
+            deployment.close()
+
+        self.assertTrue(deployment.failed.empty())
+        return deployment
+
+    def invalidate(self, path):
+        # later line of index wins, like when verification invalidates file during deploy
+        index_path = self.remote + Index.FILE_NAME
+        with open(index_path, "rb") as file:
+            contents = bz2.decompress(file.read())
+        with open(index_path, "wb") as file:
+            file.write(bz2.compress(contents + ("%s %s\n" % (Index.INVALID, path)).encode("utf-8")))
+
+    def test_invalidated_file_is_uploaded_again(self):
+        self.deploy()
+        self.write(self.remote + "/assets/app.js", "stale")
+        self.invalidate("/assets/app.js")
+
+        deployment = self.deploy()
+
+        self.assertEqual(deployment.changes, {"upload": 1, "remove": 0})
+        self.assertEqual(self.read(self.remote + "/assets/app.js"), "app")
+        self.assertEqual(self.read(self.remote + "/index.html"), "index")
+
+    def test_file_replaced_by_directory(self):
+        self.deploy()
+        os.remove(self.local + "/index.html")
+        os.makedirs(self.local + "/index.html")
+        self.write(self.local + "/index.html/page.html", "page")
+
+        deployment = self.deploy()
+
+        self.assertEqual(deployment.changes, {"upload": 2, "remove": 1})
+        self.assertEqual(self.read(self.remote + "/index.html/page.html"), "page")
+
+    def test_purge_leaves_trash_accessible_only_to_owner(self):
+        with open(self.config_path, "r") as file:
+            data = json.load(file)
+        data["purge"] = ["/temp/cache"]
+        data["purge_mode"] = "deferred"
+        with open(self.config_path, "w") as file:
+            json.dump(data, file)
+
+        os.makedirs(self.remote + "/temp/cache/latte")
+        self.write(self.remote + "/temp/cache/latte/page.php", "cache")
+        os.chmod(self.remote + "/temp/cache", 0o755)
+
+        self.deploy(True)
+
+        self.assertEqual(os.listdir(self.remote + "/temp/cache"), [])
+        self.assertEqual(os.stat(self.remote + "/temp/cache").st_mode & 0o777, 0o777 & ~self.umask())
+        trash = [name for name in os.listdir(self.remote + "/temp") if name != "cache"]
+        self.assertEqual(len(trash), 1)
+        self.assertEqual(os.stat(self.remote + "/temp/" + trash[0]).st_mode & 0o777, 0o700)
+
+    def umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        return umask
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from deployment.config import Config
+from deployment.fanout import share_connections
+
+
+class ShareConnectionsTest(unittest.TestCase):
+    def config(self, threads, purge_threads=None):
+        config = Config()
+        config.threads = threads
+        config.purge_threads = purge_threads
+        config.adaptive_floor = 4
+        return config
+
+    def test_without_limit(self):
+        configs = [self.config(8), self.config(4)]
+        share_connections(configs, None)
+        self.assertEqual([config.threads for config in configs], [8, 4])
+
+    def test_limit_which_isnt_reached(self):
+        configs = [self.config(8), self.config(4)]
+        share_connections(configs, 12)
+        self.assertEqual([config.threads for config in configs], [8, 4])
+
+    def test_split_in_proportion_to_threads(self):
+        configs = [self.config(8, 10), self.config(4, 2), self.config(1)]
+        share_connections(configs, 6)
+
+        self.assertEqual([config.threads for config in configs], [3, 1, 1])
+        self.assertEqual([config.purge_threads for config in configs], [3, 1, None])
+        self.assertEqual([config.adaptive_floor for config in configs], [3, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
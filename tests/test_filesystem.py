@@ -0,0 +1,124 @@
+import errno
+import ftplib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from deployment.config import Config
+from deployment.filesystem import Filesystem
+from deployment.ftp import InvalidStateException
+
+
+def unsupported(*args):
+    raise OSError(errno.ENOSYS, "Function not implemented")
+
+
+class FilesystemTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = Config()
+        config.buffer_size = 1000
+        self.filesystem = Filesystem(config)
+
+        self.source = os.path.join(self.directory, "source.bin")
+        self.contents = os.urandom(4500)
+        with open(self.source, "wb") as file:
+            file.write(self.contents)
+
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def counted(self, name, function):
+        def wrapper(*args):
+            self.calls.append(name)
+            return function(*args)
+
+        return wrapper
+
+    def upload(self):
+        transferred = []
+        target = os.path.join(self.directory, "remote", "target.bin")
+        self.filesystem.upload_file(self.source, target, transferred.append)
+
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), self.contents)
+        self.assertEqual(sum(transferred), len(self.contents))
+        self.assertEqual(self.filesystem.wire_bytes, len(self.contents))
+
+    @unittest.skipUnless(hasattr(os, "copy_file_range"), "copy_file_range isn't available")
+    def test_copy_file_range(self):
+        with mock.patch("os.copy_file_range", self.counted("copy_file_range", os.copy_file_range)):
+            self.upload()
+        self.assertEqual(self.calls, ["copy_file_range"] * 5)
+
+    @unittest.skipUnless(hasattr(os, "sendfile"), "sendfile isn't available")
+    def test_sendfile_when_copy_file_range_is_unsupported(self):
+        with mock.patch("os.copy_file_range", unsupported, create=True), \
+                mock.patch("os.sendfile", self.counted("sendfile", os.sendfile)):
+            self.upload()
+        self.assertEqual(self.calls, ["sendfile"] * 5)
+
+    def test_buffered_copy_when_kernel_copies_are_unsupported(self):
+        with mock.patch("os.copy_file_range", unsupported, create=True), \
+                mock.patch("os.sendfile", unsupported, create=True):
+            self.upload()
+
+    def test_buffered_copy_without_kernel_copies(self):
+        self.filesystem.copy_file_range = False
+        self.filesystem.sendfile = False
+        with mock.patch("os.copy_file_range", self.counted("copy_file_range", None), create=True), \
+                mock.patch("os.sendfile", self.counted("sendfile", None), create=True):
+            self.upload()
+        self.assertEqual(self.calls, [])
+
+    def test_other_copy_error_is_raised(self):
+        def failing(*args):
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        with mock.patch("os.copy_file_range", failing, create=True):
+            self.filesystem.copy_file_range = True
+            with self.assertRaises(ftplib.error_perm) as context:
+                self.filesystem.upload_file(self.source, os.path.join(self.directory, "target.bin"), None)
+        self.assertTrue(str(context.exception).startswith("552"))
+
+    def test_resume(self):
+        target = os.path.join(self.directory, "target.bin")
+        with open(target, "wb") as file:
+            file.write(self.contents[:2000] + b"garbage")
+
+        self.filesystem.resume_file(self.source, target, 2000, None)
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), self.contents)
+        self.assertEqual(self.filesystem.wire_bytes, 2500)
+
+    def test_delete_tree(self):
+        tree = os.path.join(self.directory, "tree")
+        os.makedirs(os.path.join(tree, "a", "b"))
+        os.makedirs(os.path.join(tree, "c"))
+        for path in ["file", "a/file", "a/b/file", "a/b/other"]:
+            open(os.path.join(tree, path), "w").close()
+        os.symlink(os.path.join(self.directory, "source.bin"), os.path.join(tree, "c", "link"))
+
+        self.assertEqual(self.filesystem.delete_tree(tree), (4, 5))
+        self.assertFalse(os.path.exists(tree))
+        self.assertTrue(os.path.exists(self.source))
+
+    def test_delete_tree_of_missing_directory(self):
+        self.assertEqual(self.filesystem.delete_tree(os.path.join(self.directory, "missing")), (0, 0))
+
+    def test_delete_tree_errors(self):
+        with self.assertRaises(InvalidStateException):
+            self.filesystem.delete_tree(self.directory + "/tree/../source.bin")
+
+        with self.assertRaises(ftplib.error_perm) as context:
+            self.filesystem.delete_tree(self.source)
+        self.assertTrue(str(context.exception).startswith("550"))
+        self.assertTrue(os.path.exists(self.source))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from deployment.config import Config
+from deployment.hosts import HostCache
+
+
+def update(file_path, user, count):
+    HostCache.file_path = file_path
+    config = Config()
+    config.user = user
+    config.host = "example.com"
+    cache = HostCache(config)
+    for number in range(count):
+        cache.set("value %s" % number, number)
+
+
+class HostCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original = HostCache.file_path
+        HostCache.file_path = os.path.join(self.directory, "hosts", "hosts.json")
+
+    def tearDown(self):
+        HostCache.file_path = self.original
+        shutil.rmtree(self.directory)
+
+    def test_set_and_get(self):
+        config = Config()
+        config.user = "user"
+        config.host = "example.com"
+        cache = HostCache(config)
+        self.assertEqual(cache.get("connection_limit", 4), 4)
+
+        cache.set("connection_limit", 8)
+        self.assertEqual(cache.get("connection_limit"), 8)
+        # temporary file replaced the cache
+        self.assertEqual(sorted(os.listdir(os.path.dirname(HostCache.file_path))), ["hosts.json", "hosts.json.lock"])
+
+    def test_concurrent_processes_keep_changes_of_each_other(self):
+        processes = [
+            multiprocessing.Process(target=update, args=(HostCache.file_path, "user%s" % number, 20))
+            for number in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        with open(HostCache.file_path) as file:
+            data = json.load(file)
+        self.assertEqual(len(data), 4)
+        for values in data.values():
+            self.assertEqual(len(values), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from deployment.partial import PartialPurge
+
+
+class PartialPurgeTest(unittest.TestCase):
+    def test_extension(self):
+        partial = PartialPurge({"latte": "app/temp/cache/latte", "neon": ["/app/temp/cache/Nette.Configurator"]})
+        partial.add("/app/Presenters/templates/Homepage/default.latte")
+        partial.add("/www/index.php")
+
+        self.assertEqual(partial.changes, 2)
+        self.assertEqual(partial.targets, ["/app/temp/cache/latte"])
+
+    def test_pattern_matches_like_ignored_paths(self):
+        partial = PartialPurge({"/app/Modules/Admin/*.latte": "/app/temp/cache/latte/Admin*"})
+        partial.add("/app/Modules/Front/templates/default.latte")
+        self.assertEqual(partial.targets, [])
+
+        partial.add("/app/Modules/Admin/templates/Users/DEFAULT.LATTE")
+        self.assertEqual(partial.targets, ["/app/temp/cache/latte/Admin*"])
+
+    def test_directory_prefix(self):
+        partial = PartialPurge({"app/config": "/app/temp/cache/Nette.Configurator"})
+        partial.add("/www/index.php")
+        self.assertEqual(partial.targets, [])
+
+        partial.add("/app/config/local.neon")
+        self.assertEqual(partial.targets, ["/app/temp/cache/Nette.Configurator"])
+
+    def test_rules_stay_active_for_all_changes(self):
+        partial = PartialPurge({
+            "/app/*.latte": ["/app/temp/cache/latte"],
+            "/app/Modules/Admin/*": ["/app/temp/cache/latte", "/app/temp/cache/admin"],
+        })
+        partial.add("/app/Modules/Front/default.latte")
+        partial.add("/app/Modules/Admin/default.latte")
+
+        self.assertEqual(partial.targets, ["/app/temp/cache/latte", "/app/temp/cache/admin"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Event
+
+from deployment.config import Config
+from deployment.pool import ConnectionPool, server_key
+
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = Config()
+        self.config.protocol = "file"
+        self.config.remote = self.directory
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keep_alive_checks_one_connection_at_a_time(self):
+        pool = ConnectionPool(self.config)
+        pool.KEEPALIVE = 0.01
+        pool.start(2)
+        first, second = pool.acquire(), pool.acquire()
+
+        # first connection answers slowly, the other one stays available
+        checking, answer = Event(), Event()
+
+        def noop():
+            checking.set()
+            answer.wait(5)
+
+        first.noop = noop
+        pool.release(first)
+        pool.release(second)
+        try:
+            self.assertTrue(checking.wait(5))
+            start = time.time()
+            self.assertIs(pool.acquire(), second)
+            self.assertLess(time.time() - start, 1)
+        finally:
+            answer.set()
+            pool.close()
+
+    def test_server_key_leaves_out_password(self):
+        other = Config()
+        other.protocol = "file"
+        other.remote = self.directory
+        self.config.password = "first"
+        other.password = "second"
+        self.assertEqual(server_key(self.config), server_key(other))
+        self.assertNotIn("first", server_key(self.config))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from deployment.exclusion import Exclusion
+from deployment.removal import RemovalPlan
+
+
+class RemovalPlanTest(unittest.TestCase):
+    def setUp(self):
+        # None marks directory in index
+        self.contents = {
+            "/app": None,
+            "/app/index.php": "",
+            "/app/cache": None,
+            "/app/cache/a": None,
+            "/app/cache/a/file": "",
+            "/app/cache/b.txt": "",
+            "/www": None,
+            "/www/kept.php": "",
+            "/www/old": None,
+            "/www/old/page.html": "",
+        }
+        self.exclusion = Exclusion(["/local"], [], {})
+
+    def test_levels_without_trees(self):
+        to_delete = ["/app", "/app/cache", "/app/cache/a", "/app/cache/a/file", "/app/cache/b.txt", "/app/index.php"]
+        plan = RemovalPlan(to_delete, self.contents)
+
+        self.assertEqual(plan.levels(), [
+            (False, ["/app/index.php", "/app/cache/b.txt", "/app/cache/a/file"]),
+            (True, ["/app/cache/a"]),
+            (True, ["/app/cache"]),
+            (True, ["/app"]),
+        ])
+
+    def test_collapse_to_topmost_directories(self):
+        to_delete = ["/app/cache", "/app/cache/a", "/app/cache/a/file", "/app/cache/b.txt", "/www/old",
+                     "/www/old/page.html"]
+        plan = RemovalPlan(to_delete, self.contents)
+
+        self.assertEqual(plan.collapse(self.exclusion), ["/app/cache", "/www/old"])
+        self.assertEqual(plan.collapsed(), 6)
+        self.assertEqual(plan.levels(), [])
+
+    def test_directory_with_kept_object_is_not_collapsed(self):
+        to_delete = ["/www", "/www/old", "/www/old/page.html"]
+        plan = RemovalPlan(to_delete, self.contents)
+
+        self.assertEqual(plan.collapse(self.exclusion), ["/www/old"])
+        self.assertEqual(plan.levels(), [(True, ["/www"])])
+
+    def test_directory_with_ignored_path_inside_is_not_collapsed(self):
+        to_delete = ["/www/old", "/www/old/page.html"]
+        plan = RemovalPlan(to_delete, self.contents)
+
+        self.assertEqual(plan.collapse(Exclusion(["/local"], ["/www/old/uploads"], {})), [])
+        self.assertEqual(plan.levels(), [(False, ["/www/old/page.html"]), (True, ["/www/old"])])
+
+    def test_rejected_tree_is_tried_by_subdirectories(self):
+        to_delete = ["/app/cache", "/app/cache/a", "/app/cache/a/file", "/app/cache/b.txt"]
+        plan = RemovalPlan(to_delete, self.contents)
+
+        self.assertEqual(plan.collapse(self.exclusion, lambda path: path != "/app/cache"), ["/app/cache/a"])
+        self.assertEqual(plan.collapsed(), 2)
+        self.assertEqual(plan.levels(), [(False, ["/app/cache/b.txt"]), (True, ["/app/cache"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
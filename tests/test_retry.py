@@ -0,0 +1,118 @@
+import ftplib
+import socket
+import unittest
+from unittest import mock
+
+from deployment.config import Config
+from deployment.retry import CircuitBreaker, RetryPolicy
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.config = Config()
+        self.config.host = "retry-test"
+        self.policy = RetryPolicy(self.config)
+
+    def test_classify(self):
+        self.assertEqual(self.policy.classify(ftplib.error_temp("421 Too many connections (8) from this IP")),
+                         RetryPolicy.ERROR_CONNECTION_LIMIT)
+        self.assertEqual(self.policy.classify(ftplib.error_perm("552 Disk full")), RetryPolicy.ERROR_QUOTA)
+        self.assertEqual(self.policy.classify(ftplib.error_temp("452 Insufficient storage")), RetryPolicy.ERROR_QUOTA)
+        self.assertEqual(self.policy.classify(ftplib.error_perm("553 Could not create file.")),
+                         RetryPolicy.ERROR_MISSING_PARENT)
+        self.assertEqual(self.policy.classify(ftplib.error_perm("530 Login incorrect.")),
+                         RetryPolicy.ERROR_PERMISSION)
+        self.assertEqual(self.policy.classify(ftplib.error_perm("550 Permission denied.")),
+                         RetryPolicy.ERROR_PERMISSION)
+        self.assertEqual(self.policy.classify(ftplib.error_perm("501 Syntax error")), RetryPolicy.ERROR_OTHER)
+        self.assertEqual(self.policy.classify(ftplib.error_temp("421 Timeout")), RetryPolicy.ERROR_TRANSIENT)
+        self.assertEqual(self.policy.classify(socket.timeout("timed out")), RetryPolicy.ERROR_TRANSIENT)
+
+    def test_retryable(self):
+        self.config.retry_count = 2
+        self.assertTrue(self.policy.retryable(ftplib.error_temp("421 Timeout"), 1))
+        self.assertFalse(self.policy.retryable(ftplib.error_temp("421 Timeout"), 2))
+        self.assertFalse(self.policy.retryable(ftplib.error_perm("530 Login incorrect."), 0))
+        self.assertFalse(self.policy.retryable(ftplib.error_perm("552 Disk full"), 0))
+        self.assertTrue(self.policy.retryable(ftplib.error_perm("553 Could not create file."), 0))
+
+    def test_delay(self):
+        self.config.retry_delay = 1
+        self.config.retry_delay_max = 4
+        self.config.connection_limit_wait = 10
+        self.assertEqual(self.policy.delay(ftplib.error_perm("553 Could not create file."), 3), 0)
+        for retry in range(5):
+            delay = self.policy.delay(ftplib.error_temp("421 Timeout"), retry)
+            self.assertLessEqual(delay, min(4, 2 ** retry))
+            self.assertGreaterEqual(delay, min(4, 2 ** retry) / 2)
+        self.assertGreaterEqual(self.policy.delay(ftplib.error_temp("421 Too many users"), 0), 10)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("deployment.retry.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", 3, 10)
+
+    def fail(self, count):
+        for number in range(count):
+            self.breaker.record(False, self.breaker.allowed())
+
+    def test_opens_after_threshold_of_failures(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_OPEN)
+        self.assertIsNone(self.breaker.allowed())
+
+    def test_successes_keep_breaker_closed(self):
+        for number in range(10):
+            self.breaker.record(True, self.breaker.allowed())
+        self.fail(4)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_CLOSED)
+
+    def test_probe_closes_breaker(self):
+        self.fail(3)
+        self.now += 10
+        probe = self.breaker.allowed()
+        self.assertIsNotNone(probe)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_HALF_OPEN)
+        self.assertIsNone(self.breaker.allowed())
+
+        self.breaker.record(True, probe)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_CLOSED)
+
+    def test_failed_probe_opens_breaker_again(self):
+        self.fail(3)
+        self.now += 10
+        self.breaker.record(False, self.breaker.allowed())
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_OPEN)
+        self.assertIsNone(self.breaker.allowed())
+
+    def test_outcome_of_request_started_before_opening_is_ignored(self):
+        started = self.breaker.allowed()
+        self.fail(3)
+        self.now += 10
+        self.breaker.allowed()
+
+        self.breaker.record(True, started)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_HALF_OPEN)
+
+    def test_outcome_of_replaced_probe_is_ignored(self):
+        self.fail(3)
+        self.now += 10
+        first = self.breaker.allowed()
+        self.now += 10
+        second = self.breaker.allowed()
+        self.assertNotEqual(first, second)
+
+        self.breaker.record(True, first)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_HALF_OPEN)
+        self.breaker.record(False, second)
+        self.assertEqual(self.breaker.state, CircuitBreaker.STATE_OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import queue
+import unittest
+
+from deployment.schedule import Schedule
+
+
+class ScheduleTest(unittest.TestCase):
+    def take(self, schedule):
+        items = []
+        while True:
+            try:
+                items.append(schedule.get_nowait())
+            except queue.Empty:
+                return items
+
+    def paths(self, items):
+        return [(item["mode"], item["path"]) for item in items]
+
+    def finish(self, schedule, items):
+        for item in items:
+            schedule.finished(item["path"], item["mode"] != "upload")
+            schedule.task_done()
+
+    def test_levels_are_queued_one_after_another(self):
+        levels = [(False, ["/a/file", "/b/file"]), (True, ["/a/sub"]), (True, ["/a", "/b"])]
+        schedule = Schedule(["/new.txt"], levels, set(), "upload", "remove", "remove directory")
+
+        first = self.take(schedule)
+        self.assertEqual(self.paths(first), [("remove", "/a/file"), ("remove", "/b/file"), ("upload", "/new.txt")])
+
+        self.finish(schedule, first[:1])
+        self.assertEqual(self.take(schedule), [])
+        self.finish(schedule, first[1:])
+        second = self.take(schedule)
+        self.assertEqual(self.paths(second), [("remove directory", "/a/sub")])
+
+        self.finish(schedule, second)
+        third = self.take(schedule)
+        self.assertEqual(self.paths(third), [("remove directory", "/a"), ("remove directory", "/b")])
+
+        self.finish(schedule, third)
+        self.assertEqual(self.take(schedule), [])
+        self.assertEqual(schedule.unfinished_tasks, 0)
+
+    def test_upload_waits_for_removal_of_other_type(self):
+        # /a was file and becomes directory, /b was directory and becomes file
+        levels = [(False, ["/a"]), (True, ["/b/old"]), (True, ["/b"])]
+        schedule = Schedule(["/a/index.html", "/b", "/c"], levels, {"/a", "/b"}, "upload", "remove",
+                            "remove directory")
+
+        first = self.take(schedule)
+        self.assertEqual(self.paths(first), [("remove", "/a"), ("upload", "/c")])
+
+        self.finish(schedule, first)
+        second = self.take(schedule)
+        self.assertEqual(self.paths(second), [("upload", "/a/index.html"), ("remove directory", "/b/old")])
+
+        self.finish(schedule, second)
+        third = self.take(schedule)
+        self.assertEqual(self.paths(third), [("remove directory", "/b")])
+
+        # queue doesn't look empty between removal and upload which waited for it
+        schedule.finished("/b", True)
+        self.assertEqual(schedule.unfinished_tasks, 2)
+        schedule.task_done()
+        self.assertEqual(self.paths(self.take(schedule)), [("upload", "/b")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,349 @@
+import ftplib
+import os
+import shlex
+import shutil
+import socket
+import tempfile
+from threading import Thread
+import unittest
+from unittest import mock
+
+import paramiko
+
+from deployment import sftp
+from deployment.config import Config
+from deployment.exceptions import MessageException
+from deployment.hosts import HostCache
+from deployment.sftp import Sftp
+
+
+class Server(paramiko.ServerInterface):
+    # accepts user "user" with password "password", commands run over exec channel are limited to rm
+    def __init__(self, test):
+        self.test = test
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == ("user", "password"):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        if not self.test.shell:
+            return False
+        Thread(target=self.execute, args=(channel, command.decode("utf-8")), daemon=True).start()
+        return True
+
+    def execute(self, channel, command):
+        self.test.commands.append(command)
+        arguments = shlex.split(command)
+        path = self.test.root + arguments[-1]
+        status = 1
+        if arguments[0] == "rm" and os.path.isdir(path):
+            shutil.rmtree(path)
+            status = 0
+        elif arguments[0] == "rm" and "-rf" in arguments:
+            status = 0
+        channel.send_exit_status(status)
+        channel.close()
+
+
+class Handle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class Filesystem(paramiko.SFTPServerInterface):
+    # SFTP root is mapped to temporary directory of test
+    root = None
+
+    def path(self, path):
+        return self.root + self.canonicalize(path)
+
+    def list_folder(self, path):
+        try:
+            entries = []
+            for name in os.listdir(self.path(path)):
+                attributes = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(self.path(path), name)))
+                attributes.filename = name
+                entries.append(attributes)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            descriptor = os.open(self.path(path), flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "wb"
+        elif flags & os.O_RDWR:
+            mode = "r+b"
+        else:
+            mode = "rb"
+        handle = Handle(flags)
+        handle.readfile = handle.writefile = os.fdopen(descriptor, mode)
+        return handle
+
+    def remove(self, path):
+        return self.call(os.remove, self.path(path))
+
+    def rename(self, current, new):
+        # plain SFTP rename refuses existing target like OpenSSH does
+        if os.path.exists(self.path(new)):
+            return paramiko.SFTP_FAILURE
+        return self.call(os.rename, self.path(current), self.path(new))
+
+    def posix_rename(self, current, new):
+        return self.call(os.rename, self.path(current), self.path(new))
+
+    def mkdir(self, path, attr):
+        if os.path.exists(self.path(path)):
+            return paramiko.SFTP_FAILURE
+        return self.call(os.mkdir, self.path(path))
+
+    def rmdir(self, path):
+        if os.path.isdir(self.path(path)) and os.listdir(self.path(path)):
+            return paramiko.SFTP_FAILURE
+        return self.call(os.rmdir, self.path(path))
+
+    def chattr(self, path, attr):
+        if attr.st_mode is not None:
+            return self.call(os.chmod, self.path(path), attr.st_mode)
+        return paramiko.SFTP_OK
+
+    def call(self, function, *arguments):
+        try:
+            function(*arguments)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class SftpTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.key = paramiko.RSAKey.generate(1024)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, "root")
+        self.home = os.path.join(self.directory, "home")
+        os.makedirs(self.root + "/site")
+        os.makedirs(self.home)
+        self.shell = True
+        self.commands = []
+        self.transports = []
+
+        patchers = [
+            mock.patch.dict(os.environ, {"HOME": self.home}),
+            mock.patch.object(HostCache, "file_path", os.path.join(self.home, "hosts.json")),
+            mock.patch.object(Filesystem, "root", self.root),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(10)
+        Thread(target=self.serve, daemon=True).start()
+
+        self.config = Config()
+        self.config.protocol = "sftp"
+        self.config.host = "127.0.0.1"
+        self.config.port = self.listener.getsockname()[1]
+        self.config.user = "user"
+        self.config.password = "password"
+        self.config.remote = "/site"
+        self.config.timeout = 5
+        self.config.sftp_accept_new_host = True
+
+        self.local = os.path.join(self.directory, "local.txt")
+        with open(self.local, "w") as file:
+            file.write("contents")
+
+    def tearDown(self):
+        self.listener.close()
+        with sftp.transports_lock:
+            for entry in sftp.transports.pop((self.config.user, self.config.host, self.config.port), []):
+                entry["transport"].close()
+        with sftp.delete_lock:
+            sftp.delete_hosts.clear()
+        for transport in self.transports:
+            transport.close()
+        shutil.rmtree(self.directory)
+
+    def serve(self):
+        while True:
+            try:
+                connection, address = self.listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(self.key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, Filesystem)
+            transport.start_server(server=Server(self))
+            self.transports.append(transport)
+
+    def connect(self):
+        ftp = Sftp(self.config)
+        ftp.connect()
+        self.addCleanup(ftp.close)
+        return ftp
+
+    def read(self, path):
+        with open(self.root + path, "r") as file:
+            return file.read()
+
+    def test_upload_creates_missing_directories(self):
+        ftp = self.connect()
+        transferred = []
+        ftp.upload_file(self.local, "/site/a/b/file.txt", transferred.append)
+
+        self.assertEqual(self.read("/site/a/b/file.txt"), "contents")
+        self.assertEqual(sum(transferred), 8)
+        self.assertEqual(ftp.wire_bytes, 8)
+        self.assertEqual(ftp.size("/site/a/b/file.txt"), 8)
+        self.assertEqual(ftp.list_directory_details("/site/a")[0][:3], ("b", "dir", ftp.size("/site/a/b")))
+
+    def test_remove(self):
+        ftp = self.connect()
+        ftp.upload_file(self.local, "/site/a/file.txt", None)
+
+        errors = ftp.delete_files(["/site/a/file.txt", "/site/a/missing.txt"])
+        self.assertIsNone(errors[0])
+        self.assertTrue(str(errors[1]).startswith("550 No such file"))
+        self.assertFalse(os.path.exists(self.root + "/site/a/file.txt"))
+        ftp.delete_directory("/site/a")
+        self.assertFalse(os.path.exists(self.root + "/site/a"))
+        ftp.delete_directory("/site/a", True)
+
+        with self.assertRaises(ftplib.error_perm):
+            ftp.delete_directory("/site/a")
+
+    def test_remove_not_empty_directory(self):
+        ftp = self.connect()
+        ftp.upload_file(self.local, "/site/a/file.txt", None)
+
+        with self.assertRaises(ftplib.error_perm):
+            ftp.delete_directory("/site/a", True)
+        self.assertTrue(os.path.exists(self.root + "/site/a/file.txt"))
+
+    def test_rename_and_replace(self):
+        ftp = self.connect()
+        ftp.upload_file(self.local, "/site/file.txt", None)
+        ftp.upload_file(self.local, "/site/other.txt", None)
+
+        ftp.rename("/site/file.txt", "/site/renamed.txt")
+        self.assertEqual(self.read("/site/renamed.txt"), "contents")
+        self.assertEqual(ftp.rename_files([("/site/renamed.txt", "/site/other.txt")])[0].args[0][:3], "550")
+
+        ftp.replace("/site/renamed.txt", "/site/other.txt")
+        self.assertEqual(sorted(os.listdir(self.root + "/site")), ["other.txt"])
+
+    def test_missing_path_errors(self):
+        ftp = self.connect()
+        for function, arguments in [
+            (ftp.delete_file, ["/site/missing.txt"]),
+            (ftp.rename, ["/site/missing.txt", "/site/renamed.txt"]),
+            (ftp.list_directory_contents, ["/site/missing"]),
+        ]:
+            with self.assertRaises(ftplib.error_perm) as context:
+                function(*arguments)
+            self.assertTrue(str(context.exception).startswith("550 No such file"), str(context.exception))
+
+        self.assertIsNone(ftp.size("/site/missing.txt"))
+        self.assertIsNone(ftp.download_file_bytes("/site/missing.txt"))
+
+    def test_wrong_password(self):
+        self.config.password = "wrong"
+        with self.assertRaises(ftplib.error_perm) as context:
+            Sftp(self.config).connect()
+        self.assertTrue(str(context.exception).startswith("530"))
+
+    def test_workers_share_transport_up_to_channel_limit(self):
+        self.config.sftp_channels = 2
+        connections = [self.connect() for number in range(3)]
+        entries = sftp.transports[(self.config.user, self.config.host, self.config.port)]
+        self.assertEqual([entry["channels"] for entry in entries], [2, 1])
+        self.assertIs(connections[0].entry, connections[1].entry)
+
+        connections[0].close()
+        self.assertEqual([entry["channels"] for entry in entries], [1, 1])
+        self.assertIs(self.connect().entry, entries[0])
+
+    def test_unknown_host_is_rejected(self):
+        self.config.sftp_accept_new_host = False
+        with self.assertRaises(MessageException) as context:
+            Sftp(self.config).connect()
+        self.assertIn("isn't in known_hosts", str(context.exception))
+
+    def test_new_host_is_accepted_and_remembered(self):
+        self.connect()
+        with open(os.path.join(self.home, ".ssh", "known_hosts")) as file:
+            self.assertEqual(file.read(), "[127.0.0.1]:%s ssh-rsa %s\n" % (self.config.port, self.key.get_base64()))
+
+        self.config.sftp_accept_new_host = False
+        with sftp.transports_lock:
+            sftp.transports.clear()
+        self.connect()
+
+    def test_changed_host_key_is_rejected(self):
+        os.makedirs(os.path.join(self.home, ".ssh"))
+        with open(os.path.join(self.home, ".ssh", "known_hosts"), "w") as file:
+            file.write("[127.0.0.1]:%s ssh-rsa %s\n" % (
+                self.config.port, paramiko.RSAKey.generate(1024).get_base64()
+            ))
+
+        with self.assertRaises(MessageException) as context:
+            Sftp(self.config).connect()
+        self.assertIn("doesn't match known_hosts", str(context.exception))
+
+    def test_delete_tree_with_shell(self):
+        ftp = self.connect()
+        ftp.upload_file(self.local, "/site/cache/a/file.txt", None)
+
+        self.assertTrue(ftp.delete_tree_supported())
+        self.assertTrue(self.commands[0].startswith("rm -r -- /site/.deployment-probe-"))
+        self.assertEqual(HostCache(self.config).get("delete_tree"), True)
+
+        ftp.delete_tree("/site/cache")
+        self.assertEqual(self.commands[1], "rm -rf -- /site/cache")
+        self.assertEqual(os.listdir(self.root + "/site"), [])
+
+        # exec channel is given back
+        entries = sftp.transports[(self.config.user, self.config.host, self.config.port)]
+        self.assertEqual(entries[0]["channels"], 1)
+
+    def test_delete_tree_without_shell(self):
+        self.shell = False
+        ftp = self.connect()
+
+        self.assertFalse(ftp.delete_tree_supported())
+        self.assertEqual(HostCache(self.config).get("delete_tree"), False)
+        self.assertEqual(os.listdir(self.root + "/site"), [])
+        with self.assertRaises(ftplib.error_perm):
+            ftp.delete_tree("/site/cache")
+
+
+if __name__ == "__main__":
+    unittest.main()